@@ -0,0 +1,39 @@
+import argparse
+import time
+
+import numpy as np
+
+from src.annotations import AnnotationFormat
+from src.substitutions import UNKNOWN_CODE, parse_protein_changes
+from benchmarks.synthetic import VEP_HEADER, vep_infos
+
+def best_of(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare CSQ parsing with the first-match regex")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--transcripts', type=int, default=4)
+    parser.add_argument('--coding', type=float, default=0.3, help="share of lines with a missense HGVSp")
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    infos = vep_infos(args.rows, args.transcripts, args.coding)
+    records = [('.', info) for info in infos]
+    annotation = AnnotationFormat.from_header(VEP_HEADER)
+
+    regex_s, (orig, _, new) = best_of(lambda: parse_protein_changes(infos), args.repeats)
+    regex_rows = int(((orig != UNKNOWN_CODE) & (new != UNKNOWN_CODE)).sum())
+    csq_s, expanded = best_of(lambda: annotation.expand(records), args.repeats)
+    csq_rows = len(expanded[0])
+
+    print(f"{'parser':<22} {'seconds':>8} {'lines/s':>12} {'feature rows':>13}")
+    print(f"{'regex (first match)':<22} {regex_s:8.3f} {args.rows / regex_s:12,.0f} {regex_rows:13,}")
+    print(f"{'CSQ (all consequences)':<22} {csq_s:8.3f} {args.rows / csq_s:12,.0f} {csq_rows:13,}")
+    assert csq_rows >= regex_rows
+    assert np.unique(expanded[0]).size == regex_rows, "both parsers should agree on which lines are scorable"
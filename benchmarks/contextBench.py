@@ -0,0 +1,62 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from src.geneContext import GeneContext
+from src.substitutions import AA_CODES, features_from_codes
+
+def write_table(path, genes, windows, seed=0):
+    # A genome-sized context table: every gene gets a length and some domain/hotspot windows
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        for gene in range(genes):
+            length = int(rng.integers(100, 5000))
+            f.write(f"G{gene}\t{length}\n")
+            for start in np.sort(rng.integers(1, length, windows)).tolist():
+                kind = 'hotspot' if rng.random() < 0.3 else 'domain'
+                f.write(f"G{gene}\t{length}\t{kind}\t{start}\t{start + int(rng.integers(0, 80))}\tW{start}\n")
+
+def best_of(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cost of the gene context join next to substitution featurization")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--genes', type=int, default=20_000)
+    parser.add_argument('--windows', type=int, default=10, help="windows per gene")
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'context.tsv')
+        write_table(path, args.genes, args.windows)
+        start = time.perf_counter()
+        context = GeneContext.load(path)
+        load_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(1)
+    # Some genes outside the table, as in real uploads
+    names = [f"G{i}" for i in rng.integers(0, int(args.genes * 1.1), args.rows)]
+    orig = rng.integers(0, len(AA_CODES), args.rows)
+    new = rng.integers(0, len(AA_CODES), args.rows)
+    positions = rng.integers(1, 5000, args.rows)
+    gene_ids = context.gene_ids(names)
+
+    substitution_s = best_of(lambda: features_from_codes(orig, positions, new), args.repeats)
+    gene_ids_s = best_of(lambda: context.gene_ids(names), args.repeats)
+    features_s = best_of(lambda: context.features(gene_ids, positions), args.repeats)
+    windows = sum(len(starts) for starts, _, _ in context.windows.values())
+
+    print(f"table: {args.genes:,} genes, {windows:,} windows, loaded in {load_s:.2f} s")
+    print(f"{'stage':<24} {'seconds':>8} {'rows/s':>14}")
+    for stage, seconds in [('substitution features', substitution_s), ('gene ids', gene_ids_s),
+                           ('context features', features_s)]:
+        print(f"{stage:<24} {seconds:8.3f} {args.rows / seconds:14,.0f}")
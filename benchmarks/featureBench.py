@@ -0,0 +1,35 @@
+import argparse
+import time
+
+from src.features import build_training_set, get_features
+from src.substitutions import FEATURE_COLUMNS
+from benchmarks.synthetic import clinvar_frame
+
+def legacy_training_set(df):
+    # The original row-by-row path of src/features.py
+    df['Label'] = df['ClinicalSignificance'].apply(lambda x: 1 if 'pathogenic' in x.lower() else 0)
+    df[FEATURE_COLUMNS] = df['ProteinChange'].apply(get_features)
+    return df.dropna(subset=['Hydro_Delta'])
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df.copy())
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the apply() and str.extract feature paths")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    df = clinvar_frame(args.rows).rename(columns={'Name': 'ProteinChange'})
+
+    old, old_secs = timed(legacy_training_set, df)
+    new, new_secs = timed(build_training_set, df)
+
+    # training_ready.csv must not change
+    assert old.to_csv(index=False) == new.to_csv(index=False), "feature paths disagree"
+
+    print(f"rows:          {args.rows:,}")
+    print(f"apply path:    {old_secs:8.2f}s ({args.rows / old_secs:,.0f} rows/s)")
+    print(f"vector path:   {new_secs:8.2f}s ({args.rows / new_secs:,.0f} rows/s)")
+    print(f"speedup:       {old_secs / new_secs:8.1f}x")
@@ -0,0 +1,37 @@
+import argparse
+import os
+import tempfile
+import time
+
+from src.regionScan import IndexedVcf, build_index
+from src.tabix import bgzip, index_path
+from src.vcf import iter_file_records
+from src.scanner import SCAN_BATCH_SIZE, score_records
+from benchmarks.synthetic import write_vcf
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare a full scan with an indexed region query")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--region-size', type=int, default=50_000, help="bases queried (one row per base)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, 'bench.vcf')
+        path = plain + '.gz'
+        write_vcf(plain, args.rows)
+        bgzip(plain, path)
+
+        start = time.perf_counter()
+        index, genes = build_index(path)
+        index.save(index_path(path))
+        print(f"index build: {time.perf_counter() - start:.2f} s for {args.rows:,} rows")
+
+        start = time.perf_counter()
+        scored = sum(score_records(records)[1] for records in iter_file_records(path, SCAN_BATCH_SIZE))
+        print(f"full scan:   {time.perf_counter() - start:.2f} s, {scored:,} variants scored")
+
+        middle = args.rows // 2
+        start = time.perf_counter()
+        report = IndexedVcf(path, index, genes).scan([('17', middle, middle + args.region_size)])
+        print(f"region scan: {time.perf_counter() - start:.3f} s, {report['variants_scored']:,} variants scored, "
+              f"{report['blocks_read']} BGZF blocks read")
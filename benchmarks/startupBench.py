@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+# Runs in a fresh interpreter per sample, so nothing is warm from a previous run
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from src.scanner import score_records
+score_records([('TP53', 'p.Arg175His')])
+first = time.perf_counter()
+xgboost_loaded = 'xgboost' in sys.modules
+first_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+score_records([('TP53', f'p.Arg{pos}His') for pos in range(1, 1001)])
+batch = time.perf_counter()
+# Large batches go to the booster once it has loaded in the background
+from src.scanner import active_model
+active_model().get_booster()
+print(json.dumps({
+    "import_s": imported - start,
+    "first_prediction_s": first - imported,
+    "first_batch_s": batch - first,
+    "deferred_load_s": active_model().deferred_load_seconds,
+    "xgboost_at_first_prediction": xgboost_loaded,
+    "rss_at_first_prediction_mb": first_rss,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+# name -> environment overrides
+CONFIGS = {
+    'flat-export': {'MODEL_BACKEND': 'auto'},
+    'unpickle': {'MODEL_BACKEND': 'auto', 'FLAT_MODEL_PATH': '/nonexistent'},
+    'xgboost': {'MODEL_BACKEND': 'xgboost'},
+}
+
+def run_once(env):
+    out = subprocess.run([sys.executable, '-c', CHILD], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time service import and time-to-first-prediction")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--configs', default=','.join(CONFIGS), help="comma-separated subset of " + ', '.join(CONFIGS))
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    # The service defaults (SHAP_LOOKUP=load, METRICS=on) unless set in the environment
+    base_env = {'JOB_DIR': os.path.join(tempfile.gettempdir(), 'snp-bench-jobs'),
+                'INDEX_DIR': os.path.join(tempfile.gettempdir(), 'snp-bench-indexed'), **os.environ,
+                'PYTHONPATH': os.getcwd()}
+    report = {}
+    for name in args.configs.split(','):
+        runs = [run_once({**base_env, **CONFIGS[name]}) for _ in range(args.repeats)]
+        report[name] = {
+            key: round(float(np.median([run[key] for run in runs])), 4) if key != 'xgboost_at_first_prediction'
+            else runs[0][key]
+            for key in runs[0]
+        }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"{len(report)} configurations -> {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
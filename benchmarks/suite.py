@@ -0,0 +1,153 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# The suite measures cold scoring and must not write next to the model or
+# into the repo, so these default off / to a temp dir unless set explicitly
+os.environ.setdefault('SHAP_LOOKUP', 'off')
+os.environ.setdefault('PREDICTION_CACHE_SIZE', '0')
+os.environ.setdefault('JOB_DIR', os.path.join(tempfile.gettempdir(), 'snp-bench-jobs'))
+os.environ.setdefault('INDEX_DIR', os.path.join(tempfile.gettempdir(), 'snp-bench-indexed'))
+
+from fastapi.testclient import TestClient
+
+import main
+from src.features import get_features
+from src.scanner import extract_features_from_str, predict_pathogenic, score_features
+from src.smartLoader import process_clinvar_large
+from src.substitutions import extract_features
+from benchmarks.synthetic import clinvar_frame, protein_changes, write_clinvar, write_vcf
+
+DEFAULT_SCALES = [1_000, 100_000]
+
+def summarize(stage, rows, latencies, total_seconds, peak_bytes, unit):
+    # latencies are per call (unit='call') or per full run over all rows (unit='run')
+    latencies = np.asarray(latencies) * 1e3
+    return {
+        "stage": stage,
+        "rows": rows,
+        "unit": unit,
+        "samples": len(latencies),
+        "throughput_rows_per_s": round(rows / total_seconds, 1) if total_seconds else None,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "peak_mb": round(peak_bytes / 2**20, 2),
+    }
+
+def peak_memory(fn):
+    # Python-heap peak (NumPy buffers included) of one extra, untimed run
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def per_call(stage, fn, inputs, rows):
+    # Times fn on each input separately; throughput is extrapolated to rows
+    latencies = []
+    for value in inputs:
+        start = time.perf_counter()
+        fn(value)
+        latencies.append(time.perf_counter() - start)
+    peak = peak_memory(lambda: [fn(value) for value in inputs])
+    mean = sum(latencies) / len(latencies)
+    return summarize(stage, rows, latencies, mean * rows, peak, 'call')
+
+def per_run(stage, fn, rows, repeats):
+    # Times whole runs over all rows; throughput uses the median run
+    fn()  # warm-up
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    peak = peak_memory(fn)
+    return summarize(stage, rows, latencies, float(np.median(latencies)), peak, 'run')
+
+def bench_scale(rows, work_dir, sample, repeats, seed):
+    results = []
+    orig, positions, new = protein_changes(rows, seed)
+    changes = [f"p.{o}{p}{n}" for o, p, n in zip(orig, positions, new)]
+    names = clinvar_frame(min(rows, sample), seed)['Name'].tolist()
+
+    # Parse / featurize: the per-variant helpers on a sample of rows
+    results.append(per_call('extract_features_from_str', extract_features_from_str, changes[:sample], rows))
+    results.append(per_call('get_features', get_features, names, rows))
+
+    # Filter (and featurize) a synthetic ClinVar dump
+    clinvar_path = os.path.join(work_dir, f"clinvar_{rows}.txt.gz")
+    write_clinvar(clinvar_path, rows, seed)
+    output_path = os.path.join(work_dir, f"filtered_{rows}.csv")
+
+    def filter_clinvar():
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            process_clinvar_large(clinvar_path, output_path, workers=1, featurize=True)
+    results.append(per_run('process_clinvar_large', filter_clinvar, rows, repeats))
+
+    # Score: single-variant latency and whole-matrix throughput
+    X = extract_features(changes)
+    X = X[~np.isnan(X[:, 0])]
+    results.append(per_call('predict_pathogenic[1]', predict_pathogenic, [X[i:i + 1] for i in range(min(len(X), sample))], len(X)))
+    results.append(per_run('score_features', lambda: score_features(X), len(X), repeats))
+
+    # Serve: /scan-vcf end to end through the ASGI app
+    vcf_path = os.path.join(work_dir, f"scan_{rows}.vcf")
+    write_vcf(vcf_path, rows, seed)
+    client = TestClient(main.app)
+
+    def scan():
+        with open(vcf_path, 'rb') as f:
+            response = client.post('/scan-vcf', files={'file': ('bench.vcf', f, 'text/plain')})
+        response.raise_for_status()
+    results.append(per_run('/scan-vcf', scan, rows, repeats))
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the parse, featurize, score and serve stages")
+    parser.add_argument('--scales', type=lambda s: [int(x) for x in s.split(',')], default=DEFAULT_SCALES,
+                        help="comma-separated row counts, e.g. 1000,100000,10000000")
+    parser.add_argument('--sample', type=int, default=10000, help="calls timed for the per-variant stages")
+    parser.add_argument('--repeats', type=int, default=3, help="timed runs for the whole-file stages")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": {"sample": args.sample, "repeats": args.repeats, "seed": args.seed},
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        for rows in args.scales:
+            report["results"].extend(bench_scale(rows, work_dir, args.sample, args.repeats, args.seed))
+    # Whole-process high-water mark, native (XGBoost, Arrow) allocations included
+    report["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"{len(report['results'])} measurements -> {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
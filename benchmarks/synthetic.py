@@ -0,0 +1,89 @@
+import gzip
+
+import numpy as np
+import pandas as pd
+
+from src.substitutions import AA_CODES
+
+GENES = ['TP53', 'BRCA1', 'BRCA2', 'LDLR', 'HFE', 'CFTR', 'MLH1', 'APC']
+LABELS = ['Pathogenic', 'Benign', 'Likely pathogenic', 'Likely benign', 'Uncertain significance']
+
+def protein_changes(rows, seed=0):
+    # (orig, position, new) triples; about 5% use residues outside the table (Ter)
+    rng = np.random.default_rng(seed)
+    residues = np.array(AA_CODES + ['Ter'])
+    weights = np.full(len(residues), 0.95 / len(AA_CODES))
+    weights[-1] = 0.05
+    orig = rng.choice(residues, rows, p=weights)
+    new = rng.choice(residues, rows, p=weights)
+    positions = rng.integers(1, 3500, rows)
+    return orig, positions, new
+
+def clinvar_frame(rows, seed=0):
+    # A variant_summary.txt-like frame; about 10% of names carry no protein change
+    rng = np.random.default_rng(seed)
+    orig, positions, new = protein_changes(rows, seed)
+    genes = rng.choice(GENES, rows)
+    coding = rng.random(rows) > 0.1
+    names = [
+        f"NM_{i % 999999:06d}.1({g}):c.{p * 3}G>A (p.{o}{p}{n})" if c else f"NC_000017.11:g.{i}G>A"
+        for i, (g, o, p, n, c) in enumerate(zip(genes, orig, positions, new, coding))
+    ]
+    return pd.DataFrame({
+        '#AlleleID': np.arange(rows),
+        'Type': np.where(rng.random(rows) > 0.05, 'single nucleotide variant', 'Deletion'),
+        'Name': names,
+        'GeneSymbol': genes,
+        'ClinicalSignificance': rng.choice(LABELS, rows),
+        'RS# (dbSNP)': rng.integers(1, 10**9, rows),
+        'Assembly': np.where(rng.random(rows) > 0.5, 'GRCh38', 'GRCh37'),
+    })
+
+def write_vcf(path, rows, seed=0, block=100000):
+    # A sites-only VCF with the protein change in INFO, written block by block
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        f.write('##fileformat=VCFv4.2\n')
+        f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        for start in range(0, rows, block):
+            size = min(block, rows - start)
+            orig, positions, new = protein_changes(size, seed + start)
+            genes = rng.choice(GENES, size)
+            f.writelines(
+                f"17\t{start + i + 1}\t{g}\tG\tA\t100\tPASS\tp.{o}{p}{n}\n"
+                for i, (g, o, p, n) in enumerate(zip(genes, orig, positions, new))
+            )
+
+def write_clinvar(path, rows, seed=0, block=100000):
+    # A gzipped variant_summary.txt-like file, written block by block
+    with gzip.open(path, 'wt', compresslevel=1) as f:
+        for start in range(0, rows, block):
+            frame = clinvar_frame(min(block, rows - start), seed + start)
+            frame['#AlleleID'] += start
+            frame.to_csv(f, sep='\t', index=False, header=start == 0)
+
+VEP_FIELDS = ['Allele', 'Consequence', 'IMPACT', 'SYMBOL', 'Gene', 'Feature_type', 'Feature',
+              'BIOTYPE', 'EXON', 'INTRON', 'HGVSc', 'HGVSp', 'Protein_position', 'Amino_acids']
+VEP_HEADER = ('##INFO=<ID=CSQ,Number=.,Type=String,Description="Consequence annotations from Ensembl VEP. '
+              f'Format: {"|".join(VEP_FIELDS)}">')
+
+def vep_infos(rows, transcripts=4, coding=0.3, seed=0):
+    # INFO strings with a CSQ entry per transcript; a 'coding' share of the
+    # lines carry a missense HGVSp on every transcript, the rest are intronic
+    rng = np.random.default_rng(seed)
+    orig, positions, new = protein_changes(rows, seed)
+    genes = rng.choice(GENES, rows)
+    is_coding = rng.random(rows) < coding
+    infos = []
+    for i, (g, o, p, n, c) in enumerate(zip(genes, orig, positions, new, is_coding)):
+        entries = []
+        for t in range(transcripts):
+            if c:
+                entries.append(f"A|missense_variant|MODERATE|{g}|ENSG{i % 99999:011d}|Transcript|"
+                               f"ENST{i % 99999:06d}{t:05d}.1|protein_coding|4/11||c.{p * 3}G>A|"
+                               f"ENSP{i % 99999:06d}{t:05d}.1:p.{o}{p + t}{n}|{p + t}|X/Y")
+            else:
+                entries.append(f"A|intron_variant|MODIFIER|{g}|ENSG{i % 99999:011d}|Transcript|"
+                               f"ENST{i % 99999:06d}{t:05d}.1|protein_coding||3/10|c.{p * 3}+12G>A|||")
+        infos.append(f"DP=30;CSQ={','.join(entries)};AF=0.5")
+    return infos
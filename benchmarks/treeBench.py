@@ -0,0 +1,48 @@
+import argparse
+import time
+
+import joblib
+import numpy as np
+
+from src.flatTrees import FlatTreeModel
+from src.substitutions import extract_features
+from benchmarks.synthetic import protein_changes
+
+def feature_matrix(rows):
+    orig, positions, new = protein_changes(rows)
+    X = extract_features([f"p.{o}{p}{n}" for o, p, n in zip(orig, positions, new)])
+    X = X[~np.isnan(X[:, 0])]
+    # Exercise the missing-value branches too
+    X[::50, 1] = np.nan
+    return X
+
+def latency_us(predict, X, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict(X)
+    return (time.perf_counter() - start) / repeats * 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check parity and latency of the flat tree backend")
+    parser.add_argument('--model', default='model/snp_predictor_model.pkl')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--repeats', type=int, default=1000)
+    parser.add_argument('--tolerance', type=float, default=1e-5)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    flat = FlatTreeModel.from_xgb(model)
+    X = feature_matrix(args.rows)
+
+    # Parity: both backends must agree on every row
+    diff = np.abs(model.predict_proba(X)[:, 1] - flat.predict_proba(X)[:, 1]).max()
+    assert diff <= args.tolerance, f"flat backend differs from XGBoost by {diff:.3g}"
+    print(f"max |p_xgb - p_flat| over {len(X):,} rows: {diff:.3g}")
+
+    # Latency by batch size; the flat backend wins for small batches
+    print(f"{'rows':>8} {'xgboost us':>12} {'flat us':>12}")
+    for size in [1, 8, 32, 128, 1024, len(X)]:
+        repeats = max(3, args.repeats // size)
+        batch = X[:size]
+        print(f"{size:>8,} {latency_us(model.predict_proba, batch, repeats):12.1f} "
+              f"{latency_us(flat.predict_proba, batch, repeats):12.1f}")
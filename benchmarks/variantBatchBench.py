@@ -0,0 +1,52 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.substitutions import AA_CODES
+from src.variantBatch import VariantBatch
+from benchmarks.synthetic import GENES
+
+def measure(fn):
+    # (seconds, bytes still held by the result, allocation peak, result); timed
+    # without tracemalloc, which slows allocation-heavy code down many times
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    result = fn()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, held, peak, result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory per scored variant: VariantBatch columns vs hit dicts")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--chunk', type=int, default=65536, help="hits per scored chunk, as in a scan")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    # Scored hits only ever carry known residues
+    orig = rng.integers(0, len(AA_CODES), args.rows).astype(np.uint8)
+    new = rng.integers(0, len(AA_CODES), args.rows).astype(np.uint8)
+    positions = rng.integers(1, 3500, args.rows)
+    probs = rng.uniform(0.5, 1.0, args.rows)
+    genes = [GENES[i] for i in rng.integers(0, len(GENES), args.rows)]
+    # Index arrays rather than slices, so every batch owns its columns as in a scan
+    chunks = [np.arange(i, min(i + args.chunk, args.rows)) for i in range(0, args.rows, args.chunk)]
+
+    # What a scan keeps until its response is built: one batch per chunk ...
+    batch_s, batch_bytes, batch_peak, batches = measure(lambda: [
+        VariantBatch.from_columns([genes[i] for i in chunk.tolist()], orig[chunk], positions[chunk],
+                                  new[chunk], probs[chunk]) for chunk in chunks])
+    # ... versus one dict per hit, as the API returns them
+    dict_s, dict_bytes, dict_peak, _ = measure(lambda: [hit for batch in batches for hit in batch.iter_dicts()])
+    merged = VariantBatch.concat(batches)
+    assert len(merged) == args.rows and merged.take(slice(0, 100)).to_dicts() == batches[0].take(slice(0, 100)).to_dicts()
+
+    print(f"{'representation':<16} {'seconds':>8} {'bytes/variant':>14} {'peak MB':>9}")
+    print(f"{'VariantBatch':<16} {batch_s:8.3f} {batch_bytes / args.rows:14.1f} {batch_peak / 2**20:9.1f}")
+    print(f"{'hit dicts':<16} {dict_s:8.3f} {dict_bytes / args.rows:14.1f} {dict_peak / 2**20:9.1f}")
+    print(f"columns alone: {merged.nbytes / args.rows:.1f} bytes/variant")
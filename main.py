@@ -1,9 +1,24 @@
-from fastapi import FastAPI, UploadFile, File
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-import joblib
-import pandas as pd
-import io
-import re
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import threading
+
+from src import api, metrics
+from src.batchScan import BatchScan
+from src.jobs import RESULTS_FILE, UPLOAD_FILE, JobManager
+from src.regionScan import IndexedVcfStore, load_gene_regions
+from src.scanLimiter import ScanLimiter, ScanRejected
+from src.scanner import (
+    SCAN_BATCH_SIZE, active_model, compare_models, comparison, model_registry, pick_models, score_records,
+)
+from src.variantBatch import VariantBatch
+from src.vcf import READ_CHUNK_SIZE, CompressedStreamError, VcfStreamParser, iter_upload_records
 
 app = FastAPI()
 
@@ -15,67 +30,318 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load the artifacts we built
-model = joblib.load('model/snp_predictor_model.pkl')
-
-# Amino Acid Reference (The "Bio-Dictionary")
-aa_props = {
-    'Ala': [1.8, 89.1, 0],   'Arg': [-4.5, 174.2, 1],  'Asn': [-3.5, 132.1, 0],
-    'Asp': [-3.5, 133.1, -1], 'Cys': [2.5, 121.2, 0],   'Gln': [-3.5, 146.1, 0],
-    'Glu': [-3.5, 147.1, -1], 'Gly': [-0.4, 75.1, 0],   'His': [-3.2, 155.2, 1],
-    'Ile': [4.5, 131.2, 0],   'Leu': [3.8, 131.2, 0],   'Lys': [-3.9, 146.2, 1],
-    'Met': [1.9, 149.2, 0],   'Phe': [2.8, 165.2, 0],   'Pro': [-1.6, 115.1, 0],
-    'Ser': [-0.8, 105.1, 0],   'Thr': [-0.7, 119.1, 0],  'Trp': [-0.9, 204.2, 0],
-    'Tyr': [-1.3, 181.2, 0],   'Val': [4.2, 117.1, 0]
-}
-
-def extract_features_from_str(mutation_str):
-    # Regex to handle VCF style strings: p.Arg175His or (p.Arg175His)
-    match = re.search(r'p\.([A-Z][a-z]{2})(\d+)([A-Z][a-z]{2})', mutation_str)
-    if match:
-        orig_aa, pos, new_aa = match.groups()
-        if orig_aa in aa_props and new_aa in aa_props:
-            h_delta = aa_props[new_aa][0] - aa_props[orig_aa][0]
-            w_delta = aa_props[new_aa][1] - aa_props[orig_aa][1]
-            c_delta = aa_props[new_aa][2] - aa_props[orig_aa][2]
-            return [h_delta, w_delta, c_delta, int(pos)], (orig_aa, new_aa)
-    return None, None
+# Per-variant explanations (/prediction-logic/{mutation})
+app.include_router(api.router)
+api.start_shap_lookup()
+
+# Parsing and scoring are CPU-bound, so they run off the event loop:
+# SCAN_EXECUTOR=thread scores in a thread pool, =process in a process pool
+# (each worker process loads its own copy of the model; workers come from a
+# forkserver, so they inherit none of this process's threads, locks or open
+# connections: the registry poller, a SHAP build, the SQLite cache). At most
+# MAX_CONCURRENT_SCANS uploads are worked on at once and MAX_QUEUED_SCANS more
+# may wait; further uploads get a 503.
+SCAN_EXECUTOR = os.environ.get('SCAN_EXECUTOR', 'thread')
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', os.cpu_count() or 1))
+MAX_CONCURRENT_SCANS = int(os.environ.get('MAX_CONCURRENT_SCANS', SCAN_WORKERS))
+MAX_QUEUED_SCANS = int(os.environ.get('MAX_QUEUED_SCANS', 16))
+parse_executor = ThreadPoolExecutor(SCAN_WORKERS, thread_name_prefix='scan')
+score_executor = (ProcessPoolExecutor(SCAN_WORKERS, mp_context=multiprocessing.get_context('forkserver'))
+                  if SCAN_EXECUTOR == 'process' else parse_executor)
+scan_limiter = ScanLimiter(MAX_CONCURRENT_SCANS, MAX_QUEUED_SCANS)
+
+# With MODEL_REGISTRY_DIR set, new model versions are swapped in without a
+# restart (python -m src.modelRegistry publish/activate/candidate). Each scan
+# keeps the model it started with. Requests picked for shadow or A/B scoring
+# are also scored by the other model on a background thread; at most
+# SHADOW_MAX_PENDING chunks wait for it and further ones are skipped, so
+# comparisons never slow down or queue up behind the responses.
+SHADOW_MAX_PENDING = int(os.environ.get('SHADOW_MAX_PENDING', 4))
+shadow_executor = ThreadPoolExecutor(1, thread_name_prefix='shadow')
+_shadow_pending = 0
+_shadow_lock = threading.Lock()
+if model_registry is not None:
+    model_registry.start_polling()
+
+def submit_comparison(records, annotation, serving, compared):
+    global _shadow_pending
+    with _shadow_lock:
+        if _shadow_pending >= SHADOW_MAX_PENDING:
+            comparison.skip()
+            return
+        _shadow_pending += 1
+
+    def run():
+        global _shadow_pending
+        try:
+            compare_models(records, annotation, serving, compared)
+        finally:
+            with _shadow_lock:
+                _shadow_pending -= 1
+
+    shadow_executor.submit(run)
+
+# Prometheus metrics (METRICS=off disables them): stage timings per chunk
+# (read, decode, extract, featurize, cache, predict, respond; 'score' is the
+# whole scoring call including the wait for a worker), variant counters and
+# the service gauges below. With SCAN_EXECUTOR=process the stages inside the
+# scoring call and the cache counters stay in the worker processes.
+if metrics.METRICS_ENABLED:
+    metrics.registry.gauge('snp_scans_in_flight', 'Scans being worked on', lambda: scan_limiter.active)
+    metrics.registry.gauge('snp_scans_queued', 'Scans waiting for a slot', lambda: scan_limiter.waiting)
+    metrics.registry.gauge('snp_model_load_seconds', 'Time taken to load the active model',
+                           lambda: active_model().load_seconds)
+    metrics.registry.gauge('snp_model_deferred_load_seconds',
+                           'Time the active model spent loading its booster on the first large batch',
+                           lambda: active_model().deferred_load_seconds)
+    metrics.registry.counter('snp_prediction_cache_hits_total', 'Substitutions served from the prediction cache',
+                             lambda: active_model().cache.hits)
+    metrics.registry.counter('snp_prediction_cache_misses_total', 'Substitutions sent to the model',
+                             lambda: active_model().cache.misses)
+    metrics.registry.counter('snp_model_swaps_total', 'Model versions swapped in without a restart',
+                             lambda: model_registry.swaps if model_registry is not None else 0)
+    metrics.registry.counter('snp_shadow_variants_total', 'Variants scored by both models of a shadow/A-B comparison',
+                             lambda: comparison.variants)
+    metrics.registry.counter('snp_shadow_disagreements_total', 'Compared variants the two models call differently',
+                             lambda: comparison.disagreements)
+    metrics.registry.counter('snp_shadow_skipped_total', 'Chunks not compared because the shadow queue was full',
+                             lambda: comparison.skipped)
+
+    @app.get("/metrics")
+    async def get_metrics():
+        return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+async def acquire_scan_slot():
+    try:
+        await scan_limiter.acquire()
+    except ScanRejected:
+        metrics.scans_rejected.inc()
+        raise HTTPException(status_code=503, detail="Too many scans in progress, retry later",
+                            headers={"Retry-After": "5"})
+
+async def scan_upload(file, serving, compared=None):
+    # Yield (hits, scored) per parsed chunk of the upload; hits is a VariantBatch
+    # VEP/SnpEff-annotated uploads are scored per consequence (parser.annotation).
+    # serving and compared come from pick_models() once per request.
+    loop = asyncio.get_running_loop()
+    parser = VcfStreamParser()
+    # Worker processes resolve the version themselves
+    model = serving.version if SCAN_EXECUTOR == 'process' else serving
+    async for records in iter_upload_records(file, SCAN_BATCH_SIZE, executor=parse_executor, parser=parser):
+        # Worker processes cannot see this request's profile
+        score = score_records if SCAN_EXECUTOR == 'process' else metrics.in_context(score_records)
+        with metrics.stage('score'):
+            hits, scored = await loop.run_in_executor(score_executor, score, records, parser.annotation, model)
+        metrics.record_scan(len(records), scored)
+        if compared is not None:
+            submit_comparison(records, parser.annotation, serving, compared)
+        yield hits, scored
+
+def profile_summary(profile):
+    return {name: round(seconds, 6) for name, seconds in profile.items()}
+
+async def stream_ndjson(file, profile=False):
+    # One line per pathogenic variant as soon as its chunk is scored, then a summary line
+    try:
+        count = scored = 0
+        serving, compared = pick_models()
+        error = None
+        with metrics.profiling(profile) as timings:
+            try:
+                async for hits, chunk_scored in scan_upload(file, serving, compared):
+                    count += len(hits)
+                    scored += chunk_scored
+                    if len(hits):
+                        yield ''.join(json.dumps(hit) + '\n' for hit in hits.iter_dicts())
+            except CompressedStreamError as exc:
+                # The 200 is already sent: the summary line says the hits are incomplete
+                error = str(exc)
+        summary = {"status": "success", "model": serving.version, "count": count, "variants_scored": scored}
+        if error is not None:
+            summary.update(status="failed", error=error)
+        if timings is not None:
+            summary["profile"] = profile_summary(timings)
+        yield json.dumps({"summary": summary}) + '\n'
+    finally:
+        scan_limiter.release()
+        await file.close()
 
 @app.post("/scan-vcf")
-async def scan_vcf(file: UploadFile = File(...)):
-    content = await file.read()
-    decoded = content.decode("utf-8")
-    
-    # Simple VCF Parser (Skipping headers)
-    lines = [l for l in decoded.split('\n') if l and not l.startswith('##')]
-    df = pd.read_csv(io.StringIO('\n'.join(lines)), sep='\t')
-    
-    # We look for a column typically named 'INFO' or 'ID' that contains the p. mutation
+async def scan_vcf(file: UploadFile = File(...), stream: str | None = None, profile: bool = False):
+    # The upload is read and scored chunk by chunk (plain, .vcf.gz or BGZF), so
+    # memory stays flat no matter how large the VCF is.
+    # We look for the 'INFO' column that contains the p. mutation and the 'ID' column for the gene
     # In a real VCF, this requires "Variant Effect Predictor" (VEP) output
-    pathogenic_variants = []
-    
-    for _, row in df.iterrows():
-        # Searching the 'INFO' column for the protein change
-        info_str = str(row.get('INFO', ''))
-        features, aa_pair = extract_features_from_str(info_str)
-        
-        if features:
-            # Predict
-            prob = model.predict_proba([features])[0][1] # Probability of being Pathogenic
-            if prob > 0.5:
-                pathogenic_variants.append({
-                    "mutation": f"p.{aa_pair[0]}{features[3]}{aa_pair[1]}",
-                    "probability": float(prob),
-                    "deltas": {
-                        "hydro": features[0],
-                        "weight": features[1],
-                        "charge": features[2]
-                    },
-                    "position": features[3],
-                    "gene": row.get('ID', 'Unknown')
-                })
-                
-    return {"status": "success", "count": len(pathogenic_variants), "results": pathogenic_variants}
+    # ?stream=ndjson sends each hit as it is found instead of one JSON document at the end.
+    # ?profile=true adds the seconds this request spent in each stage.
+    if stream not in (None, 'ndjson'):
+        raise HTTPException(status_code=400, detail=f"Unsupported stream format {stream!r}")
+    await acquire_scan_slot()
+
+    if stream == 'ndjson':
+        return StreamingResponse(stream_ndjson(file, profile), media_type="application/x-ndjson")
+
+    try:
+        chunks = []
+        serving, compared = pick_models()
+        with metrics.profiling(profile) as timings:
+            async for hits, _ in scan_upload(file, serving, compared):
+                chunks.append(hits)
+    except CompressedStreamError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        scan_limiter.release()
+
+    # Hits stay columnar until here; the dicts are only built for the response
+    hits = VariantBatch.concat(chunks)
+    response = {"status": "success", "model": serving.version, "count": len(hits), "results": hits.to_dicts()}
+    if timings is not None:
+        response["profile"] = profile_summary(timings)
+    return response
+
+@app.post("/scan-batch")
+async def scan_batch(files: list[UploadFile] = File(...)):
+    # Many VCFs and/or multi-sample VCFs in one request: each distinct
+    # (gene, protein change) is scored once and reported per sample
+    await acquire_scan_slot()
+    try:
+        loop = asyncio.get_running_loop()
+        batch = BatchScan()
+        for file in files:
+            parser = VcfStreamParser(with_samples=True)
+            async for records in iter_upload_records(file, SCAN_BATCH_SIZE, executor=parse_executor, parser=parser):
+                await loop.run_in_executor(parse_executor, batch.add_records, file.filename, records,
+                                           parser.annotation)
+        return await loop.run_in_executor(parse_executor, batch.finish)
+    except CompressedStreamError as exc:
+        raise HTTPException(status_code=400, detail=f"{file.filename}: {exc}")
+    finally:
+        scan_limiter.release()
+
+async def save_upload(file, path):
+    # Stream an upload to disk (still compressed, if it was)
+    loop = asyncio.get_running_loop()
+    with open(path, 'wb') as out:
+        while data := await file.read(READ_CHUNK_SIZE):
+            await loop.run_in_executor(parse_executor, out.write, data)
+
+# Whole-genome scans go through background jobs instead of one long request
+JOB_DIR = os.environ.get('JOB_DIR', 'jobs')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+job_manager = JobManager(JOB_DIR, score_records, SCAN_BATCH_SIZE, JOB_WORKERS, pick_model=active_model)
+
+def job_status_or_404(job_id):
+    try:
+        return job_manager.status(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+
+@app.post("/jobs")
+async def submit_job(file: UploadFile = File(...)):
+    # Store the upload (still compressed, if it was) and return at once
+    job_id = job_manager.create(file.filename)
+    await save_upload(file, job_manager.path(job_id, UPLOAD_FILE))
+    job_manager.submit(job_id)
+    return job_manager.status(job_id)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    # Progress: lines parsed, variants scored and pathogenic hits so far
+    return job_status_or_404(job_id)
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=10000)):
+    job_status_or_404(job_id)
+    status, page = job_manager.results(job_id, offset, limit)
+    return {"status": status["status"], "offset": offset, "count": len(page), "results": page}
+
+@app.get("/jobs/{job_id}/results.ndjson")
+async def get_job_results_ndjson(job_id: str):
+    job_status_or_404(job_id)
+    path = job_manager.path(job_id, RESULTS_FILE)
+
+    def lines():
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    # Skip a line the worker is still writing
+                    if line.endswith('\n'):
+                        yield line
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# Gene-panel / region queries: a VCF is uploaded once (bgzipped and indexed
+# server-side unless a BGZF file and its .tbi/.csi are sent), then each query
+# only decompresses and scores the BGZF blocks that overlap its regions.
+# Genes resolve to the span of their records in the file (named by the CSQ/ANN
+# symbol, else the ID column), or to the GENE_REGIONS BED file (chrom, start,
+# end, name) when set. Gene queries over the file's own spans only return hits
+# in the genes asked for; BED spans return every hit in them, like a region.
+INDEX_DIR = os.environ.get('INDEX_DIR', 'indexed_vcfs')
+GENE_REGIONS = os.environ.get('GENE_REGIONS')
+vcf_store = IndexedVcfStore(INDEX_DIR, load_gene_regions(GENE_REGIONS) if GENE_REGIONS else None)
+
+@app.post("/indexed-vcfs")
+async def upload_indexed_vcf(file: UploadFile = File(...), index: UploadFile | None = File(None)):
+    vcf_id = vcf_store.create()
+    upload_path = vcf_store.path(vcf_id, 'upload')
+    await save_upload(file, upload_path)
+    index_path = None
+    if index is not None:
+        suffix = '.csi' if (index.filename or '').endswith('.csi') else '.tbi'
+        index_path = vcf_store.path(vcf_id, 'upload' + suffix)
+        await save_upload(index, index_path)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(parse_executor, vcf_store.finish, vcf_id, upload_path, index_path)
+    except ValueError as exc:
+        # Unsorted VCF or an unreadable index
+        raise HTTPException(status_code=422, detail=str(exc))
+
+@app.get("/indexed-vcfs/{vcf_id}/scan")
+async def scan_indexed_vcf(vcf_id: str, region: list[str] = Query([]), gene: list[str] = Query([])):
+    # ?gene=TP53&gene=BRCA1 and/or ?region=17:7668402-7687550 (1-based, inclusive)
+    try:
+        vcf = vcf_store.open(vcf_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown indexed VCF {vcf_id}")
+    if not region and not gene:
+        raise HTTPException(status_code=400, detail="Give at least one region or gene")
+    try:
+        regions, gene_spans = vcf_store.resolve(vcf, region, gene)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+    await acquire_scan_slot()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(parse_executor, functools.partial(vcf.scan, regions, genes=gene_spans))
+    finally:
+        scan_limiter.release()
+
+@app.get("/models")
+async def get_models():
+    # What this worker serves, the registry pointers and the shadow/A-B comparison so far
+    serving = active_model()
+    response = {"active": serving.version, "fingerprint": serving.fingerprint,
+                "load_seconds": serving.load_seconds, "deferred_load_seconds": serving.deferred_load_seconds,
+                "cache": serving.cache.stats()}
+    if model_registry is not None:
+        routing = model_registry.routing
+        response.update({
+            "candidate": routing.candidate.version if routing.candidate is not None else None,
+            "mode": routing.mode,
+            "fraction": routing.fraction,
+            "versions": model_registry.versions(),
+            "swaps": model_registry.swaps,
+            "error": model_registry.error,
+            "comparison": comparison.stats(),
+        })
+    return response
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "active_scans": scan_limiter.active, "queued_scans": scan_limiter.waiting}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,144 @@
+import re
+
+import numpy as np
+
+from src.substitutions import AA_INDEX
+
+# VEP: Description="Consequence annotations from Ensembl VEP. Format: Allele|Consequence|..."
+# SnpEff: Description="Functional annotations: 'Allele | Annotation | ...' "
+ANNOTATION_KEYS = ('CSQ', 'ANN')
+_HEADER_ID_RE = re.compile(r'^##INFO=<ID=([^,]+),')
+_DESCRIPTION_RE = re.compile(r'Description="([^"]*)"')
+
+# Field names per tool; the first one present in the header wins
+ALLELE_FIELDS = ('Allele',)
+GENE_FIELDS = ('SYMBOL', 'Gene_Name')
+TRANSCRIPT_FIELDS = ('Feature', 'Feature_ID')
+PROTEIN_FIELDS = ('HGVSp', 'HGVS.p')
+
+
+def parse_hgvsp(text):
+    # 'ENSP00000269305.4:p.Arg175His' (VEP) or 'p.Arg175His' (SnpEff) ->
+    # (orig_code, position, new_code); None for anything but a missense change
+    start = text.find(':p.')
+    if start >= 0:
+        change = text[start + 3:]
+    elif text.startswith('p.'):
+        change = text[2:]
+    else:
+        return None
+    orig = AA_INDEX.get(change[:3])
+    new = AA_INDEX.get(change[-3:])
+    position = change[3:-3]
+    if orig is None or new is None or not position.isdigit():
+        return None
+    return orig, int(position), new
+
+
+def _field(fields, names):
+    for name in names:
+        if name in fields:
+            return fields.index(name)
+    return None
+
+
+class AnnotationFormat:
+    # The layout of a VEP CSQ or SnpEff ANN INFO field, read once from its
+    # ##INFO header line. Entries are comma separated (one per ALT allele and
+    # transcript) and their fields '|' separated in header order, so each
+    # record is split positionally instead of being searched with a regex.
+
+    def __init__(self, key, fields):
+        self.key = key
+        self.fields = fields
+        self._prefix = key + '='
+        self._allele = _field(fields, ALLELE_FIELDS)
+        self._gene = _field(fields, GENE_FIELDS)
+        self._transcript = _field(fields, TRANSCRIPT_FIELDS)
+        self._protein = _field(fields, PROTEIN_FIELDS)
+        if self._protein is None:
+            raise ValueError(f"{key} annotations carry no HGVSp/HGVS.p field")
+
+    @classmethod
+    def from_header(cls, line):
+        # None unless line declares a CSQ or ANN INFO field with a protein column
+        key = _HEADER_ID_RE.match(line)
+        description = _DESCRIPTION_RE.search(line)
+        if key is None or key.group(1) not in ANNOTATION_KEYS or description is None:
+            return None
+        text = description.group(1)
+        layout = text.split('Format:', 1)[1] if 'Format:' in text else text.split(':', 1)[-1]
+        fields = [name.strip(" '") for name in layout.split('|')]
+        try:
+            return cls(key.group(1), fields)
+        except ValueError:
+            return None
+
+    def value(self, info):
+        # The raw annotation value of one INFO string, or None
+        if info.startswith(self._prefix):
+            start = len(self._prefix)
+        else:
+            start = info.find(';' + self._prefix)
+            if start < 0:
+                return None
+            start += len(self._prefix) + 1
+        end = info.find(';', start)
+        return info[start:] if end < 0 else info[start:end]
+
+    def genes(self, info):
+        # The gene symbols named by the entries of one INFO string ('' for an
+        # entry without one); empty if the record carries no annotation
+        value = self.value(info)
+        if value is None:
+            return set()
+        if self._gene is None:
+            return {''}
+        width = len(self.fields)
+        return {(entry.split('|') + [''] * width)[self._gene] for entry in value.split(',')}
+
+    def expand(self, records):
+        # One row per (record, allele, transcript) with a missense change:
+        # (rows, genes, transcripts, alleles, orig_codes, positions, new_codes).
+        # rows index records; genes are '' when the annotation names none.
+        protein = self._protein
+        width = len(self.fields)
+        columns = [i if i is not None else protein for i in (self._gene, self._transcript, self._allele)]
+        lookup = AA_INDEX.get
+        found = []
+        for row, record in enumerate(records):
+            info = record[1]
+            # Most lines of a whole genome are non-coding: skip them before any splitting
+            if 'p.' not in info:
+                continue
+            value = self.value(info)
+            if value is None:
+                continue
+            # All entries split in one go; field i of entry k is parts[k * width + i]
+            parts = value.replace(',', '|').split('|')
+            if len(parts) != (value.count(',') + 1) * width:
+                # Some entry has missing or extra fields: pad or cut each one to the header
+                parts = [field for entry in value.split(',') for field in (entry.split('|') + [''] * width)[:width]]
+            for base in range(0, len(parts), width):
+                # parse_hgvsp, inlined: this loop runs once per transcript
+                hgvsp = parts[base + protein]
+                start = hgvsp.find(':p.')
+                change = hgvsp[start + 3:] if start >= 0 else hgvsp[2:] if hgvsp.startswith('p.') else ''
+                orig, new, position = lookup(change[:3]), lookup(change[-3:]), change[3:-3]
+                if orig is None or new is None or not position.isdigit():
+                    continue
+                found.append((row, parts[base + columns[0]], parts[base + columns[1]], parts[base + columns[2]],
+                              orig, int(position), new))
+
+        if not found:
+            empty = np.empty(0, dtype=np.uint8)
+            return np.empty(0, dtype=np.int64), [], [], [], empty, np.empty(0, dtype=np.int64), empty
+        rows, genes, transcripts, alleles, orig, positions, new = zip(*found)
+        if self._gene is None:
+            genes = [''] * len(found)
+        if self._transcript is None:
+            transcripts = [''] * len(found)
+        if self._allele is None:
+            alleles = [''] * len(found)
+        return (np.array(rows, dtype=np.int64), list(genes), list(transcripts), list(alleles),
+                np.array(orig, dtype=np.uint8), np.array(positions, dtype=np.int64), np.array(new, dtype=np.uint8))
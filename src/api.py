@@ -1,22 +1,98 @@
-from fastapi import FastAPI, UploadFile
-import joblib
-import pandas as pd
-from feature_engineering import extract_features # The script we wrote earlier
-
-app = FastAPI()
-model = joblib.load('snp_predictor_model.pkl')
-
-@app.post("/analyze-vcf")
-async def analyze_vcf(file: UploadFile):
-    # 1. Parse VCF
-    # 2. Run through model
-    # 3. Return JSON with 'Pathogenic' variants
-    return {"results": [...]}
-
-@app.get("/prediction-logic/{mutation}")
-async def get_logic(mutation: str):
-    # This returns the specific Hydro/Weight/Charge deltas 
-    # so your Angular app can show them in the UI
-    features = extract_features(mutation) 
-    prob = model.predict_proba(features)
-    return {"deltas": features, "probability": prob}
+import os
+import threading
+
+import numpy as np
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from src import scanner
+from src.modelRegistry import SHAP_FILE
+from src.shapLookup import ShapLookup
+from src.substitutions import AA_INDEX, FEATURE_COLUMNS, PROTEIN_CHANGE_RE, substitution_features
+
+router = APIRouter()
+
+# Per-variant explanations come from a precomputed SHAP table, built offline
+# (python -m src.shapLookup, or python -m src.modelRegistry publish).
+# SHAP_LOOKUP=load (default) only loads an existing file, =build also builds a
+# missing one in a background thread (unpickling the model and running TreeSHAP
+# in every worker, next to live scans), =off always runs TreeSHAP live. Without
+# a table requests fall back to the live path.
+# Tables belong to one model: {fingerprint} in the path is its content hash;
+# registry versions carry their own table.
+SHAP_LOOKUP = os.environ.get('SHAP_LOOKUP', 'load')
+SHAP_LOOKUP_PATH = os.environ.get('SHAP_LOOKUP_PATH', "model/shap_lookup_{fingerprint}.npz")
+# (ServingModel, ShapLookup) once the active model's table is ready
+shap_lookup = None
+
+def _build_shap_lookup(model, path):
+    global shap_lookup
+    table = ShapLookup.build(model.get_booster())
+    # Other workers may be loading the same path
+    tmp = path + '.tmp.npz'
+    table.save(tmp)
+    os.replace(tmp, path)
+    # A newer version may have been swapped in while this one was building
+    if scanner.active_model() is model:
+        shap_lookup = (model, table)
+
+def shap_lookup_path(model):
+    # The table published with a registry version, else SHAP_LOOKUP_PATH
+    if scanner.model_registry is not None:
+        published = scanner.model_registry.path(model.version, SHAP_FILE)
+        if os.path.exists(published):
+            return published
+    return SHAP_LOOKUP_PATH.format(fingerprint=model.fingerprint)
+
+def load_shap_lookup(model):
+    global shap_lookup
+    shap_lookup = None
+    # The table covers the substitution features only, not the gene context
+    if SHAP_LOOKUP == 'off' or model.uses_context:
+        return
+    path = shap_lookup_path(model)
+    if os.path.exists(path):
+        shap_lookup = (model, ShapLookup.load(path))
+    elif SHAP_LOOKUP == 'build':
+        threading.Thread(target=_build_shap_lookup, args=(model, path), name='shap-lookup', daemon=True).start()
+
+def start_shap_lookup():
+    load_shap_lookup(scanner.active_model())
+    if scanner.model_registry is not None:
+        scanner.model_registry.on_swap(lambda routing: load_shap_lookup(routing.active))
+
+@router.get("/prediction-logic/{mutation}")
+async def get_logic(mutation: str, gene: str | None = None):
+    # This returns the specific Hydro/Weight/Charge deltas, the probability and
+    # how much each feature pushed it, so the Angular app can show them in the UI.
+    # ?gene=TP53 adds the residue's protein context (and feeds it to context-aware models).
+    match = PROTEIN_CHANGE_RE.search(mutation)
+    features = substitution_features(*match.groups()) if match else None
+    if features is None:
+        raise HTTPException(status_code=422, detail=f"No amino-acid substitution found in {mutation!r}")
+
+    model = scanner.active_model()
+    lookup = shap_lookup
+    if lookup is None or lookup[0] is not model:
+        # Live TreeSHAP (and the first booster load) would block the event loop
+        explanation = await run_in_threadpool(scanner.explain_mutation, mutation, gene, model)
+        response = {**explanation, "model": model.version, "source": "live"}
+    else:
+        response = _lookup_explanation(lookup[1], model, match, features)
+    if gene is not None and scanner.gene_context is not None:
+        response["context"] = scanner.gene_context.describe(gene, int(features[3]))
+    return response
+
+def _lookup_explanation(table, model, match, features):
+    orig_aa, pos, new_aa = match.groups()
+    contributions, margin = table.lookup(AA_INDEX[orig_aa], AA_INDEX[new_aa], int(pos))
+    return {
+        "mutation": f"p.{orig_aa}{int(pos)}{new_aa}",
+        "deltas": {"hydro": features[0], "weight": features[1], "charge": int(features[2])},
+        "position": features[3],
+        "probability": float(1.0 / (1.0 + np.exp(-margin))),
+        "base_value": table.base_value,
+        "contributions": dict(zip(FEATURE_COLUMNS, contributions.tolist())),
+        "model": model.version,
+        "source": "lookup",
+    }
@@ -0,0 +1,126 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from src.metrics import record_scan
+from src.predictionCache import substitution_keys
+from src.scanner import SCAN_BATCH_SIZE, gene_context, model_inputs, resolve_model, score_substitutions
+from src.substitutions import UNKNOWN_CODE, parse_protein_changes
+from src.variantBatch import StringTable, VariantBatch
+from src.vcf import VcfStreamParser, iter_file_records
+
+
+class BatchScan:
+    # Scans many VCFs (or one multi-sample VCF) as one unit: every distinct
+    # (gene, protein change) is stored once, scored once in a single vectorized
+    # batch, and mapped back to the samples it was seen in. Samples are the
+    # genotype columns of multi-sample files and the file name for sites-only files.
+    # The model (a ServingModel or version; the active one by default) is pinned when the scan starts.
+
+    def __init__(self, model=None):
+        self.model = resolve_model(model)
+        self.rows = 0
+        self.occurrences = {}
+        self._index = {}
+        self._strings = StringTable()
+        self._genes, self._orig, self._positions, self._new = [], [], [], []
+
+    def add_records(self, source, records, annotation=None):
+        # records come from a VcfStreamParser(with_samples=True); annotation is
+        # its CSQ/ANN format, in which case every consequence counts and, in
+        # multi-allelic records, belongs to the samples carrying its allele
+        if annotation is None:
+            orig, positions, new = parse_protein_changes([record[1] for record in records])
+            rows = np.flatnonzero((orig != UNKNOWN_CODE) & (new != UNKNOWN_CODE))
+            orig, positions, new = orig[rows], positions[rows], new[rows]
+            genes = [records[row][0] for row in rows.tolist()]
+            alleles = None
+        else:
+            rows, symbols, _, alleles, orig, positions, new = annotation.expand(records)
+            genes = [symbol or records[row][0] for symbol, row in zip(symbols, rows.tolist())]
+        keys = substitution_keys(orig, positions, new)
+        genes = self._strings.intern(genes)
+        self.rows += len(records)
+        record_scan(len(records), len(np.unique(rows)))
+
+        index = self._index
+        # Samples already counted per (row, variant): several transcripts (or
+        # alleles) of one record can carry the same protein change
+        seen = {}
+        for i, (row, gene, key) in enumerate(zip(rows.tolist(), genes.tolist(), keys.tolist())):
+            variant = index.get((gene, key))
+            if variant is None:
+                variant = index[(gene, key)] = len(self._genes)
+                self._genes.append(gene)
+                self._orig.append(orig[i])
+                self._positions.append(positions[i])
+                self._new.append(new[i])
+            _, _, carriers, by_allele = records[row]
+            if carriers is None:
+                carriers = (source,)
+            elif by_allele is not None and alleles is not None:
+                # An allele the ALT column does not name keeps every carrier
+                carriers = by_allele.get(alleles[i], carriers)
+            counted = seen.get((row, variant))
+            if counted is None:
+                seen[(row, variant)] = set(carriers)
+            else:
+                carriers = [sample for sample in carriers if sample not in counted]
+                counted.update(carriers)
+            for sample in carriers:
+                self.occurrences.setdefault(sample, []).append(variant)
+
+    def finish(self):
+        orig = np.array(self._orig, dtype=np.uint8)
+        positions = np.array(self._positions, dtype=np.int64)
+        new = np.array(self._new, dtype=np.uint8)
+        genes = np.array(self._genes, dtype=np.int32)
+        strings = self._strings.values
+        features, keys = model_inputs(orig, positions, new, [strings[gene] for gene in genes.tolist()]
+                                      if self.model.uses_context else None, self.model)
+        probs = score_substitutions(keys, features, self.model)
+
+        # Hit dicts are built once per distinct pathogenic variant and shared by every sample
+        pathogenic = np.flatnonzero(probs > 0.5)
+        batch = VariantBatch(strings, genes[pathogenic], orig[pathogenic], positions[pathogenic],
+                             new[pathogenic], probs[pathogenic])
+        if gene_context is not None:
+            batch = gene_context.annotate(batch)
+        hits = dict(zip(pathogenic.tolist(), batch.iter_dicts()))
+        samples = {}
+        for sample, variants in self.occurrences.items():
+            results = [hits[variant] for variant in variants if variant in hits]
+            samples[sample] = {"count": len(results), "results": results}
+        return {
+            "status": "success",
+            "model": self.model.version,
+            "rows": self.rows,
+            "unique_variants": len(self._genes),
+            "samples": samples,
+        }
+
+
+def scan_files(paths, batch_size=SCAN_BATCH_SIZE):
+    batch = BatchScan()
+    for path in paths:
+        parser = VcfStreamParser(with_samples=True)
+        for records in iter_file_records(path, batch_size, parser=parser):
+            batch.add_records(os.path.basename(path), records, parser.annotation)
+    return batch.finish()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scan many VCFs, scoring each distinct variant once")
+    parser.add_argument('vcf', nargs='+', help="plain, .vcf.gz or BGZF files")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = scan_files(args.vcf)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f)
+        print(f"{report['rows']} rows, {report['unique_variants']} distinct variants -> {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
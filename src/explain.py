@@ -0,0 +1,36 @@
+import numpy as np
+
+from src.substitutions import FEATURE_COLUMNS
+
+# Exact TreeSHAP through XGBoost's own multi-threaded implementation
+# (pred_contribs), which gives the same values as shap.TreeExplainer for these
+# models without going through the shap package.
+
+def feature_names(booster):
+    # The model's input columns; FEATURE_COLUMNS for models trained without names
+    return booster.feature_names or FEATURE_COLUMNS
+
+def shap_matrix(booster, X, batch_size=50000, nthread=None):
+    # (n, n_features) SHAP values plus the shared base value,
+    # computed batch by batch so memory stays bounded. nthread changes the
+    # booster itself, so leave it unset for a model that is also serving.
+    # Imported here so the API can start (and score via the flat model) without xgboost
+    import xgboost as xgb
+
+    X = np.asarray(X, dtype=np.float32)
+    if nthread is not None:
+        booster.set_param({'nthread': nthread})
+    values = np.empty((len(X), len(feature_names(booster))), dtype=np.float32)
+    base_value = 0.0
+    for start in range(0, len(X), batch_size):
+        batch = xgb.DMatrix(X[start:start + batch_size], feature_names=booster.feature_names)
+        contribs = booster.predict(batch, pred_contribs=True)
+        values[start:start + len(contribs)] = contribs[:, :-1]
+        # The last column is the bias term, identical for every row
+        base_value = float(contribs[0, -1])
+    return values, base_value
+
+def explain_variant(booster, features):
+    # Per-feature contributions (log-odds) for one mutation's feature row
+    values, base_value = shap_matrix(booster, np.asarray(features, dtype=np.float32).reshape(1, -1))
+    return {"base_value": base_value, "contributions": dict(zip(feature_names(booster), values[0].tolist()))}
@@ -1,43 +1,72 @@
+import argparse
 import pandas as pd
 import re
 
-# Physical properties: [Hydropathy Score, Molecular Weight (Da), Chemical Charge]
-aa_props = {
-    'Ala': [1.8, 89.1, 0],   'Arg': [-4.5, 174.2, 1],  'Asn': [-3.5, 132.1, 0],
-    'Asp': [-3.5, 133.1, -1], 'Cys': [2.5, 121.2, 0],   'Gln': [-3.5, 146.1, 0],
-    'Glu': [-3.5, 147.1, -1], 'Gly': [-0.4, 75.1, 0],   'His': [-3.2, 155.2, 1],
-    'Ile': [4.5, 131.2, 0],   'Leu': [3.8, 131.2, 0],   'Lys': [-3.9, 146.2, 1],
-    'Met': [1.9, 149.2, 0],   'Phe': [2.8, 165.2, 0],   'Pro': [-1.6, 115.1, 0],
-    'Ser': [-0.8, 105.1, 0],   'Thr': [-0.7, 119.1, 0],  'Trp': [-0.9, 204.2, 0],
-    'Tyr': [-1.3, 181.2, 0],   'Val': [4.2, 117.1, 0]
-}
+from src.geneContext import CONTEXT_COLUMNS, GeneContext
+from src.storage import read_table, write_table
+from src.substitutions import (
+    AA_CODES, FEATURE_COLUMNS, UNKNOWN_CODE, features_from_codes, substitution_features,
+)
+
+# ClinVar names carry the protein change in brackets: NM_000546.6(TP53):c.524G>A (p.Arg175His)
+CLINVAR_PROTEIN_CHANGE_RE = re.compile(r'\(p\.([A-Z][a-z]{2})(\d+)([A-Z][a-z]{2})\)')
 
 def get_features(name_str):
     # Regex to extract p.Asn430Ser -> (Asn, 430, Ser)
-    match = re.search(r'\(p\.([A-Z][a-z]{2})(\d+)([A-Z][a-z]{2})\)', str(name_str))
+    match = CLINVAR_PROTEIN_CHANGE_RE.search(str(name_str))
     if match:
-        orig_aa, pos, new_aa = match.groups()
-        if orig_aa in aa_props and new_aa in aa_props:
-            # Calculate the Delta (The change the mutation causes)
-            h_delta = aa_props[new_aa][0] - aa_props[orig_aa][0] # Hydropathy change
-            w_delta = aa_props[new_aa][1] - aa_props[orig_aa][1] # Weight change
-            c_delta = aa_props[new_aa][2] - aa_props[orig_aa][2] # Charge change
-            return pd.Series([h_delta, w_delta, c_delta, int(pos)])
+        # Deltas (the change the mutation causes) come from the precomputed substitution table
+        features = substitution_features(*match.groups())
+        if features:
+            return pd.Series(features)
     return pd.Series([None, None, None, None])
 
-print("Loading filtered data...")
-df = pd.read_csv('filtered_clinvar.csv')
+def add_features(df):
+    # Column-wise version of get_features: one compiled regex over the whole
+    # column, categorical residue codes and a NumPy delta lookup
+    parts = df['ProteinChange'].astype(str).str.extract(CLINVAR_PROTEIN_CHANGE_RE)
+    orig = pd.Categorical(parts[0], categories=AA_CODES).codes.astype('int16')
+    new = pd.Categorical(parts[2], categories=AA_CODES).codes.astype('int16')
+    orig[orig < 0] = UNKNOWN_CODE
+    new[new < 0] = UNKNOWN_CODE
+    positions = pd.to_numeric(parts[1]).to_numpy(dtype='float64')
+    df[FEATURE_COLUMNS] = features_from_codes(orig, positions, new)
+    return df
+
+def add_context_features(df, gene_context):
+    # Join every row to its gene's protein length and domain/hotspot windows
+    gene_ids = gene_context.gene_ids(df['GeneSymbol'].astype(str).tolist())
+    positions = df['Position'].fillna(0).to_numpy(dtype='int64')
+    df[CONTEXT_COLUMNS] = gene_context.features(gene_ids, positions)
+    return df
+
+def build_training_set(df, gene_context=None):
+    # 1. Map labels to binary: Pathogenic = 1, Benign = 0
+    df['Label'] = df['ClinicalSignificance'].str.contains('pathogenic', case=False, regex=False).astype('int64')
+
+    # 2. Extract the Bio-Features (plus the gene's protein context, if a table is given)
+    df = add_features(df)
+    if gene_context is not None:
+        df = add_context_features(df, gene_context)
+
+    # 3. Drop rows that aren't protein-coding mutations (like row 3 in your head output)
+    return df.dropna(subset=['Hydro_Delta'])
 
-# 1. Map labels to binary: Pathogenic = 1, Benign = 0
-df['Label'] = df['ClinicalSignificance'].apply(lambda x: 1 if 'pathogenic' in x.lower() else 0)
+if __name__ == "__main__":
+    # Either side may be .csv or .parquet
+    parser = argparse.ArgumentParser(description="Build the training set from filtered ClinVar rows")
+    parser.add_argument('input', nargs='?', default='filtered_clinvar.csv')
+    parser.add_argument('output', nargs='?', default='training_ready.csv')
+    parser.add_argument('--gene-context', help="gene context table (e.g. model/gene_context.tsv) to add "
+                                               + ', '.join(CONTEXT_COLUMNS))
+    args = parser.parse_args()
 
-# 2. Extract the Bio-Features
-print("Extracting physical delta features (this may take a minute)...")
-df[['Hydro_Delta', 'Weight_Delta', 'Charge_Delta', 'Position']] = df['ProteinChange'].apply(get_features)
+    print("Loading filtered data...")
+    df = read_table(args.input)
 
-# 3. Drop rows that aren't protein-coding mutations (like row 3 in your head output)
-df_final = df.dropna(subset=['Hydro_Delta'])
+    print("Extracting physical delta features...")
+    df_final = build_training_set(df, GeneContext.load(args.gene_context) if args.gene_context else None)
 
-# 4. Save the final training set
-df_final.to_csv('training_ready.csv', index=False)
-print(f"Success! {len(df_final)} mutations ready for Deep Learning.")
\ No newline at end of file
+    # 4. Save the final training set
+    write_table(df_final, args.output)
+    print(f"Success! {len(df_final)} mutations ready for Deep Learning.")
@@ -0,0 +1,186 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+# XGBoost marks leaves with -1 in left_children
+LEAF = -1
+
+# Node arrays of an exported model, one .npy file each
+ARRAYS = ['feature', 'threshold', 'left', 'right', 'default_left', 'value', 'roots', 'children']
+META_FILE = 'meta.json'
+
+# The native booster saved next to the arrays, for batches too large for NumPy
+BOOSTER_FILE = 'booster.ubj'
+
+
+def _parse_base_score(value):
+    # Newer XGBoost stores it as '[3.036612E-1]', older ones as '3.036612E-1'
+    return float(str(value).strip('[]'))
+
+
+class FlatTreeModel:
+    # A boosted tree ensemble flattened into node arrays (feature, threshold,
+    # children, default direction, leaf value) and evaluated with NumPy. All
+    # trees share one set of arrays; roots holds each tree's first node.
+    # Leaves point to themselves, so every row simply walks max_depth steps.
+
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, base_margin, max_depth,
+                 children=None, source=None, feature_names=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.base_margin = float(base_margin)
+        self.max_depth = int(max_depth)
+        # children[2 * node + go_left]: right child first, then left
+        self.children = np.column_stack([right, left]).ravel() if children is None else children
+        # Fingerprint of the artifact this was exported from
+        self.source = source
+        # The booster's input columns (None if it was trained without names)
+        self.feature_names = feature_names
+
+    @classmethod
+    def from_booster(cls, booster, n_trees=None):
+        dump = json.loads(booster.save_raw(raw_format='json'))
+        learner = dump['learner']
+        if learner['objective']['name'] != 'binary:logistic':
+            raise ValueError(f"unsupported objective {learner['objective']['name']!r}")
+        trees = learner['gradient_booster']['model']['trees'][:n_trees]
+
+        feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for tree in trees:
+            if any(tree['split_type']):
+                raise ValueError("categorical splits are not supported")
+            tree_left = np.asarray(tree['left_children'], dtype=np.int32)
+            tree_right = np.asarray(tree['right_children'], dtype=np.int32)
+            is_leaf = tree_left == LEAF
+            nodes = np.arange(len(tree_left), dtype=np.int32)
+
+            feature.append(np.where(is_leaf, 0, tree['split_indices']).astype(np.int32))
+            threshold.append(np.where(is_leaf, np.inf, tree['split_conditions']).astype(np.float32))
+            left.append(np.where(is_leaf, nodes, tree_left) + offset)
+            right.append(np.where(is_leaf, nodes, tree_right) + offset)
+            default_left.append(np.asarray(tree['default_left'], dtype=bool))
+            value.append(np.where(is_leaf, tree['split_conditions'], 0).astype(np.float32))
+            roots.append(offset)
+            max_depth = max(max_depth, _depth(tree_left, tree_right))
+            offset += len(tree_left)
+
+        base_score = _parse_base_score(learner['learner_model_param']['base_score'])
+        return cls(
+            np.concatenate(feature), np.concatenate(threshold),
+            np.concatenate(left).astype(np.int32), np.concatenate(right).astype(np.int32),
+            np.concatenate(default_left), np.concatenate(value),
+            np.asarray(roots, dtype=np.int32), np.log(base_score / (1 - base_score)), max_depth,
+            feature_names=booster.feature_names,
+        )
+
+    @classmethod
+    def from_xgb(cls, model):
+        return cls.from_booster(model.get_booster(), _kept_trees(model))
+
+    def save(self, path):
+        # A directory of plain .npy files (plus meta.json) rather than an .npz,
+        # so load() can memory map every array instead of copying it
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump({"base_margin": self.base_margin, "max_depth": self.max_depth, "source": self.source,
+                       "feature_names": self.feature_names}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        # Read-only maps: forked uvicorn workers share the pages instead of each holding a copy
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(**arrays, **meta)
+
+    def predict_margin(self, X, block_size=1024):
+        # XGBoost compares float32 feature values against float32 thresholds.
+        # Rows are walked in blocks so the (rows, trees) index arrays stay in cache.
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        n_features = X.shape[1]
+        margin = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), block_size):
+            block = X[start:start + block_size]
+            values = block.ravel()
+            row_base = (np.arange(len(block), dtype=np.int32) * n_features)[:, np.newaxis]
+            nodes = np.broadcast_to(self.roots, (len(block), len(self.roots)))
+            for _ in range(self.max_depth):
+                x = values[row_base + self.feature[nodes]]
+                go_left = (x < self.threshold[nodes]) | (np.isnan(x) & self.default_left[nodes])
+                nodes = self.children[2 * nodes + go_left]
+            margin[start:start + len(block)] = self.value[nodes].sum(axis=1, dtype=np.float64)
+        return margin + self.base_margin
+
+    def predict_proba(self, X):
+        # Same (n, 2) layout as XGBClassifier.predict_proba
+        pathogenic = 1.0 / (1.0 + np.exp(-self.predict_margin(X)))
+        return np.column_stack([1.0 - pathogenic, pathogenic])
+
+
+def _kept_trees(model):
+    # Honour early stopping the same way XGBClassifier.predict_proba does
+    try:
+        return model.best_iteration + 1
+    except AttributeError:
+        return None
+
+
+def native_booster(model):
+    # The XGBClassifier's booster without the trees early stopping discarded
+    n_trees = _kept_trees(model)
+    booster = model.get_booster()
+    return booster[:n_trees] if n_trees is not None else booster
+
+
+def save_booster(model, path):
+    # Written into an export directory: loading it needs xgboost but neither
+    # sklearn nor the pickled wrapper
+    native_booster(model).save_model(os.path.join(path, BOOSTER_FILE))
+
+
+def export_source(path):
+    # Fingerprint of the model an export directory was made from (None if there is none)
+    try:
+        with open(os.path.join(path, META_FILE)) as f:
+            return json.load(f).get("source")
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _depth(left, right):
+    # Longest root-to-leaf path, counted in splits
+    depth = np.zeros(len(left), dtype=np.int32)
+    for node in range(len(left)):
+        if left[node] != LEAF:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+if __name__ == "__main__":
+    import joblib
+
+    from src.predictionCache import artifact_fingerprint
+
+    parser = argparse.ArgumentParser(description="Export a pickled XGBClassifier to flat tree arrays "
+                                                 "(plus its native booster)")
+    parser.add_argument('model', nargs='?', default='model/snp_predictor_model.pkl')
+    parser.add_argument('output', nargs='?', default='model/snp_predictor_model.flat')
+    args = parser.parse_args()
+    model = joblib.load(args.model)
+    flat = FlatTreeModel.from_xgb(model)
+    # The scanner only uses an export whose source matches the model it serves
+    flat.source = artifact_fingerprint(args.model)
+    flat.save(args.output)
+    save_booster(model, args.output)
+    print(f"Flat model saved in '{args.output}/'")
@@ -0,0 +1,155 @@
+import argparse
+import json
+
+import numpy as np
+
+# Per-gene protein context: protein length plus residue windows (domains and
+# mutational hotspots) from a local, precomputed TSV table:
+#
+#   gene  protein_length  kind     start  end  name
+#   TP53  393             domain   102    292  DNA-binding
+#   TP53  393             hotspot  175    175  R175
+#
+# Windows are 1-based and inclusive; a row with no kind only sets the length.
+# The table is loaded once into sorted interval arrays, so a lookup is one
+# np.searchsorted (O(log n)) per variant, done for a whole chunk at a time.
+
+CONTEXT_COLUMNS = ['Protein_Length', 'Relative_Position', 'In_Domain', 'In_Hotspot']
+WINDOW_KINDS = ('domain', 'hotspot')
+
+# Windows of all genes share one sorted axis: gene id in the high bits, residue in the low 32
+_RESIDUE_BITS = 32
+_MAX_RESIDUE = (1 << _RESIDUE_BITS) - 1
+
+# Cache keys of context-aware models carry the gene above substitution_keys'
+# 41 bits (positions up to 2**32, 9 bits of residue pair)
+_KEY_GENE_SHIFT = 41
+
+
+class GeneContext:
+
+    def __init__(self, genes, lengths, windows):
+        # genes: names in id order; lengths: float64 per gene (NaN when unknown);
+        # windows: {kind: (starts, ends, names)} with int64 keys sorted by start
+        self.genes = genes
+        self.lengths = lengths
+        self.windows = windows
+        self._ids = {gene: i for i, gene in enumerate(genes)}
+
+    @classmethod
+    def load(cls, path):
+        genes, lengths, spans = {}, [], {kind: [] for kind in WINDOW_KINDS}
+        with open(path) as f:
+            for line in f:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                gene, length, kind, start, end, name = (line.rstrip('\n').split('\t') + [''] * 6)[:6]
+                gene_id = genes.setdefault(gene, len(genes))
+                if gene_id == len(lengths):
+                    lengths.append(float(length) if length else np.nan)
+                if not kind:
+                    continue
+                if kind not in spans:
+                    raise ValueError(f"{path}: unknown window kind {kind!r} (expected one of {WINDOW_KINDS})")
+                base = gene_id << _RESIDUE_BITS
+                spans[kind].append((base + int(start), base + int(end), name))
+        if not genes:
+            raise ValueError(f"{path}: no genes")
+        windows = {kind: _merge_windows(spans[kind]) for kind in WINDOW_KINDS}
+        return cls(list(genes), np.array(lengths, dtype=np.float64), windows)
+
+    def gene_ids(self, genes):
+        # Table row of every gene name; -1 for genes the table does not cover
+        get = self._ids.get
+        return np.fromiter((get(gene, -1) for gene in genes), dtype=np.int32, count=len(genes))
+
+    def windows_of(self, gene_ids, positions, kinds=WINDOW_KINDS):
+        # Per kind, the index of the window containing each residue (-1 where
+        # there is none). The keys are sorted first: one argsort is shared by
+        # all kinds, and searchsorted over sorted keys walks the windows in
+        # order instead of jumping around the arrays.
+        gene_ids = np.asarray(gene_ids, dtype=np.int64)
+        keys = (gene_ids << _RESIDUE_BITS) | np.clip(positions, 0, _MAX_RESIDUE)
+        order = np.argsort(keys)
+        keys = keys[order]
+        found = []
+        for kind in kinds:
+            starts, ends, _ = self.windows[kind]
+            index = np.full(len(keys), -1, dtype=np.int64)
+            if len(starts):
+                candidate = np.searchsorted(starts, keys, side='right') - 1
+                inside = (candidate >= 0) & (keys <= ends[np.maximum(candidate, 0)])
+                index[order] = np.where(inside, candidate, -1)
+            # Unknown genes (id -1) have negative keys and never match
+            found.append(index)
+        return found
+
+    def features(self, gene_ids, positions):
+        # (n, len(CONTEXT_COLUMNS)) float64; all-NaN (missing) for unknown genes
+        gene_ids = np.asarray(gene_ids)
+        positions = np.asarray(positions, dtype=np.int64)
+        known = gene_ids >= 0
+        features = np.full((len(gene_ids), len(CONTEXT_COLUMNS)), np.nan)
+        lengths = self.lengths[gene_ids[known]]
+        features[known, 0] = lengths
+        features[known, 1] = positions[known] / lengths
+        for column, index in enumerate(self.windows_of(gene_ids[known], positions[known]), 2):
+            features[known, column] = index >= 0
+        return features
+
+    def annotate(self, batch):
+        # Add protein length and domain/hotspot names to the hits of a
+        # VariantBatch; each distinct gene name is looked up once
+        gene_ids = self.gene_ids(batch.strings)[batch.genes]
+        lengths = np.where(gene_ids >= 0, self.lengths[gene_ids], np.nan)
+        names = []
+        for kind, index in zip(WINDOW_KINDS, self.windows_of(gene_ids, batch.positions)):
+            window_names = self.windows[kind][2]
+            names.append([window_names[i] if i >= 0 else '' for i in index.tolist()])
+        return batch.with_context(lengths, *names)
+
+    def describe(self, gene, position):
+        # The context of one residue as a dict, None for unknown genes
+        gene_ids = self.gene_ids([gene])
+        if gene_ids[0] < 0:
+            return None
+        positions = np.array([position], dtype=np.int64)
+        length = self.lengths[gene_ids[0]]
+        context = {"protein_length": None, "relative_position": None}
+        if not np.isnan(length):
+            context = {"protein_length": int(length), "relative_position": position / length}
+        for kind, index in zip(WINDOW_KINDS, self.windows_of(gene_ids, positions)):
+            context[kind] = self.windows[kind][2][index[0]] if index[0] >= 0 else None
+        return context
+
+
+def _merge_windows(spans):
+    # Sorted, non-overlapping windows so searchsorted finds the only candidate;
+    # a window swallowed by an earlier one keeps the earlier name
+    merged = []
+    for start, end, name in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end, name])
+    starts = np.array([window[0] for window in merged], dtype=np.int64)
+    ends = np.array([window[1] for window in merged], dtype=np.int64)
+    return starts, ends, [window[2] for window in merged]
+
+
+def context_keys(keys, gene_ids):
+    # Prediction cache keys for models that take the gene context: the same
+    # substitution scores differently per gene (unknown genes share gene 0)
+    return keys | ((np.asarray(gene_ids, dtype=np.int64) + 1) << _KEY_GENE_SHIFT)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look residues up in a gene context table")
+    parser.add_argument('table', help="TSV: gene, protein_length, kind, start, end, name")
+    parser.add_argument('variant', nargs='+', help="GENE:position, e.g. TP53:175")
+    args = parser.parse_args()
+
+    context = GeneContext.load(args.table)
+    for variant in args.variant:
+        gene, _, position = variant.rpartition(':')
+        print(json.dumps({"gene": gene, "position": int(position), "context": context.describe(gene, int(position))}))
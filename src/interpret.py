@@ -1,24 +1,63 @@
-import pandas as pd
-import xgboost as xgb
+import argparse
+import hashlib
+import os
+
+import numpy as np
 import joblib
 import shap
 import matplotlib.pyplot as plt
+from sklearn.model_selection import train_test_split
+
+from src.explain import feature_names, shap_matrix
+from src.predictionCache import artifact_fingerprint
+from src.storage import read_table
+
+def stratified_sample(df, size):
+    # Keep the pathogenic/benign ratio of the full set in the sample
+    if size >= len(df):
+        return df
+    sample, _ = train_test_split(df, train_size=size, stratify=df['Label'], random_state=42)
+    return sample
+
+def cached_shap(model_path, X, cache_dir, workers):
+    # SHAP matrices are stored under the model artifact hash plus a hash of the
+    # exact rows explained, so plots can be redrawn without recomputing
+    data_hash = hashlib.sha256(np.ascontiguousarray(X, dtype=np.float32).tobytes()).hexdigest()[:16]
+    path = os.path.join(cache_dir, f"shap_{artifact_fingerprint(model_path)}_{data_hash}.npz")
+    if os.path.exists(path):
+        print(f"Loaded cached SHAP values from '{path}'")
+        with np.load(path) as cached:
+            return cached['values'], float(cached['base_value'])
+
+    booster = joblib.load(model_path).get_booster()
+    values, base_value = shap_matrix(booster, X, nthread=workers)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(path, values=values, base_value=base_value)
+    print(f"SHAP values cached in '{path}'")
+    return values, base_value
 
-# 1. Load data and model
-df = pd.read_csv('training_ready.csv')
-model = joblib.load('snp_predictor_model.pkl')
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot SHAP feature impact for the trained model")
+    parser.add_argument('data', nargs='?', default='training_ready.csv', help=".csv or .parquet training set")
+    parser.add_argument('--model', default='snp_predictor_model.pkl')
+    parser.add_argument('--sample-size', type=int, default=20000,
+                        help="rows explained, stratified by label")
+    parser.add_argument('--workers', type=int, default=-1, help="threads for SHAP (-1: all cores)")
+    parser.add_argument('--cache-dir', default='shap_cache')
+    args = parser.parse_args()
 
-features = ['Hydro_Delta', 'Weight_Delta', 'Charge_Delta', 'Position']
-X = df[features]
+    # 1. Load data (the model's feature columns and label only) and take a stratified sample
+    columns = feature_names(joblib.load(args.model).get_booster())
+    df = stratified_sample(read_table(args.data, columns=columns + ['Label']), args.sample_size)
+    X = df[columns]
 
-# 2. Initialize SHAP explainer
-explainer = shap.TreeExplainer(model)
-shap_values = explainer.shap_values(X)
+    # 2. SHAP values for the sample, from the cache when this model/sample was already explained
+    shap_values, _ = cached_shap(args.model, X, args.cache_dir, args.workers)
 
-# 3. Create the Summary Plot
-plt.figure(figsize=(10, 6))
-shap.summary_plot(shap_values, X, show=False)
-plt.title("Biological Feature Impact on Pathogenicity")
-plt.savefig('model_explanation.png')
-print("Explanation plot saved as 'model_explanation.png'")
-plt.show()
+    # 3. Create the Summary Plot
+    plt.figure(figsize=(10, 6))
+    shap.summary_plot(shap_values, X, show=False)
+    plt.title("Biological Feature Impact on Pathogenicity")
+    plt.savefig('model_explanation.png')
+    print("Explanation plot saved as 'model_explanation.png'")
+    plt.show()
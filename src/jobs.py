@@ -0,0 +1,163 @@
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from src.metrics import record_scan
+from src.vcf import VcfStreamParser, iter_file_records
+
+UPLOAD_FILE = 'upload.vcf'
+RESULTS_FILE = 'results.ndjson'
+STATUS_FILE = 'status.json'
+
+# Byte offset of every RESULTS_INDEX_STEP-th results line (int64s, appended
+# as the job runs), so a page is read from the nearest mark instead of from
+# the start of the file
+RESULTS_INDEX_FILE = 'results.idx'
+RESULTS_INDEX_STEP = 1000
+
+
+class JobManager:
+    # Background whole-genome scans. Each job lives in its own directory under
+    # store_dir (the raw upload, results as NDJSON, status as JSON), so finished
+    # results outlive the process. score_records is main.score_records: it
+    # takes a list of (gene, info) records and the file's CSQ/ANN
+    # AnnotationFormat (or None) and returns (hits VariantBatch, scored).
+    # workers=0 runs nothing in the background; call run_job() yourself.
+    # store_dir is created with the first job.
+    # pick_model (e.g. scanner.active_model) pins one model per job: it is
+    # passed as score_records' third argument and its version is recorded.
+
+    def __init__(self, store_dir, score_records, batch_size, workers=1, pick_model=None):
+        self.store_dir = store_dir
+        self.score_records = score_records
+        self.batch_size = batch_size
+        self.pick_model = pick_model
+        self._status = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='job') if workers > 0 else None
+
+    def path(self, job_id, name):
+        return os.path.join(self.store_dir, job_id, name)
+
+    def create(self, filename=None):
+        # Reserve a job directory; the caller writes the upload to path(job_id, UPLOAD_FILE)
+        job_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.store_dir, job_id))
+        self._update(job_id, {
+            "job_id": job_id,
+            "filename": filename,
+            "status": "uploading",
+            "model": None,
+            "lines_parsed": 0,
+            "variants_scored": 0,
+            "pathogenic": 0,
+            "submitted_at": time.time(),
+            "finished_at": None,
+            "error": None,
+        })
+        return job_id
+
+    def submit(self, job_id):
+        self._update(job_id, {"status": "queued"})
+        if self._pool is not None:
+            self._pool.submit(self.run_job, job_id)
+
+    def run_job(self, job_id):
+        model = self.pick_model() if self.pick_model is not None else None
+        pinned = (model,) if model is not None else ()
+        self._update(job_id, {"status": "running", "model": model.version if model is not None else None})
+        progress = {"lines_parsed": 0, "variants_scored": 0, "pathogenic": 0}
+
+        def parsed(lines):
+            progress["lines_parsed"] += lines
+            self._update(job_id, progress)
+
+        try:
+            with open(self.path(job_id, RESULTS_FILE), 'wb') as out, \
+                    open(self.path(job_id, RESULTS_INDEX_FILE), 'wb') as index:
+                parser = VcfStreamParser()
+                written = position = 0
+                for records in iter_file_records(self.path(job_id, UPLOAD_FILE), self.batch_size,
+                                                 on_chunk=parsed, parser=parser):
+                    hits, scored = self.score_records(records, parser.annotation, *pinned)
+                    record_scan(len(records), scored)
+                    marks = array('q')
+                    for hit in hits.iter_dicts():
+                        line = (json.dumps(hit) + '\n').encode()
+                        if written and written % RESULTS_INDEX_STEP == 0:
+                            marks.append(position)
+                        out.write(line)
+                        written += 1
+                        position += len(line)
+                    out.flush()
+                    # Marks only ever point at lines already on disk
+                    if marks:
+                        marks.tofile(index)
+                        index.flush()
+                    progress["variants_scored"] += scored
+                    progress["pathogenic"] += len(hits)
+                    self._update(job_id, progress)
+        except Exception as exc:
+            self._update(job_id, {"status": "failed", "error": str(exc), "finished_at": time.time()})
+            raise
+        self._update(job_id, {"status": "done", "finished_at": time.time()})
+
+    def status(self, job_id):
+        # KeyError for unknown jobs
+        with self._lock:
+            if job_id in self._status:
+                return dict(self._status[job_id])
+        try:
+            with open(self.path(job_id, STATUS_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, NotADirectoryError):
+            raise KeyError(job_id) from None
+
+    def results(self, job_id, offset=0, limit=100):
+        # One page of hits; only finished lines of the NDJSON file are read.
+        # ValueError for a negative offset or limit.
+        if offset < 0 or limit < 0:
+            raise ValueError("offset and limit must not be negative")
+        status = self.status(job_id)
+        path = self.path(job_id, RESULTS_FILE)
+        if not os.path.exists(path):
+            return status, []
+        # Start from the last mark at or before offset (jobs without an index: the start)
+        marks = self._results_marks(job_id)
+        known = min(offset // RESULTS_INDEX_STEP, len(marks))
+        start, skip = (marks[known - 1], offset - known * RESULTS_INDEX_STEP) if known else (0, offset)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            page = [json.loads(line) for line in itertools.islice(f, skip, skip + limit) if line.endswith(b'\n')]
+        return status, page
+
+    def _results_marks(self, job_id):
+        # marks[k] is the byte offset of results line (k + 1) * RESULTS_INDEX_STEP
+        marks = array('q')
+        try:
+            with open(self.path(job_id, RESULTS_INDEX_FILE), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return marks
+        # A mark still being written is left out
+        marks.frombytes(data[:len(data) - len(data) % marks.itemsize])
+        return marks
+
+    def _update(self, job_id, changes):
+        with self._lock:
+            status = self._status.setdefault(job_id, {})
+            status.update(changes)
+            snapshot = dict(status)
+            if status["status"] in ("done", "failed"):
+                # Finished jobs are served from disk from now on
+                del self._status[job_id]
+            # Status is rewritten atomically so readers never see half a file
+            tmp = self.path(job_id, STATUS_FILE + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, self.path(job_id, STATUS_FILE))
@@ -0,0 +1,172 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process metrics for the scan service, rendered in the Prometheus text
+# format by GET /metrics. METRICS=off turns recording (and the endpoint) off.
+# Stages are timed per chunk, not per variant, so the cost is a few
+# perf_counter() calls per 64k rows.
+METRICS_ENABLED = os.environ.get('METRICS', 'on') != 'off'
+
+# Upper bounds in seconds; one chunk takes from well under a millisecond to seconds
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Counter:
+
+    def __init__(self, name, help, fn=None):
+        # fn reads the value from somewhere else (e.g. the prediction cache's own counters)
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._fn = fn
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        value = self._fn() if self._fn is not None else self.value
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {_format(value)}"]
+
+
+class Gauge(Counter):
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    # One set of buckets per value of a single label (the stage name)
+
+    def __init__(self, name, help, label, buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: (list(counts), total, n) for key, (counts, total, n) in self._series.items()}
+        for label_value, (counts, total, n) in sorted(snapshot.items()):
+            labels = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{_format(bound)}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {n}')
+            lines.append(f"{self.name}_sum{{{labels}}} {_format(total)}")
+            lines.append(f"{self.name}_count{{{labels}}} {n}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, fn=None):
+        return self._add(Counter(name, help, fn))
+
+    def gauge(self, name, help, fn=None):
+        return self._add(Gauge(name, help, fn))
+
+    def histogram(self, name, help, label):
+        return self._add(Histogram(name, help, label))
+
+    def render(self):
+        return '\n'.join(line for metric in self.metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+stage_seconds = registry.histogram('snp_stage_seconds', 'Time spent per scan stage and chunk', 'stage')
+variants_parsed = registry.counter('snp_variants_parsed_total', 'VCF data lines parsed')
+variants_scored = registry.counter('snp_variants_scored_total', 'Variants with a scorable protein change')
+rows_rejected = registry.counter('snp_rows_rejected_total', 'VCF data lines without a scorable protein change')
+scans_rejected = registry.counter('snp_scans_rejected_total', 'Uploads turned away with 503')
+model_predict_seconds = registry.histogram('snp_model_predict_seconds', 'Time spent in model evaluation per batch',
+                                           'model')
+
+# The stage breakdown of the request being profiled (None when not profiling)
+_profile = contextvars.ContextVar('scan_profile', default=None)
+
+
+@contextmanager
+def stage(name):
+    # Time a block into the stage histogram and the active request profile
+    profile = _profile.get()
+    if not METRICS_ENABLED and profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if METRICS_ENABLED:
+            stage_seconds.observe(name, elapsed)
+        if profile is not None:
+            profile[name] = profile.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def profiling(enabled=True):
+    # Collect the stages of the current request (and of the executor work it
+    # hands off through in_context) into the yielded dict, plus the total
+    if not enabled:
+        yield None
+        return
+    profile = {}
+    token = _profile.set(profile)
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile['total'] = time.perf_counter() - start
+        _profile.reset(token)
+
+
+def in_context(fn):
+    # Executor threads do not inherit context variables; this carries the
+    # caller's (and so its profile) along. Not usable with process pools.
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def record_scan(parsed, scored):
+    if METRICS_ENABLED:
+        variants_parsed.inc(parsed)
+        variants_scored.inc(scored)
+        rows_rejected.inc(parsed - scored)
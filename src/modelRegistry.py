@@ -0,0 +1,369 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+from src.predictionCache import artifact_fingerprint
+from src.substitutions import FEATURE_COLUMNS
+
+# Versioned model artifacts on local disk, shared by every worker on the machine:
+#
+#   <root>/versions/<version>/snp_predictor_model.pkl
+#   <root>/versions/<version>/snp_predictor_model.flat/   (flat trees + booster.ubj, exported on publish)
+#   <root>/versions/<version>/shap_lookup.npz             (SHAP lookup, built on publish)
+#   <root>/versions/<version>/meta.json                   (fingerprint, published_at)
+#   <root>/active                                         (the serving version)
+#   <root>/candidate                                      ({"version", "mode", "fraction"})
+#
+# Versions never change once published; only the two pointer files move, and
+# they are replaced atomically. Workers poll the pointers and load a new
+# version in the background, then swap one reference: scans already running
+# keep the model they started with.
+
+VERSIONS_DIR = 'versions'
+ACTIVE_FILE = 'active'
+CANDIDATE_FILE = 'candidate'
+MODEL_FILE = 'snp_predictor_model.pkl'
+FLAT_DIR = 'snp_predictor_model.flat'
+SHAP_FILE = 'shap_lookup.npz'
+META_FILE = 'meta.json'
+
+# shadow: the candidate also scores a fraction of requests, off the request path.
+# ab: a fraction of requests is answered by the candidate, and the active model
+# scores them in the background instead.
+CANDIDATE_MODES = ('shadow', 'ab')
+
+# Versions that stopped serving but may still be pinned by running scans
+RETIRED_VERSIONS = 2
+
+
+def _write_atomic(path, text):
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class Routing:
+    # What the registry serves right now; replaced as a whole on every swap so
+    # a request never sees the active model of one version and the candidate of another
+
+    def __init__(self, active, candidate=None, mode=None, fraction=0.0):
+        self.active = active
+        self.candidate = candidate
+        self.mode = mode
+        self.fraction = fraction
+
+
+class ModelRegistry:
+    # load(path, flat_path, version) builds a serving model (scanner.ServingModel).
+    # on_swap callbacks run with the new Routing after every change.
+
+    def __init__(self, root, load, poll_seconds=5.0):
+        self.root = root
+        self.poll_seconds = poll_seconds
+        self.routing = None
+        self.swaps = 0
+        self.error = None
+        self._load = load
+        self._retired = OrderedDict()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    # Publishing (the command line below, or a training pipeline)
+
+    def path(self, version, name=''):
+        return os.path.join(self.root, VERSIONS_DIR, version, name)
+
+    def versions(self):
+        versions_dir = os.path.join(self.root, VERSIONS_DIR)
+        if not os.path.isdir(versions_dir):
+            return []
+        names = [name for name in os.listdir(versions_dir) if not name.startswith('.')]
+        return sorted(names, key=lambda name: (len(name), name))
+
+    def publish(self, model_path, flat=True, shap=True):
+        # Copy a trained model in as the next version (v1, v2, ...). The flat
+        # export and the SHAP lookup are built here too, once, so workers
+        # neither unpickle the model at start nor build the table themselves.
+        staging = os.path.join(self.root, VERSIONS_DIR, f".staging-{os.getpid()}-{time.time_ns()}")
+        os.makedirs(staging)
+        try:
+            shutil.copyfile(model_path, os.path.join(staging, MODEL_FILE))
+            fingerprint = artifact_fingerprint(os.path.join(staging, MODEL_FILE))
+            if flat or shap:
+                import joblib
+                model = joblib.load(os.path.join(staging, MODEL_FILE))
+            if flat:
+                from src.flatTrees import FlatTreeModel, save_booster
+                export = FlatTreeModel.from_xgb(model)
+                export.source = fingerprint
+                export.save(os.path.join(staging, FLAT_DIR))
+                save_booster(model, os.path.join(staging, FLAT_DIR))
+            # The table covers the substitution features only, not the gene context
+            if shap and list(model.get_booster().feature_names or FEATURE_COLUMNS) == FEATURE_COLUMNS:
+                from src.shapLookup import ShapLookup
+                ShapLookup.build(model.get_booster()).save(os.path.join(staging, SHAP_FILE))
+            with open(os.path.join(staging, META_FILE), 'w') as f:
+                json.dump({"fingerprint": fingerprint, "source": os.path.abspath(model_path),
+                           "published_at": time.time()}, f)
+            # Renaming claims the version number; retry if another publisher got there first
+            while True:
+                numbers = [int(name[1:]) for name in self.versions() if name[:1] == 'v' and name[1:].isdigit()]
+                version = f"v{max(numbers, default=0) + 1}"
+                try:
+                    os.rename(staging, self.path(version))
+                    break
+                except OSError:
+                    if not os.path.exists(self.path(version)):
+                        raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        # The first version becomes the active one; later ones serve only
+        # once activated (or as a candidate)
+        self._claim_active(version)
+        return version
+
+    def meta(self, version):
+        with open(self.path(version, META_FILE)) as f:
+            return json.load(f)
+
+    def set_active(self, version):
+        self._check(version)
+        _write_atomic(os.path.join(self.root, ACTIVE_FILE), version + '\n')
+
+    def _claim_active(self, version):
+        # Point active at version unless some version already is, atomically:
+        # link() fails if the pointer exists
+        path = os.path.join(self.root, ACTIVE_FILE)
+        tmp = f"{path}.tmp.{os.getpid()}"
+        with open(tmp, 'w') as f:
+            f.write(version + '\n')
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+
+    def set_candidate(self, version, mode='shadow', fraction=0.1):
+        self._check(version)
+        if mode not in CANDIDATE_MODES:
+            raise ValueError(f"Unknown mode {mode!r} (expected one of {CANDIDATE_MODES})")
+        if not 0.0 <= fraction <= 1.0:
+            raise ValueError("fraction must be between 0 and 1")
+        _write_atomic(os.path.join(self.root, CANDIDATE_FILE),
+                      json.dumps({"version": version, "mode": mode, "fraction": fraction}))
+
+    def clear_candidate(self):
+        try:
+            os.remove(os.path.join(self.root, CANDIDATE_FILE))
+        except FileNotFoundError:
+            pass
+
+    def _check(self, version):
+        if not os.path.exists(self.path(version, MODEL_FILE)):
+            raise ValueError(f"Unknown model version {version!r}")
+
+    def pointers(self):
+        # (active version or None, candidate dict or None) as currently on disk
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE)) as f:
+                active = f.read().strip() or None
+        except FileNotFoundError:
+            active = None
+        try:
+            with open(os.path.join(self.root, CANDIDATE_FILE)) as f:
+                candidate = json.load(f)
+        except FileNotFoundError:
+            candidate = None
+        return active, candidate
+
+    # Serving
+
+    def resolve(self, version):
+        # A loaded model for any published version: the serving ones, a
+        # recently retired one a running scan still pins, or a fresh load
+        routing = self.routing
+        for model in (routing.active, routing.candidate) if routing is not None else ():
+            if model is not None and model.version == version:
+                return model
+        with self._lock:
+            model = self._retired.get(version)
+            if model is not None:
+                return model
+        model = self._load_version(version)
+        self._retire(model)
+        return model
+
+    def refresh(self):
+        # Load whatever the pointers name and swap it in; True if anything changed.
+        # Loading happens before the swap, on the calling (polling) thread.
+        active_version, candidate = self.pointers()
+        current = self.routing
+        if active_version is None:
+            # No pointer (a registry from before publish wrote one): keep what
+            # serves, else the newest version that is not the candidate
+            candidate_version = candidate.get("version") if candidate is not None else None
+            if current is not None:
+                active_version = current.active.version
+            else:
+                versions = [version for version in self.versions() if version != candidate_version]
+                if not versions:
+                    raise FileNotFoundError(f"No model versions in {self.root}; publish one first")
+                active_version = versions[-1]
+        active = self._reuse(current, active_version) or self._load_version(active_version)
+        candidate_model, mode, fraction = None, None, 0.0
+        if candidate is not None and candidate.get("version") not in (None, active_version):
+            candidate_model = self._reuse(current, candidate["version"]) or self._load_version(candidate["version"])
+            mode, fraction = candidate.get("mode", 'shadow'), float(candidate.get("fraction", 0.0))
+
+        if current is not None and (current.active is active and current.candidate is candidate_model
+                                    and current.mode == mode and current.fraction == fraction):
+            return False
+        routing = Routing(active, candidate_model, mode, fraction)
+        self.routing = routing
+        if current is not None:
+            self.swaps += 1
+            for model in (current.active, current.candidate):
+                if model is not None and model not in (active, candidate_model):
+                    self._retire(model)
+        for listener in self._listeners:
+            listener(routing)
+        return True
+
+    def _reuse(self, routing, version):
+        if routing is not None:
+            for model in (routing.active, routing.candidate):
+                if model is not None and model.version == version:
+                    return model
+        with self._lock:
+            return self._retired.pop(version, None)
+
+    def _load_version(self, version):
+        self._check(version)
+        return self._load(self.path(version, MODEL_FILE), self.path(version, FLAT_DIR), version)
+
+    def _retire(self, model):
+        with self._lock:
+            self._retired[model.version] = model
+            while len(self._retired) > RETIRED_VERSIONS:
+                self._retired.popitem(last=False)
+
+    def on_swap(self, callback):
+        self._listeners.append(callback)
+
+    def start_polling(self):
+        # A daemon thread that picks up pointer changes every poll_seconds. A
+        # version that fails to load is reported in self.error and the current
+        # models keep serving.
+        def poll():
+            while True:
+                time.sleep(self.poll_seconds)
+                try:
+                    self.refresh()
+                    self.error = None
+                except Exception as exc:
+                    self.error = f"{type(exc).__name__}: {exc}"
+                    traceback.print_exc()
+
+        threading.Thread(target=poll, name='model-registry', daemon=True).start()
+
+    def pick(self):
+        # (model that answers, model to compare against or None) for one request
+        routing = self.routing
+        if routing.candidate is None or random.random() >= routing.fraction:
+            return routing.active, None
+        if routing.mode == 'ab':
+            return routing.candidate, routing.active
+        return routing.active, routing.candidate
+
+
+class Comparison:
+    # Running agreement between two models on the same variants (shadow / A/B)
+
+    def __init__(self):
+        self.chunks = 0
+        self.variants = 0
+        self.disagreements = 0
+        self.abs_delta = 0.0
+        self.seconds = {}
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def record(self, models, probs, seconds):
+        # models, probs and seconds are pairs: (serving, compared)
+        calls = [p > 0.5 for p in probs]
+        with self._lock:
+            self.chunks += 1
+            self.variants += len(probs[0])
+            self.disagreements += int((calls[0] != calls[1]).sum())
+            self.abs_delta += float(abs(probs[0] - probs[1]).sum())
+            for model, elapsed in zip(models, seconds):
+                self.seconds[model.version] = self.seconds.get(model.version, 0.0) + elapsed
+
+    def skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "chunks": self.chunks,
+                "variants": self.variants,
+                "agreement": 1.0 - self.disagreements / self.variants if self.variants else None,
+                "mean_abs_probability_delta": self.abs_delta / self.variants if self.variants else None,
+                "predict_seconds": dict(self.seconds),
+                "skipped_chunks": self.skipped,
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish and route model versions for the scan service")
+    parser.add_argument('--root', default=os.environ.get('MODEL_REGISTRY_DIR', 'model/registry'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish = commands.add_parser('publish', help="add a trained model (e.g. from src.trainer) as a new version")
+    publish.add_argument('model', nargs='?', default='snp_predictor_model.pkl')
+    publish.add_argument('--activate', action='store_true', help="serve it right away")
+    publish.add_argument('--candidate', choices=CANDIDATE_MODES, help="evaluate it against the active version")
+    publish.add_argument('--fraction', type=float, default=0.1, help="share of requests for --candidate")
+    publish.add_argument('--no-shap', action='store_true', help="skip the SHAP lookup (explanations run live)")
+    activate = commands.add_parser('activate', help="serve a version")
+    activate.add_argument('version')
+    candidate = commands.add_parser('candidate', help="shadow or A/B test a version")
+    candidate.add_argument('version')
+    candidate.add_argument('--mode', choices=CANDIDATE_MODES, default='shadow')
+    candidate.add_argument('--fraction', type=float, default=0.1)
+    commands.add_parser('clear-candidate', help="stop evaluating the candidate")
+    commands.add_parser('list', help="versions and pointers")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root, load=None)
+    try:
+        if args.command == 'publish':
+            version = registry.publish(args.model, shap=not args.no_shap)
+            print(f"Published {args.model} as {version}")
+            if args.activate:
+                registry.set_active(version)
+            elif args.candidate:
+                registry.set_candidate(version, args.candidate, args.fraction)
+        elif args.command == 'activate':
+            registry.set_active(args.version)
+        elif args.command == 'candidate':
+            registry.set_candidate(args.version, args.mode, args.fraction)
+        elif args.command == 'clear-candidate':
+            registry.clear_candidate()
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    active, candidate = registry.pointers()
+    print(json.dumps({
+        "active": active,
+        "candidate": candidate,
+        "versions": {version: registry.meta(version) for version in registry.versions()},
+    }, indent=2))
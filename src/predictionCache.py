@@ -0,0 +1,159 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from src.substitutions import UNKNOWN_CODE
+
+# Keys pack (orig_aa, position, new_aa) into one int64: position in the high
+# bits, the residue pair (21 * 21 combinations) in the low 9 bits
+_PAIR_BITS = 9
+
+
+def substitution_keys(orig_codes, positions, new_codes):
+    pair = np.asarray(orig_codes, dtype=np.int64) * (UNKNOWN_CODE + 1) + np.asarray(new_codes, dtype=np.int64)
+    return (np.asarray(positions, dtype=np.int64) << _PAIR_BITS) | pair
+
+
+def artifact_fingerprint(path):
+    # Content hash of a model file; cached scores are only valid for this exact artifact
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+class SqliteCacheBackend:
+    # Shared second level: a local SQLite file that survives restarts and is
+    # visible to every uvicorn worker on the machine. At most max_rows scores
+    # are kept; the oldest writes go first, so rows of retired model versions
+    # (which are no longer written) age out.
+
+    def __init__(self, path, max_rows=1000000):
+        self.path = path
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Opened on first use in each process (call with self._lock held):
+        # forked scan workers must not share the parent's handle
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS predictions ('
+                'model TEXT NOT NULL, key INTEGER NOT NULL, probability REAL NOT NULL, '
+                'PRIMARY KEY (model, key))'
+            )
+            conn.commit()
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get_many(self, model, keys, batch=500):
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for start in range(0, len(keys), batch):
+                chunk = keys[start:start + batch]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f'SELECT key, probability FROM predictions WHERE model = ? AND key IN ({placeholders})',
+                    [model, *chunk],
+                )
+                found.update(rows)
+        return found
+
+    def put_many(self, model, items):
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                'INSERT OR REPLACE INTO predictions (model, key, probability) VALUES (?, ?, ?)',
+                [(model, key, prob) for key, prob in items],
+            )
+            # Every write gets a rowid above all others, so the newest max_rows
+            # rows are those within max_rows of the largest rowid
+            conn.execute('DELETE FROM predictions WHERE rowid <= (SELECT max(rowid) FROM predictions) - ?',
+                         (self.max_rows,))
+            conn.commit()
+
+
+class PredictionCache:
+    # Bounded in-process LRU of pathogenic probabilities keyed on
+    # substitution_keys, optionally backed by a shared SqliteCacheBackend.
+    # Entries belong to one model fingerprint (each ServingModel has its own cache).
+
+    def __init__(self, maxsize=100000, fingerprint=None, backend=None):
+        self.maxsize = maxsize
+        self.fingerprint = fingerprint
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        # Probabilities for keys (NaN where nothing is cached)
+        probs = np.full(len(keys), np.nan)
+        keys = [int(k) for k in keys]
+        missing = []
+        with self._lock:
+            entries = self._entries
+            for i, key in enumerate(keys):
+                prob = entries.get(key)
+                if prob is None:
+                    missing.append(i)
+                else:
+                    entries.move_to_end(key)
+                    probs[i] = prob
+
+        if missing and self.backend is not None:
+            shared = self.backend.get_many(self.fingerprint, [keys[i] for i in missing])
+            if shared:
+                self._store(shared.items())
+                still_missing = []
+                for i in missing:
+                    prob = shared.get(keys[i])
+                    if prob is None:
+                        still_missing.append(i)
+                    else:
+                        probs[i] = prob
+                missing = still_missing
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+        return probs
+
+    def put_many(self, keys, probs):
+        items = [(int(k), float(p)) for k, p in zip(keys, probs)]
+        self._store(items)
+        if self.backend is not None and items:
+            self.backend.put_many(self.fingerprint, items)
+
+    def _store(self, items):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            entries = self._entries
+            for key, prob in items:
+                entries[key] = prob
+                entries.move_to_end(key)
+            while len(entries) > self.maxsize:
+                entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "model": self.fingerprint,
+            }
@@ -0,0 +1,105 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.smartLoader import filter_chunk, useful_cols
+from src.storage import read_table, write_table
+
+# The store keeps one content hash per AlleleID plus the training rows already built from it
+STATE_FILE = 'alleles'
+TRAINING_FILE = 'training'
+
+def row_hashes(chunk):
+    # One 64-bit content hash per AlleleID over the columns the pipeline uses.
+    # Alleles with several rows in the chunk get their row hashes summed.
+    hashes = pd.util.hash_pandas_object(chunk[useful_cols], index=False)
+    combined = hashes.groupby(chunk['#AlleleID'].to_numpy(), sort=False).sum()
+    return pd.Series(combined.to_numpy(dtype='uint64').view('int64'), index=combined.index)
+
+def load_store(store_dir, suffix):
+    state_path = os.path.join(store_dir, STATE_FILE + suffix)
+    training_path = os.path.join(store_dir, TRAINING_FILE + suffix)
+    if not os.path.exists(state_path):
+        return pd.Series(dtype='Int64'), None
+    state = read_table(state_path)
+    known = pd.Series(state['RowHash'].to_numpy(), index=state['#AlleleID'].to_numpy()).astype('Int64')
+    training = read_table(training_path) if os.path.exists(training_path) else None
+    return known, training
+
+def refresh_clinvar(file_path, store_dir, output_path, chunk_size=100000, suffix='.parquet'):
+    # Only rows that are new or whose hashed columns changed since the last
+    # refresh go through filtering and featurization; everything else is
+    # reused from the store. Only GRCh38 rows can reach the training set, so
+    # that cheap check runs on every row before hashing.
+    os.makedirs(store_dir, exist_ok=True)
+    known, training = load_store(store_dir, suffix)
+
+    seen_ids, seen_hashes, dirty_ids, fresh = [], [], [], []
+
+    print("Scanning for new and changed alleles...")
+    for chunk in pd.read_csv(file_path, sep='\t', compression='gzip',
+                             usecols=useful_cols, chunksize=chunk_size, low_memory=False):
+        chunk = chunk[chunk['Assembly'] == 'GRCh38']
+        hashes = row_hashes(chunk)
+        ids = hashes.index.to_numpy()
+        seen_ids.append(ids)
+        seen_hashes.append(hashes.to_numpy())
+
+        # An allele whose rows span two chunks (e.g. GRCh38 PAR variants) never
+        # matches its stored total here, so its rows are rebuilt from every chunk
+        previous = known.reindex(ids)
+        dirty = ids[previous.isna().to_numpy() | (previous.fillna(0).to_numpy(dtype='int64') != hashes.to_numpy())]
+        if len(dirty):
+            dirty_ids.append(dirty)
+            fresh.append(filter_chunk(chunk[chunk['#AlleleID'].isin(dirty)], featurize=True))
+
+    # One hash per allele over the whole file, in order of first occurrence.
+    # Summing (mod 2**64) makes it independent of where the chunks split.
+    if seen_ids:
+        partial = pd.Series(np.concatenate(seen_hashes).view('uint64'))
+        totals = partial.groupby(np.concatenate(seen_ids), sort=False).sum()
+        seen_ids = totals.index.to_numpy()
+        seen_hashes = totals.to_numpy(dtype='uint64').view('int64')
+    else:
+        seen_ids, seen_hashes = np.array([], dtype='int64'), np.array([], dtype='int64')
+
+    previous = known.reindex(seen_ids)
+    added = previous.isna().to_numpy()
+    changed = ~added & (previous.fillna(0).to_numpy(dtype='int64') != seen_hashes)
+    counts = {'added': int(added.sum()), 'changed': int(changed.sum()), 'unchanged': int((~added & ~changed).sum())}
+    removed = int((~known.index.isin(seen_ids)).sum())
+
+    # Keep stored rows for alleles that are still present and untouched
+    if training is not None:
+        stale = np.concatenate(dirty_ids) if dirty_ids else []
+        reused = training[training['#AlleleID'].isin(seen_ids) & ~training['#AlleleID'].isin(stale)]
+        fresh.insert(0, reused)
+    if fresh:
+        updated = pd.concat(fresh, ignore_index=True)
+        # The order of the current file; rows of one allele follow its first occurrence
+        order = pd.Index(seen_ids).get_indexer(updated['#AlleleID'])
+        updated = updated.iloc[np.argsort(order, kind='stable')].reset_index(drop=True)
+    else:
+        updated = filter_chunk(pd.DataFrame(columns=useful_cols), featurize=True)
+
+    write_table(pd.DataFrame({'#AlleleID': seen_ids, 'RowHash': seen_hashes}),
+                os.path.join(store_dir, STATE_FILE + suffix))
+    write_table(updated, os.path.join(store_dir, TRAINING_FILE + suffix))
+    write_table(updated, output_path)
+
+    print(f"Added {counts['added']}, changed {counts['changed']}, removed {removed}, "
+          f"unchanged {counts['unchanged']} alleles")
+    print(f"Done! {len(updated)} training rows saved to {output_path}")
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the training set from a new ClinVar release")
+    parser.add_argument('input', nargs='?', default='variant_summary.txt.gz')
+    parser.add_argument('output', nargs='?', default='training_ready.csv')
+    parser.add_argument('--store', default='clinvar_store', help="directory holding the processed alleles")
+    parser.add_argument('--store-format', choices=['parquet', 'csv'], default='parquet')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    args = parser.parse_args()
+    refresh_clinvar(args.input, args.store, args.output, args.chunk_size, '.' + args.store_format)
@@ -0,0 +1,317 @@
+import argparse
+import json
+import os
+import re
+import uuid
+
+import numpy as np
+
+from src.annotations import AnnotationFormat
+from src.metrics import record_scan
+from src.scanner import SCAN_BATCH_SIZE, active_model, score_records
+from src.tabix import BgzfReader, TabixIndex, bgzip, index_path, is_bgzf
+from src.variantBatch import VariantBatch
+from src.vcf import VcfStreamParser
+
+# chrom, chrom:pos or chrom:start-end (1-based, inclusive, commas allowed)
+REGION_RE = re.compile(r'^([^:\s]+)(?::([\d,]+)(?:-([\d,]+))?)?$')
+
+# Beyond any contig length; used for whole-contig queries
+CONTIG_END = 1 << 31
+
+# ID column values that name a variant, not a gene: '.', rs/ss IDs (also ';'-joined)
+VARIANT_ID_RE = re.compile(r'^(\.|(rs|ss)\d+(;(rs|ss)\d+)*)$')
+
+VCF_FILE = 'data.vcf.gz'
+GENES_FILE = 'genes.json'
+
+
+def parse_region(text):
+    # (chrom, beg, end) with 0-based half-open coordinates
+    match = REGION_RE.match(text.strip())
+    if not match:
+        raise ValueError(f"Bad region {text!r} (expected chrom, chrom:pos or chrom:start-end)")
+    chrom, start, end = match.groups()
+    if start is None:
+        return chrom, 0, CONTIG_END
+    start = int(start.replace(',', ''))
+    end = int(end.replace(',', '')) if end else start
+    if start < 1 or end < start:
+        raise ValueError(f"Bad region {text!r}")
+    return chrom, start - 1, end
+
+
+def load_gene_regions(path):
+    # BED file (chrom, start, end, name) of gene spans -> {name: [(chrom, beg, end)]}
+    genes = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith(('#', 'track', 'browser')):
+                continue
+            chrom, beg, end, name = line.split('\t')[:4]
+            genes.setdefault(name.strip(), []).append((chrom, int(beg), int(end)))
+    return genes
+
+
+def merge_regions(regions):
+    # Sorted, non-overlapping regions so no record is scored twice
+    merged = []
+    for chrom, beg, end in sorted(regions):
+        if merged and merged[-1][0] == chrom and beg <= merged[-1][2]:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([chrom, beg, end])
+    return [tuple(region) for region in merged]
+
+
+class IndexedVcf:
+    # A BGZF VCF plus its tabix/CSI index. Region scans decompress only the
+    # blocks the index points at. genes maps a gene (named as in the hits: the
+    # CSQ/ANN symbol, else the ID column) to the [chrom, beg, end] spans it covers in this file.
+
+    def __init__(self, path, index, genes=None):
+        self.path = path
+        self.index = index
+        self.genes = genes or {}
+        self._header = None
+
+    def header(self, reader):
+        # The '#' lines, so the parser knows the column layout
+        if self._header is None:
+            lines = []
+            for _, _, line in reader.iter_lines():
+                if not line.startswith(b'#'):
+                    break
+                lines.append(line + b'\n')
+            self._header = b''.join(lines)
+        return self._header
+
+    def scan(self, regions, batch_size=SCAN_BATCH_SIZE, genes=None):
+        # regions ([(chrom, beg, end)]) report every hit. genes ({name: spans},
+        # see resolve_regions) add their spans, where only hits naming one of
+        # the genes count: other genes overlapping the span are left out.
+        # One model serves the whole scan, even if a new version is swapped in meanwhile.
+        model = active_model()
+        wanted = set(genes or ())
+        explicit = {}
+        for chrom, beg, end in regions:
+            explicit.setdefault(self._contig(chrom), []).append((beg, end))
+        spans = [tuple(span) for gene_spans in (genes or {}).values() for span in gene_spans]
+        chunks, parsed, scored = [], 0, 0
+        with BgzfReader(self.path) as reader:
+            parser = VcfStreamParser()
+            parser.feed(self.header(reader))
+            for chrom, beg, end in merge_regions([(self._contig(chrom), beg, end) for chrom, beg, end
+                                                  in list(regions) + spans]):
+                inside = [(b, e) for b, e in explicit.get(chrom, ()) if b < end and e > beg]
+                # Lines within an explicit region, and lines only reached through a gene span
+                pending = {None: [], 'genes': []}
+                for line in self.index.fetch(reader, chrom, beg, end):
+                    group = None
+                    if wanted and not (inside and _overlaps(line, inside)):
+                        group = 'genes'
+                    lines = pending[group]
+                    lines.append(line)
+                    if len(lines) >= batch_size:
+                        parsed, scored = self._score(parser, lines, model, wanted if group else None,
+                                                     chunks, parsed, scored)
+                        pending[group] = []
+                for group, lines in pending.items():
+                    if lines:
+                        parsed, scored = self._score(parser, lines, model, wanted if group else None,
+                                                     chunks, parsed, scored)
+            blocks_read = reader.blocks_read
+        hits = VariantBatch.concat(chunks)
+        return {
+            "status": "success",
+            "model": model.version,
+            "count": len(hits),
+            "results": hits.to_dicts(),
+            "lines_parsed": parsed,
+            "variants_scored": scored,
+            "blocks_read": blocks_read,
+        }
+
+    def _contig(self, chrom):
+        # The file's name for chrom ('chr17' and '17' are the same contig)
+        ref = self.index.contig(chrom)
+        return self.index.contigs[ref] if ref is not None else chrom
+
+    @staticmethod
+    def _score(parser, lines, model, genes, chunks, parsed, scored):
+        # genes: keep only the hits naming one of them (None keeps all)
+        records = parser.feed(b'\n'.join(lines) + b'\n')
+        chunk_hits, chunk_scored = score_records(records, parser.annotation, model)
+        record_scan(len(records), chunk_scored)
+        if genes is not None:
+            keep = [i for i, name in enumerate(chunk_hits.strings) if name in genes]
+            chunk_hits = chunk_hits.take(np.isin(chunk_hits.genes, keep))
+        chunks.append(chunk_hits)
+        return parsed + len(records), scored + chunk_scored
+
+
+def _overlaps(line, regions):
+    # Whether the record on line starts inside one of regions ([(beg, end)], 0-based)
+    beg = int(line.split(b'\t', 2)[1]) - 1
+    return any(start <= beg < end for start, end in regions)
+
+
+def build_index(path):
+    # Index the file and collect each gene's span per contig in the same pass.
+    # Genes are named as in the hits: the CSQ/ANN symbols of VEP/SnpEff files
+    # (the ID column for entries without one), otherwise the ID column.
+    # Variant IDs (rs IDs, '.') in the ID column are not genes and are skipped.
+    spans = {}
+    annotation = None
+    with BgzfReader(path) as reader:
+        for _, _, line in reader.iter_lines():
+            if not line.startswith(b'#'):
+                break
+            if annotation is None and line.startswith(b'##INFO='):
+                annotation = AnnotationFormat.from_header(line.decode())
+
+    def gene_span(chrom, beg, end, fields):
+        gene = fields[2].decode() if len(fields) > 2 else '.'
+        names = annotation.genes(fields[7].decode()) if annotation is not None and len(fields) > 7 else set()
+        if not names or '' in names:
+            names.discard('')
+            if not VARIANT_ID_RE.match(gene):
+                names.add(gene)
+        for name in names:
+            span = spans.get((name, chrom))
+            if span is None:
+                spans[(name, chrom)] = [beg, end]
+            else:
+                span[1] = max(span[1], end)
+
+    index = TabixIndex.build(path, on_record=gene_span)
+    genes = {}
+    for (gene, chrom), (beg, end) in spans.items():
+        genes.setdefault(gene, []).append([chrom, beg, end])
+    return index, genes
+
+
+class IndexedVcfStore:
+    # Indexed VCFs kept on the server, one directory each under store_dir:
+    # the BGZF data, its index and the gene spans found while indexing.
+    # gene_regions (from load_gene_regions) resolves genes the file itself
+    # cannot, e.g. when the index was uploaded rather than built here.
+    # store_dir is created with the first upload.
+
+    def __init__(self, store_dir, gene_regions=None):
+        self.store_dir = store_dir
+        self.gene_regions = gene_regions or {}
+        self._open = {}
+
+    def path(self, vcf_id, name):
+        return os.path.join(self.store_dir, vcf_id, name)
+
+    def create(self):
+        # Reserve a directory; the caller writes the upload (any name) into it
+        vcf_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.store_dir, vcf_id))
+        return vcf_id
+
+    def finish(self, vcf_id, upload_path, index_upload=None):
+        # BGZF-compress the upload if needed, then use the uploaded index or build one
+        data = self.path(vcf_id, VCF_FILE)
+        if is_bgzf(upload_path):
+            os.replace(upload_path, data)
+        else:
+            bgzip(upload_path, data)
+            os.remove(upload_path)
+            # An index of the original bytes does not fit the recompressed file
+            if index_upload is not None:
+                os.remove(index_upload)
+            index_upload = None
+
+        genes = {}
+        if index_upload is not None:
+            index = TabixIndex.load(index_upload)
+            suffix = '.csi' if index_upload.endswith('.csi') else '.tbi'
+            os.replace(index_upload, data + suffix)
+        else:
+            index, genes = build_index(data)
+            index.save(index_path(data))
+        with open(self.path(vcf_id, GENES_FILE), 'w') as f:
+            json.dump(genes, f)
+        self._open[vcf_id] = IndexedVcf(data, index, genes)
+        return {"vcf_id": vcf_id, "contigs": index.contigs, "genes": len(genes),
+                "index": "uploaded" if index_upload is not None else "built"}
+
+    def open(self, vcf_id):
+        # KeyError for unknown ids
+        vcf = self._open.get(vcf_id)
+        if vcf is None:
+            if not re.fullmatch(r'[0-9a-f]{32}', vcf_id):
+                raise KeyError(vcf_id)
+            data = self.path(vcf_id, VCF_FILE)
+            for suffix in ('.tbi', '.csi'):
+                if os.path.exists(data + suffix):
+                    break
+            else:
+                raise KeyError(vcf_id)
+            with open(self.path(vcf_id, GENES_FILE)) as f:
+                genes = json.load(f)
+            vcf = self._open[vcf_id] = IndexedVcf(data, TabixIndex.load(data + suffix), genes)
+        return vcf
+
+    def resolve(self, vcf, regions=(), genes=()):
+        return resolve_regions(regions, genes, vcf.genes, self.gene_regions)
+
+
+def resolve_regions(regions, genes, file_genes, *gene_maps):
+    # Region strings and gene names -> ([(chrom, beg, end)], {gene: [(chrom, beg, end)]}),
+    # the arguments of IndexedVcf.scan; ValueError for bad regions and genes
+    # no map knows. file_genes (IndexedVcf.genes) is tried first: its names
+    # are those of the hits, so its spans go to the gene filter. The other
+    # maps (e.g. a BED of gene spans) are tried in order and their spans are
+    # scanned as plain regions, since the file may name its hits differently
+    # (rs IDs, '.').
+    resolved = [parse_region(region) for region in regions]
+    gene_spans = {}
+    for gene in genes:
+        if gene in file_genes:
+            gene_spans[gene] = [tuple(span) for span in file_genes[gene]]
+            continue
+        for spans in gene_maps:
+            if gene in spans:
+                resolved.extend(tuple(span) for span in spans[gene])
+                break
+        else:
+            raise ValueError(f"Unknown gene {gene!r}")
+    return resolved, gene_spans
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score only the variants of a gene panel or region in an indexed VCF")
+    parser.add_argument('vcf', help="BGZF VCF; a .tbi/.csi next to it is used, otherwise one is built")
+    parser.add_argument('--region', action='append', default=[], help="chrom:start-end, repeatable")
+    parser.add_argument('--gene', action='append', default=[], help="gene name, repeatable")
+    parser.add_argument('--genes-bed', help="BED of gene spans for genes the file does not name")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    if not args.region and not args.gene:
+        parser.error("give at least one --region or --gene")
+    existing = [args.vcf + suffix for suffix in ('.tbi', '.csi') if os.path.exists(args.vcf + suffix)]
+    if existing and not args.gene:
+        index, genes = TabixIndex.load(existing[0]), {}
+    else:
+        # Building also collects the gene spans the file names
+        index, genes = build_index(args.vcf)
+        if not existing:
+            index.save(index_path(args.vcf))
+    try:
+        regions, gene_spans = resolve_regions(args.region, args.gene, genes,
+                                              load_gene_regions(args.genes_bed) if args.genes_bed else {})
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    report = IndexedVcf(args.vcf, index, genes).scan(regions, genes=gene_spans)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f)
+        print(f"{report['lines_parsed']} lines in range, {report['count']} pathogenic -> {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,39 @@
+import asyncio
+
+
+class ScanRejected(Exception):
+    pass
+
+
+class ScanLimiter:
+    # Admission control for scans: at most max_concurrent run at once, up to
+    # max_queued more wait for a slot, and anything beyond that is rejected
+    # straight away so the caller can answer 503 instead of piling up work.
+
+    def __init__(self, max_concurrent, max_queued):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.active = 0
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def acquire(self):
+        if self.active + self.waiting >= self.max_concurrent + self.max_queued:
+            raise ScanRejected(f"{self.active} scans running and {self.waiting} queued")
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
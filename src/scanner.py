@@ -0,0 +1,329 @@
+import numpy as np
+import os
+import threading
+import time
+
+from src.explain import explain_variant
+from src.flatTrees import BOOSTER_FILE, FlatTreeModel, export_source, native_booster
+from src.geneContext import CONTEXT_COLUMNS, GeneContext, context_keys
+from src.metrics import METRICS_ENABLED, model_predict_seconds, stage
+from src.modelRegistry import Comparison, ModelRegistry
+from src.predictionCache import PredictionCache, SqliteCacheBackend, artifact_fingerprint, substitution_keys
+from src.substitutions import (
+    FEATURE_COLUMNS, PROTEIN_CHANGE_RE, UNKNOWN_CODE, features_from_codes,
+    parse_protein_changes, substitution_features,
+)
+from src.variantBatch import VariantBatch
+
+# Model loading and scoring shared by the API (main.py) and the command-line
+# tools. Paths are relative to the repository root.
+
+# Load the artifacts we built
+MODEL_PATH = 'model/snp_predictor_model.pkl'
+
+# The same trees exported as memory-mapped arrays (python -m src.flatTrees),
+# plus the native booster. Workers start from it without unpickling the model
+# or importing xgboost, and forked workers share its pages. Ignored if it was
+# exported from a different model file.
+FLAT_MODEL_PATH = os.environ.get('FLAT_MODEL_PATH', 'model/snp_predictor_model.flat')
+
+# Scoring backend: 'xgboost', 'flat' (NumPy evaluator over the exported trees)
+# or 'auto' (flat for small batches, where the DMatrix overhead dominates; the
+# exported booster for the rest, once a background thread has loaded it)
+MODEL_BACKEND = os.environ.get('MODEL_BACKEND', 'auto')
+FLAT_MAX_ROWS = int(os.environ.get('FLAT_MAX_ROWS', 32))
+
+# Per-gene protein context (length, domain and hotspot windows; see
+# src/geneContext.py), loaded once. Hits in genes it covers get a "context"
+# entry. A model trained with CONTEXT_COLUMNS (python -m src.trainer
+# --gene-context) also takes them as inputs.
+GENE_CONTEXT_PATH = os.environ.get('GENE_CONTEXT_PATH', 'model/gene_context.tsv')
+gene_context = GeneContext.load(GENE_CONTEXT_PATH) if os.path.exists(GENE_CONTEXT_PATH) else None
+
+# Variants are scored in fixed-size batches so one model call covers many rows
+SCAN_BATCH_SIZE = int(os.environ.get('SCAN_BATCH_SIZE', 65536))
+
+# Hotspot mutations recur in nearly every upload, so scores are cached per
+# (orig_aa, position, new_aa). PREDICTION_CACHE_DB adds a SQLite file shared
+# by all workers, holding at most PREDICTION_CACHE_DB_ROWS scores; entries
+# are tied to the model file's content hash.
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 100000))
+PREDICTION_CACHE_DB = os.environ.get('PREDICTION_CACHE_DB')
+PREDICTION_CACHE_DB_ROWS = int(os.environ.get('PREDICTION_CACHE_DB_ROWS', 1000000))
+_cache_backend = (SqliteCacheBackend(PREDICTION_CACHE_DB, PREDICTION_CACHE_DB_ROWS)
+                  if PREDICTION_CACHE_DB else None)
+
+class ServingModel:
+    # One model artifact as served: the flat export (if any), the native
+    # booster (loaded on first use), its input columns and its own prediction
+    # cache. version names it in responses and metrics: the registry version,
+    # or the content hash for a model loaded from MODEL_PATH.
+    # load_seconds covers startup; deferred_load_seconds the booster load
+    # (importing xgboost) started by the first batch larger than FLAT_MAX_ROWS,
+    # which runs in the background while the flat evaluator keeps scoring.
+
+    def __init__(self, path, flat_path=None, version=None):
+        self.path = path
+        self.fingerprint = artifact_fingerprint(path)
+        self.version = version or self.fingerprint
+        self.deferred_load_seconds = 0.0
+        self._model = None
+        self._booster = None
+        self._lock = threading.RLock()
+        self._loader = None
+        self._loader_lock = threading.Lock()
+        # The export directory, if it was made from this model file
+        self._export = flat_path if flat_path is not None and export_source(flat_path) == self.fingerprint else None
+
+        start = time.perf_counter()
+        if MODEL_BACKEND == 'xgboost':
+            self.flat = None
+            self.get_booster()
+            self.deferred_load_seconds = 0.0
+        else:
+            self.flat = self._load_flat()
+        self.load_seconds = time.perf_counter() - start
+
+        self.columns = (self.flat.feature_names if self.flat is not None
+                        else self.get_booster().feature_names) or FEATURE_COLUMNS
+        self.uses_context = list(self.columns) == FEATURE_COLUMNS + CONTEXT_COLUMNS
+        if self.uses_context and gene_context is None:
+            raise RuntimeError(f"{path} was trained with gene context but {GENE_CONTEXT_PATH} does not exist")
+        self.cache = PredictionCache(
+            PREDICTION_CACHE_SIZE,
+            # Scores of a context-aware model also depend on the context table
+            f"{self.fingerprint}-{artifact_fingerprint(GENE_CONTEXT_PATH)}" if self.uses_context else self.fingerprint,
+            _cache_backend,
+        )
+
+    def get_model(self):
+        # The pickled XGBClassifier, unpickled (importing xgboost and sklearn)
+        # on first use; only needed when there is no export
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import joblib
+                    self._model = joblib.load(self.path)
+        return self._model
+
+    def get_booster(self):
+        # The native xgboost Booster (early-stopped trees dropped): read from
+        # the export when there is one, else taken from the pickled model
+        if self._booster is None:
+            with self._lock:
+                if self._booster is None:
+                    start = time.perf_counter()
+                    booster_path = os.path.join(self._export, BOOSTER_FILE) if self._export is not None else None
+                    if booster_path is not None and os.path.exists(booster_path):
+                        import xgboost
+                        self._booster = xgboost.Booster(model_file=booster_path)
+                    else:
+                        self._booster = native_booster(self.get_model())
+                    self.deferred_load_seconds = time.perf_counter() - start
+        return self._booster
+
+    def _booster_ready(self):
+        # Whether the booster is loaded; the first call starts loading it
+        if self._booster is None and self._loader is None:
+            with self._loader_lock:
+                if self._loader is None:
+                    self._loader = threading.Thread(target=self.get_booster, name=f'load-{self.version}',
+                                                    daemon=True)
+                    self._loader.start()
+        return self._booster is not None
+
+    def _load_flat(self):
+        if self._export is not None:
+            return FlatTreeModel.load(self._export)
+        return FlatTreeModel.from_xgb(self.get_model())
+
+    def predict(self, batch):
+        start = time.perf_counter()
+        if self.flat is not None and (MODEL_BACKEND == 'flat' or len(batch) <= FLAT_MAX_ROWS
+                                      or not self._booster_ready()):
+            probs = self.flat.predict_proba(batch)[:, 1]
+        else:
+            # binary:logistic, so these are already probabilities
+            probs = self.get_booster().inplace_predict(np.asarray(batch, dtype=np.float32))
+        if METRICS_ENABLED:
+            model_predict_seconds.observe(self.version, time.perf_counter() - start)
+        return probs
+
+# MODEL_REGISTRY_DIR serves versions from a model registry (see
+# src/modelRegistry.py) instead of MODEL_PATH: pointer changes are picked up
+# every MODEL_POLL_SECONDS once start_polling() has been called, and a
+# candidate version can be shadow or A/B tested against the active one.
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR')
+MODEL_POLL_SECONDS = float(os.environ.get('MODEL_POLL_SECONDS', 5))
+if MODEL_REGISTRY_DIR:
+    model_registry = ModelRegistry(MODEL_REGISTRY_DIR, ServingModel, MODEL_POLL_SECONDS)
+    model_registry.refresh()
+    _static_model = None
+else:
+    model_registry = None
+    _static_model = ServingModel(MODEL_PATH, FLAT_MODEL_PATH)
+
+def active_model():
+    return model_registry.routing.active if model_registry is not None else _static_model
+
+def pick_models():
+    # (model that answers, model to compare against or None) for one request
+    if model_registry is None:
+        return _static_model, None
+    return model_registry.pick()
+
+def resolve_model(model=None):
+    # None -> the active model; a version string (what crosses to worker
+    # processes) -> that version, loaded if this process has not yet
+    if model is None:
+        return active_model()
+    if isinstance(model, str):
+        if model_registry is not None:
+            return model_registry.resolve(model)
+        if model != _static_model.version:
+            raise KeyError(model)
+        return _static_model
+    return model
+
+def get_model():
+    return active_model().get_model()
+
+def extract_features_from_str(mutation_str):
+    # Regex to handle VCF style strings: p.Arg175His or (p.Arg175His)
+    match = PROTEIN_CHANGE_RE.search(mutation_str)
+    if match:
+        orig_aa, pos, new_aa = match.groups()
+        features = substitution_features(orig_aa, pos, new_aa)
+        if features:
+            return features, (orig_aa, new_aa)
+    return None, None
+
+def predict_pathogenic(batch, model=None):
+    return resolve_model(model).predict(batch)
+
+def score_features(features, batch_size=SCAN_BATCH_SIZE, model=None):
+    # Probability of being Pathogenic for every row of the feature matrix
+    model = resolve_model(model)
+    probs = np.empty(len(features), dtype=np.float64)
+    for start in range(0, len(features), batch_size):
+        batch = features[start:start + batch_size]
+        probs[start:start + batch_size] = model.predict(batch)
+    return probs
+
+def model_inputs(orig, positions, new, genes=None, model=None):
+    # Feature matrix and prediction cache keys for columns of residue codes.
+    # genes (names, one per row) are only needed by context-aware models.
+    model = resolve_model(model)
+    features = features_from_codes(orig, positions, new)
+    keys = substitution_keys(orig, positions, new)
+    if model.uses_context:
+        gene_ids = gene_context.gene_ids(genes)
+        features = np.hstack([features, gene_context.features(gene_ids, positions)])
+        keys = context_keys(keys, gene_ids)
+    return features, keys
+
+def score_substitutions(keys, features, model=None):
+    # Each distinct substitution in the batch is looked up once; only cache misses reach the model
+    model = resolve_model(model)
+    unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    with stage('cache'):
+        probs = model.cache.get_many(unique)
+    missing = np.isnan(probs)
+    if missing.any():
+        with stage('predict'):
+            probs[missing] = score_features(features[first[missing]], model=model)
+        with stage('cache'):
+            model.cache.put_many(unique[missing], probs[missing])
+    return probs[inverse]
+
+def extract_changes(records, annotation=None):
+    # The scorable protein changes of one chunk of (gene, info) VCF records:
+    # (rows, genes, transcripts, alleles, orig, positions, new). rows index
+    # records. genes, transcripts and alleles are None unless annotation is the
+    # AnnotationFormat of a CSQ/ANN header, in which case every consequence is
+    # a change and genes holds its symbol (else the ID column). Plain records
+    # name their gene in the ID column; see change_genes.
+    if annotation is None:
+        orig, positions, new = parse_protein_changes([info for _, info in records])
+        rows = np.flatnonzero((orig != UNKNOWN_CODE) & (new != UNKNOWN_CODE))
+        return rows, None, None, None, orig[rows], positions[rows], new[rows]
+    rows, genes, transcripts, alleles, orig, positions, new = annotation.expand(records)
+    genes = [gene or records[row][0] for gene, row in zip(genes, rows.tolist())]
+    return rows, genes, transcripts, alleles, orig, positions, new
+
+def change_genes(records, rows, genes, index=None):
+    # Gene names of the changes at index (all of them if None). Plain records
+    # are only looked up here, so most chunks never build names for every row.
+    if genes is None:
+        rows = rows if index is None else rows[index]
+        return [records[row][0] for row in rows.tolist()]
+    return genes if index is None else [genes[idx] for idx in index]
+
+def score_records(records, annotation=None, model=None):
+    # Score one chunk of (gene, info) VCF records; returns the pathogenic hits
+    # as a VariantBatch and how many records carried a scorable protein change.
+    # With the AnnotationFormat of a CSQ/ANN header every consequence is scored
+    # instead. model pins a ServingModel (or version) for the whole scan.
+    model = resolve_model(model)
+    # 1. Parse every protein change into residue codes and look the deltas up
+    with stage('extract'):
+        rows, genes, transcripts, alleles, orig, positions, new = extract_changes(records, annotation)
+    with stage('featurize'):
+        features, keys = model_inputs(orig, positions, new, change_genes(records, rows, genes)
+                                      if model.uses_context else None, model)
+
+    # 2. Score the whole feature matrix in batches, skipping cached substitutions
+    probs = score_substitutions(keys, features, model)
+
+    # 3. Keep the pathogenic hits as columns; only their genes are interned.
+    # Consequence hits also name the transcript and allele.
+    with stage('respond'):
+        hit = np.flatnonzero(probs > 0.5).tolist()
+        hits = VariantBatch.from_columns(
+            change_genes(records, rows, genes, hit), orig[hit], positions[hit], new[hit], probs[hit],
+            *([[transcripts[idx] for idx in hit], [alleles[idx] for idx in hit]] if transcripts is not None else []),
+        )
+        if gene_context is not None:
+            hits = gene_context.annotate(hits)
+    return hits, len(np.unique(rows))
+
+# Agreement of the serving and compared models on the requests picked for shadow/A-B scoring
+comparison = Comparison()
+
+def compare_models(records, annotation, serving, compared):
+    # Score a chunk with both models, bypassing their caches so the latencies
+    # compare model evaluation, and record agreement on the pathogenic call.
+    # Runs off the request path (main.py hands it to a background executor).
+    models = (resolve_model(serving), resolve_model(compared))
+    rows, genes, _, _, orig, positions, new = extract_changes(records, annotation)
+    if not len(orig):
+        return
+    if any(model.uses_context for model in models):
+        genes = change_genes(records, rows, genes)
+    probs, seconds = [], []
+    for model in models:
+        features, keys = model_inputs(orig, positions, new, genes, model)
+        unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        start = time.perf_counter()
+        probs.append(score_features(features[first], model=model)[inverse])
+        seconds.append(time.perf_counter() - start)
+    comparison.record(models, probs, seconds)
+
+def explain_mutation(mutation_str, gene=None, model=None):
+    # Deltas, probability and per-feature SHAP contributions for one protein
+    # change. gene only matters to context-aware models (missing if None).
+    model = resolve_model(model)
+    features, aa_pair = extract_features_from_str(mutation_str)
+    if features is None:
+        return None
+    row = features
+    if model.uses_context:
+        row = features + gene_context.features(gene_context.gene_ids([gene]), [features[3]])[0].tolist()
+    explanation = explain_variant(model.get_booster(), row)
+    return {
+        "mutation": f"p.{aa_pair[0]}{features[3]}{aa_pair[1]}",
+        "deltas": {"hydro": features[0], "weight": features[1], "charge": int(features[2])},
+        "position": features[3],
+        "probability": float(model.predict(np.array([row]))[0]),
+        **explanation,
+    }
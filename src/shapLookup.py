@@ -0,0 +1,69 @@
+import argparse
+
+import numpy as np
+
+from src.explain import shap_matrix
+from src.flatTrees import FlatTreeModel
+from src.substitutions import AA_CODES, DELTA_TABLE, FEATURE_COLUMNS
+
+POSITION = FEATURE_COLUMNS.index('Position')
+
+
+class ShapLookup:
+    # Precomputed SHAP contributions for every (orig, new) substitution and
+    # every Position bin. Between two consecutive Position split thresholds of
+    # the model nothing changes for a given substitution, so one representative
+    # row per bin covers all positions. A lookup is then one searchsorted plus
+    # an array index instead of a TreeSHAP run.
+
+    def __init__(self, thresholds, contributions, base_value):
+        self.thresholds = thresholds
+        self.contributions = contributions
+        self.base_value = float(base_value)
+
+    @classmethod
+    def build(cls, booster, nthread=None):
+        flat = FlatTreeModel.from_booster(booster)
+        splits = (flat.feature == POSITION) & np.isfinite(flat.threshold)
+        thresholds = np.unique(flat.threshold[splits]).astype(np.float32)
+        # Bin k covers [thresholds[k-1], thresholds[k]); bin 0 everything below the first split
+        representatives = np.concatenate([thresholds[:1] - 1 if len(thresholds) else [0], thresholds])
+
+        n_aa, n_bins = len(AA_CODES), len(representatives)
+        orig, new, bins = np.meshgrid(np.arange(n_aa), np.arange(n_aa), np.arange(n_bins), indexing='ij')
+        X = np.empty((orig.size, len(FEATURE_COLUMNS)), dtype=np.float32)
+        X[:, :3] = DELTA_TABLE[orig.ravel(), new.ravel()]
+        X[:, POSITION] = representatives[bins.ravel()]
+
+        values, base_value = shap_matrix(booster, X, nthread=nthread)
+        return cls(thresholds, values.reshape(n_aa, n_aa, n_bins, len(FEATURE_COLUMNS)), base_value)
+
+    def lookup(self, orig_code, new_code, position):
+        # (contributions, margin) for one substitution at one residue position
+        bin_index = np.searchsorted(self.thresholds, np.float32(position), side='right')
+        contributions = self.contributions[orig_code, new_code, bin_index]
+        return contributions, self.base_value + float(contributions.sum(dtype=np.float64))
+
+    def save(self, path):
+        np.savez(path, thresholds=self.thresholds, contributions=self.contributions, base_value=self.base_value)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays['thresholds'], arrays['contributions'], arrays['base_value'])
+
+
+if __name__ == "__main__":
+    import joblib
+
+    from src.predictionCache import artifact_fingerprint
+
+    parser = argparse.ArgumentParser(description="Precompute the SHAP lookup table for a model")
+    parser.add_argument('model', nargs='?', default='model/snp_predictor_model.pkl')
+    parser.add_argument('--output', help="default: model/shap_lookup_<model hash>.npz")
+    parser.add_argument('--workers', type=int, default=-1, help="threads for SHAP (-1: all cores)")
+    args = parser.parse_args()
+
+    output = args.output or f"model/shap_lookup_{artifact_fingerprint(args.model)}.npz"
+    ShapLookup.build(joblib.load(args.model).get_booster(), nthread=args.workers).save(output)
+    print(f"SHAP lookup saved as '{output}'")
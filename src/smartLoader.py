@@ -1,43 +1,86 @@
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 
-def process_clinvar_large(file_path, output_csv):
-    chunk_size = 100000
-    first_chunk = True
+from src.features import build_training_set
+from src.storage import TableWriter
 
-    useful_cols = [
-        '#AlleleID', 
-        'Type', 
-        'Name', 
-        'GeneSymbol', 
-        'ClinicalSignificance', 
-        'RS# (dbSNP)', 
-        'Assembly'
-    ]
+useful_cols = [
+    '#AlleleID',
+    'Type',
+    'Name',
+    'GeneSymbol',
+    'ClinicalSignificance',
+    'RS# (dbSNP)',
+    'Assembly'
+]
 
-    print("Starting data extraction...")
+# Clear labels only
+valid_labels = ['Pathogenic', 'Benign', 'Likely pathogenic', 'Likely benign']
+
+def filter_chunk(chunk, featurize=False):
+    # 1. Filter for Human Genome Build 38
+    chunk = chunk[chunk['Assembly'] == 'GRCh38']
+
+    # 2. Filter for single-letter changes
+    chunk = chunk[chunk['Type'] == 'single nucleotide variant']
 
-    for chunk in pd.read_csv(file_path, sep='\t', compression='gzip',
-                             usecols=useful_cols, chunksize=chunk_size, low_memory=False):
+    # 3. Filter for clear labels
+    chunk = chunk[chunk['ClinicalSignificance'].isin(valid_labels)]
 
-        # 1. Filter for Human Genome Build 38
-        chunk = chunk[chunk['Assembly'] == 'GRCh38']
+    # Rename 'Name' to 'ProteinChange' so the next scripts work
+    chunk = chunk.rename(columns={'Name': 'ProteinChange'})
+
+    # Optionally go straight to training rows (same output as src/features.py)
+    if featurize:
+        chunk = build_training_set(chunk)
+    return chunk
+
+def process_clinvar_large(file_path, output_csv, chunk_size=100000, workers=1, featurize=False):
+    # output_csv may also be a .parquet path for a columnar, typed output.
+    # workers > 1 hands each chunk to a process pool for filtering (and
+    # featurizing) while this process keeps reading; chunks are still written
+    # in file order. At most 2 * workers chunks are in flight at once.
+    print("Starting data extraction...")
 
-        # 2. Filter for single-letter changes
-        chunk = chunk[chunk['Type'] == 'single nucleotide variant']
+    reader = pd.read_csv(file_path, sep='\t', compression='gzip',
+                         usecols=useful_cols, chunksize=chunk_size, low_memory=False)
 
-        # 3. Filter for clear labels
-        valid_labels = ['Pathogenic', 'Benign', 'Likely pathogenic', 'Likely benign']
-        chunk = chunk[chunk['ClinicalSignificance'].isin(valid_labels)]
+    writer = TableWriter(output_csv)
 
-        # Rename 'Name' to 'ProteinChange' so the next scripts work
-        chunk = chunk.rename(columns={'Name': 'ProteinChange'})
+    def write(chunk):
+        # Append to the CSV / Parquet output
+        writer.write(chunk)
+        print(f"Processed a chunk... rows saved so far: {writer.rows}")
 
-        # Write to CSV
-        chunk.to_csv(output_csv, mode='a', index=False, header=first_chunk)
-        first_chunk = False
-        print(f"Processed a chunk... rows saved so far: {len(chunk)}")
+    if workers <= 1:
+        with writer:
+            for chunk in reader:
+                write(filter_chunk(chunk, featurize))
+    else:
+        with writer, ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for chunk in reader:
+                in_flight.append(pool.submit(filter_chunk, chunk, featurize))
+                if len(in_flight) >= 2 * workers:
+                    write(in_flight.popleft().result())
+            while in_flight:
+                write(in_flight.popleft().result())
 
     print(f"Done! Cleaned data saved to {output_csv}")
 
 if __name__ == "__main__":
-    process_clinvar_large('variant_summary.txt.gz', 'filtered_clinvar.csv')
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Filter the ClinVar variant summary")
+    parser.add_argument('input', nargs='?', default='variant_summary.txt.gz')
+    parser.add_argument('output', nargs='?', default='filtered_clinvar.csv',
+                        help="a .parquet suffix writes columnar output")
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="processes used for filtering (1 keeps everything in this process)")
+    parser.add_argument('--featurize', action='store_true',
+                        help="also extract features and write training rows directly")
+    args = parser.parse_args()
+    process_clinvar_large(args.input, args.output, args.chunk_size, args.workers, args.featurize)
@@ -0,0 +1,92 @@
+import pandas as pd
+
+# Low-cardinality text columns; dictionary-encoded on disk and read back as categoricals
+DICTIONARY_COLUMNS = ['Type', 'GeneSymbol', 'ClinicalSignificance', 'Assembly']
+
+def is_parquet(path):
+    return str(path).endswith(('.parquet', '.pq'))
+
+def _parquet():
+    # pyarrow is only needed for the columnar format
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("Parquet storage needs pyarrow (pip install pyarrow)") from exc
+    return pa, pq
+
+
+class TableWriter:
+    # Appends DataFrame chunks to one table on disk, CSV or Parquet depending
+    # on the file suffix. Parquet keeps the schema of the first non-empty chunk.
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._parquet = is_parquet(path)
+        self._writer = None
+        self._schema = None
+        self._template = None
+
+    def write(self, df):
+        if not self._parquet:
+            df.to_csv(self.path, mode='a', index=False, header=self._template is None)
+            self._template = df.iloc[:0]
+        elif len(df) or self._template is None:
+            self._write_parquet(df)
+        self.rows += len(df)
+
+    def _write_parquet(self, df):
+        pa, pq = _parquet()
+        if self._writer is None:
+            if not len(df):
+                # Empty chunks carry no types; wait for real data
+                self._template = df
+                return
+            self._schema = pa.Schema.from_pandas(df, preserve_index=False)
+            dictionary = [c for c in DICTIONARY_COLUMNS if c in df.columns]
+            self._writer = pq.ParquetWriter(self.path, self._schema,
+                                            use_dictionary=dictionary, compression='zstd')
+        self._writer.write_table(pa.Table.from_pandas(df, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        elif self._parquet and self._template is not None:
+            # Nothing survived filtering: still leave a (typed as best we can) empty table
+            write_table(self._template, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_table(df, path):
+    if not is_parquet(path):
+        df.to_csv(path, index=False)
+        return
+    pa, pq = _parquet()
+    dictionary = [c for c in DICTIONARY_COLUMNS if c in df.columns]
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path,
+                   use_dictionary=dictionary, compression='zstd')
+
+def read_table(path, columns=None):
+    # Only the requested columns are read; Parquet files are memory mapped
+    if not is_parquet(path):
+        return pd.read_csv(path, usecols=columns)
+    pa, pq = _parquet()
+    wanted = columns if columns is not None else pq.read_schema(path).names
+    table = pq.read_table(path, columns=columns, memory_map=True,
+                          read_dictionary=[c for c in DICTIONARY_COLUMNS if c in wanted])
+    return table.to_pandas()
+
+def iter_table_chunks(path, columns=None, chunk_size=100000):
+    # Stream a table as DataFrames of at most chunk_size rows
+    if not is_parquet(path):
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size)
+        return
+    pa, pq = _parquet()
+    for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pandas()
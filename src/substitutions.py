@@ -0,0 +1,78 @@
+import re
+import numpy as np
+
+# Physical properties: [Hydropathy Score, Molecular Weight (Da), Chemical Charge]
+aa_props = {
+    'Ala': [1.8, 89.1, 0],   'Arg': [-4.5, 174.2, 1],  'Asn': [-3.5, 132.1, 0],
+    'Asp': [-3.5, 133.1, -1], 'Cys': [2.5, 121.2, 0],   'Gln': [-3.5, 146.1, 0],
+    'Glu': [-3.5, 147.1, -1], 'Gly': [-0.4, 75.1, 0],   'His': [-3.2, 155.2, 1],
+    'Ile': [4.5, 131.2, 0],   'Leu': [3.8, 131.2, 0],   'Lys': [-3.9, 146.2, 1],
+    'Met': [1.9, 149.2, 0],   'Phe': [2.8, 165.2, 0],   'Pro': [-1.6, 115.1, 0],
+    'Ser': [-0.8, 105.1, 0],   'Thr': [-0.7, 119.1, 0],  'Trp': [-0.9, 204.2, 0],
+    'Tyr': [-1.3, 181.2, 0],   'Val': [4.2, 117.1, 0]
+}
+
+# The model's input columns, in order
+FEATURE_COLUMNS = ['Hydro_Delta', 'Weight_Delta', 'Charge_Delta', 'Position']
+
+# Residue codes 0..19 follow aa_props; UNKNOWN_CODE marks anything else (Ter, Xaa, ...)
+AA_CODES = list(aa_props)
+AA_INDEX = {aa: code for code, aa in enumerate(AA_CODES)}
+UNKNOWN_CODE = len(AA_CODES)
+
+# DELTA_TABLE[orig, new] = props[new] - props[orig] for all 400 substitutions,
+# built once at import. The extra row/column for UNKNOWN_CODE is NaN so
+# unparseable changes fall out of the same lookup.
+_props = np.array([aa_props[aa] for aa in AA_CODES], dtype=np.float64)
+DELTA_TABLE = np.full((UNKNOWN_CODE + 1, UNKNOWN_CODE + 1, 3), np.nan)
+DELTA_TABLE[:UNKNOWN_CODE, :UNKNOWN_CODE] = _props[np.newaxis, :, :] - _props[:, np.newaxis, :]
+
+# Protein change as it appears in VCF INFO strings: p.Arg175His or (p.Arg175His)
+PROTEIN_CHANGE_RE = re.compile(r'p\.([A-Z][a-z]{2})(\d+)([A-Z][a-z]{2})')
+
+
+def substitution_features(orig_aa, pos, new_aa):
+    # [h_delta, w_delta, c_delta, position] for one change, or None for unknown residues
+    orig = AA_INDEX.get(orig_aa)
+    new = AA_INDEX.get(new_aa)
+    if orig is None or new is None:
+        return None
+    return DELTA_TABLE[orig, new].tolist() + [int(pos)]
+
+
+def features_from_codes(orig_codes, positions, new_codes):
+    # Map whole columns of residue codes to an (n, 4) float64 feature matrix.
+    # Rows with an unknown residue come back as all-NaN.
+    orig_codes = np.asarray(orig_codes, dtype=np.intp)
+    new_codes = np.asarray(new_codes, dtype=np.intp)
+    features = np.empty((len(orig_codes), 4), dtype=np.float64)
+    features[:, :3] = DELTA_TABLE[orig_codes, new_codes]
+    features[:, 3] = positions
+    features[np.isnan(features[:, 0]), 3] = np.nan
+    return features
+
+
+def parse_protein_changes(changes, pattern=PROTEIN_CHANGE_RE):
+    # First protein change in every string as (orig_codes, positions, new_codes)
+    search = pattern.search
+    lookup = AA_INDEX.get
+    orig, positions, new = [], [], []
+    for text in changes:
+        match = search(text)
+        if match:
+            orig_aa, pos, new_aa = match.groups()
+            orig.append(lookup(orig_aa, UNKNOWN_CODE))
+            positions.append(int(pos))
+            new.append(lookup(new_aa, UNKNOWN_CODE))
+        else:
+            orig.append(UNKNOWN_CODE)
+            positions.append(0)
+            new.append(UNKNOWN_CODE)
+    return (np.array(orig, dtype=np.uint8),
+            np.array(positions, dtype=np.int64),
+            np.array(new, dtype=np.uint8))
+
+
+def extract_features(changes, pattern=PROTEIN_CHANGE_RE):
+    # Vectorized counterpart of extract_features_from_str / get_features
+    return features_from_codes(*parse_protein_changes(changes, pattern))
@@ -0,0 +1,390 @@
+import argparse
+import gzip
+import io
+import struct
+import zlib
+from collections import OrderedDict
+
+from src.vcf import GZIP_MAGIC
+
+# BGZF: a gzip file made of independent members of at most 64 KiB, each with
+# its compressed size in a 'BC' extra field. A virtual offset is
+# (compressed offset of the member << 16) | offset inside its uncompressed data.
+BGZF_HEADER = struct.Struct('<4BI2BH2BHH')
+BGZF_BLOCK_SIZE = 0xff00
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+# Binning scheme shared by .tbi (fixed) and .csi (min_shift and depth in the header)
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+
+# Header fields of the VCF preset: 1-based columns of CHROM and POS, '#' comments
+VCF_FORMAT, VCF_COL_SEQ, VCF_COL_BEG, VCF_COL_END = 2, 1, 2, 0
+
+
+def reg2bin(beg, end, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+    # Smallest bin holding the 0-based half-open interval [beg, end)
+    end -= 1
+    shift, first = min_shift, ((1 << depth * 3) - 1) // 7
+    for level in range(depth, 0, -1):
+        if beg >> shift == end >> shift:
+            return first + (beg >> shift)
+        shift += 3
+        first -= 1 << (level - 1) * 3
+    return 0
+
+
+def reg2bins(beg, end, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+    # Every bin that may hold records overlapping [beg, end)
+    end -= 1
+    bins = []
+    shift, first = min_shift + depth * 3, 0
+    for level in range(depth + 1):
+        bins.extend(range(first + (beg >> shift), first + (end >> shift) + 1))
+        shift -= 3
+        first += 1 << level * 3
+    return bins
+
+
+def is_bgzf(path):
+    with open(path, 'rb') as f:
+        header = f.read(BGZF_HEADER.size)
+    if len(header) < BGZF_HEADER.size or header[:2] != GZIP_MAGIC:
+        return False
+    fields = BGZF_HEADER.unpack(header)
+    return fields[3] & 4 != 0 and fields[7] == 6 and header[12:14] == b'BC'
+
+
+class BgzfReader:
+    # Random access to a BGZF file by virtual offset, decompressing only the
+    # blocks a range touches. The last few blocks are kept for neighbouring chunks.
+
+    def __init__(self, path, cached_blocks=32):
+        self._file = open(path, 'rb')
+        self._cache = OrderedDict()
+        self._cached_blocks = cached_blocks
+        self.blocks_read = 0
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def block(self, coffset):
+        # (uncompressed data, offset of the next block)
+        cached = self._cache.get(coffset)
+        if cached is not None:
+            self._cache.move_to_end(coffset)
+            return cached
+        self._file.seek(coffset)
+        header = self._file.read(BGZF_HEADER.size)
+        if not header:
+            return b'', coffset
+        if len(header) < BGZF_HEADER.size or header[12:14] != b'BC':
+            raise ValueError(f"not a BGZF block at offset {coffset} (compress with bgzip, not gzip)")
+        size = BGZF_HEADER.unpack(header)[-1] + 1
+        payload = self._file.read(size - BGZF_HEADER.size)
+        data = zlib.decompress(payload[:-8], wbits=-15)
+        self.blocks_read += 1
+        self._cache[coffset] = (data, coffset + size)
+        if len(self._cache) > self._cached_blocks:
+            self._cache.popitem(last=False)
+        return data, coffset + size
+
+    def read(self, start, end):
+        # Uncompressed bytes between two virtual offsets
+        coffset, within = start >> 16, start & 0xffff
+        end_coffset, end_within = end >> 16, end & 0xffff
+        out = []
+        while not (coffset == end_coffset and end_within == 0):
+            data, next_coffset = self.block(coffset)
+            if coffset == end_coffset:
+                out.append(data[within:end_within])
+                break
+            out.append(data[within:])
+            if not data and next_coffset == coffset:
+                break
+            coffset, within = next_coffset, 0
+        return b''.join(out)
+
+    def iter_lines(self):
+        # (start, end virtual offset, line without newline) for the whole file
+        coffset, pending, pending_start = 0, b'', 0
+        while True:
+            data, next_coffset = self.block(coffset)
+            if not data and next_coffset == coffset:
+                break
+            pos = 0
+            while True:
+                newline = data.find(b'\n', pos)
+                if newline < 0:
+                    break
+                line_start = pending_start if pending else (coffset << 16) | pos
+                line_end = (coffset << 16) | (newline + 1)
+                if newline + 1 == len(data):
+                    # Ends with the block: point at the start of the next one instead
+                    line_end = next_coffset << 16
+                yield line_start, line_end, pending + data[pos:newline]
+                pending = b''
+                pos = newline + 1
+            if pos < len(data):
+                if not pending:
+                    pending_start = (coffset << 16) | pos
+                pending += data[pos:]
+            coffset = next_coffset
+        if pending:
+            yield pending_start, coffset << 16, pending
+
+
+class BgzfWriter:
+    # Writes BGZF (what bgzip produces), so a plain or gzipped VCF can be indexed
+
+    def __init__(self, path, level=6):
+        self._file = open(path, 'wb')
+        self._buffer = bytearray()
+        self._level = level
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= BGZF_BLOCK_SIZE:
+            self._write_block(bytes(self._buffer[:BGZF_BLOCK_SIZE]))
+            del self._buffer[:BGZF_BLOCK_SIZE]
+
+    def _write_block(self, data):
+        compressor = zlib.compressobj(self._level, zlib.DEFLATED, -15)
+        payload = compressor.compress(data) + compressor.flush()
+        size = BGZF_HEADER.size + len(payload) + 8
+        self._file.write(BGZF_HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord('B'), ord('C'), 2, size - 1))
+        self._file.write(payload)
+        self._file.write(struct.pack('<II', zlib.crc32(data), len(data)))
+
+    def close(self):
+        if self._buffer:
+            self._write_block(bytes(self._buffer))
+            self._buffer.clear()
+        self._file.write(BGZF_EOF)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def bgzip(source, dest, chunk_size=1 << 20):
+    # Recompress a plain or gzipped file as BGZF
+    with open(source, 'rb') as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    with (gzip.open if compressed else open)(source, 'rb') as src, BgzfWriter(dest) as out:
+        while data := src.read(chunk_size):
+            out.write(data)
+
+
+class TabixIndex:
+    # A tabix (.tbi) or CSI (.csi) index: per contig, the BGZF chunks of every
+    # bin, plus the .tbi linear index (smallest offset per 16 kb window).
+    # Coordinates are 0-based half-open throughout.
+
+    def __init__(self, contigs, bins, linear, min_shift=TBI_MIN_SHIFT, depth=TBI_DEPTH):
+        self.contigs = contigs
+        self.bins = bins
+        self.linear = linear
+        self.min_shift = min_shift
+        self.depth = depth
+        self._ref = {name: i for i, name in enumerate(contigs)}
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, 'rb') as f:
+            data = f.read()
+        magic = data[:4]
+        if magic == b'TBI\x01':
+            return cls._parse_tbi(data)
+        if magic == b'CSI\x01':
+            return cls._parse_csi(data)
+        raise ValueError(f"{path} is neither a .tbi nor a .csi index")
+
+    @classmethod
+    def _parse_tbi(cls, data):
+        stream = io.BytesIO(data[4:])
+        n_ref, _, _, _, _, _, _, l_nm = struct.unpack('<8i', stream.read(32))
+        contigs = stream.read(l_nm).split(b'\0')[:n_ref]
+        pseudo_bin = ((1 << (TBI_DEPTH * 3 + 3)) - 1) // 7 + 1
+        bins, linear = [], []
+        for _ in range(n_ref):
+            ref_bins = {}
+            n_bin, = struct.unpack('<i', stream.read(4))
+            for _ in range(n_bin):
+                bin_id, n_chunk = struct.unpack('<Ii', stream.read(8))
+                chunks = struct.unpack(f'<{2 * n_chunk}Q', stream.read(16 * n_chunk))
+                if bin_id != pseudo_bin:
+                    ref_bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+            n_intv, = struct.unpack('<i', stream.read(4))
+            bins.append(ref_bins)
+            linear.append(list(struct.unpack(f'<{n_intv}Q', stream.read(8 * n_intv))))
+        return cls([name.decode() for name in contigs], bins, linear)
+
+    @classmethod
+    def _parse_csi(cls, data):
+        stream = io.BytesIO(data[4:])
+        min_shift, depth, l_aux = struct.unpack('<3i', stream.read(12))
+        aux = stream.read(l_aux)
+        contigs = []
+        if l_aux >= 28:
+            # tabix keeps its header (and the contig names) in the aux block
+            l_nm, = struct.unpack('<i', aux[24:28])
+            contigs = [name.decode() for name in aux[28:28 + l_nm].split(b'\0') if name]
+        pseudo_bin = ((1 << (depth * 3 + 3)) - 1) // 7 + 1
+        n_ref, = struct.unpack('<i', stream.read(4))
+        bins = []
+        for _ in range(n_ref):
+            ref_bins = {}
+            n_bin, = struct.unpack('<i', stream.read(4))
+            for _ in range(n_bin):
+                bin_id, _, n_chunk = struct.unpack('<IQi', stream.read(16))
+                chunks = struct.unpack(f'<{2 * n_chunk}Q', stream.read(16 * n_chunk))
+                if bin_id != pseudo_bin:
+                    ref_bins[bin_id] = list(zip(chunks[::2], chunks[1::2]))
+            bins.append(ref_bins)
+        if len(contigs) != n_ref:
+            raise ValueError("CSI index without contig names (only tabix-style .csi files are supported)")
+        return cls(contigs, bins, [[] for _ in range(n_ref)], min_shift, depth)
+
+    @classmethod
+    def build(cls, path, on_record=None):
+        # Index a coordinate-sorted BGZF VCF. on_record(chrom, beg, end, fields)
+        # sees every data line, e.g. to collect gene spans in the same pass.
+        contigs, bins, linear = [], [], []
+        last = None
+        with BgzfReader(path) as reader:
+            for start, end, line in reader.iter_lines():
+                if not line or line.startswith(b'#'):
+                    continue
+                fields = line.rstrip(b'\r').split(b'\t', 8)
+                chrom = fields[0].decode()
+                beg = int(fields[1]) - 1
+                rec_end = beg + max(1, len(fields[3]) if len(fields) > 3 else 1)
+                if not contigs or contigs[-1] != chrom:
+                    if chrom in contigs:
+                        raise ValueError(f"{path} is not sorted: {chrom} appears in two places (bcftools sort)")
+                    contigs.append(chrom)
+                    bins.append({})
+                    linear.append([])
+                    last = -1
+                if beg < last:
+                    raise ValueError(f"{path} is not sorted: {chrom}:{beg + 1} follows {chrom}:{last + 1}")
+                last = beg
+
+                chunks = bins[-1].setdefault(reg2bin(beg, rec_end), [])
+                if chunks and chunks[-1][1] == start:
+                    chunks[-1][1] = end
+                else:
+                    chunks.append([start, end])
+                windows = linear[-1]
+                last_window = (rec_end - 1) >> TBI_MIN_SHIFT
+                if len(windows) <= last_window:
+                    windows.extend([None] * (last_window + 1 - len(windows)))
+                for window in range(beg >> TBI_MIN_SHIFT, last_window + 1):
+                    if windows[window] is None:
+                        windows[window] = start
+                if on_record is not None:
+                    on_record(chrom, beg, rec_end, fields)
+
+        for windows in linear:
+            # Empty windows take the offset of the window before them
+            previous = 0
+            for i, offset in enumerate(windows):
+                if offset is None:
+                    windows[i] = previous
+                previous = windows[i]
+        return cls(contigs, [{b: [tuple(c) for c in chunks] for b, chunks in ref.items()} for ref in bins], linear)
+
+    def save(self, path):
+        # Always written as .tbi, which tabix, bcftools and htslib all read
+        names = b''.join(name.encode() + b'\0' for name in self.contigs)
+        out = io.BytesIO()
+        out.write(b'TBI\x01')
+        out.write(struct.pack('<8i', len(self.contigs), VCF_FORMAT, VCF_COL_SEQ, VCF_COL_BEG, VCF_COL_END,
+                              ord('#'), 0, len(names)))
+        out.write(names)
+        for ref_bins, windows in zip(self.bins, self.linear):
+            out.write(struct.pack('<i', len(ref_bins)))
+            for bin_id in sorted(ref_bins):
+                chunks = ref_bins[bin_id]
+                out.write(struct.pack('<Ii', bin_id, len(chunks)))
+                out.write(struct.pack(f'<{2 * len(chunks)}Q', *(offset for chunk in chunks for offset in chunk)))
+            out.write(struct.pack('<i', len(windows)))
+            out.write(struct.pack(f'<{len(windows)}Q', *windows))
+        with BgzfWriter(path) as f:
+            f.write(out.getvalue())
+
+    def contig(self, name):
+        # Accept '17' for 'chr17' and the other way round
+        for candidate in (name, name[3:] if name.startswith('chr') else 'chr' + name):
+            if candidate in self._ref:
+                return self._ref[candidate]
+        return None
+
+    def chunks(self, chrom, beg, end):
+        # Merged (start, end) virtual offset ranges that can hold records overlapping [beg, end)
+        ref = self.contig(chrom)
+        if ref is None:
+            return []
+        windows = self.linear[ref]
+        min_offset = windows[min(beg >> self.min_shift, len(windows) - 1)] if windows else 0
+        ref_bins = self.bins[ref]
+        candidates = sorted(
+            chunk for bin_id in reg2bins(beg, end, self.min_shift, self.depth)
+            for chunk in ref_bins.get(bin_id, ()) if chunk[1] > min_offset
+        )
+        merged = []
+        for start, stop in candidates:
+            start = max(start, min_offset)
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+        return merged
+
+    def fetch(self, reader, chrom, beg, end):
+        # Data lines of records overlapping [beg, end) on chrom
+        ref = self.contig(chrom)
+        if ref is None:
+            return
+        name = self.contigs[ref].encode()
+        for start, stop in self.chunks(chrom, beg, end):
+            for line in reader.read(start, stop).split(b'\n'):
+                if not line:
+                    continue
+                fields = line.split(b'\t', 5)
+                rec_beg = int(fields[1]) - 1
+                if rec_beg >= end:
+                    break
+                if fields[0] == name and rec_beg + max(1, len(fields[3])) > beg:
+                    yield line
+
+
+def index_path(path):
+    return path + '.tbi'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a tabix (.tbi) index for a bgzipped, sorted VCF")
+    parser.add_argument('vcf', help="BGZF-compressed VCF (use --bgzip for plain or gzipped input)")
+    parser.add_argument('--bgzip', metavar='OUTPUT', help="first recompress the input as BGZF into OUTPUT")
+    args = parser.parse_args()
+
+    path = args.vcf
+    if args.bgzip:
+        bgzip(path, args.bgzip)
+        path = args.bgzip
+    elif not is_bgzf(path):
+        parser.error(f"{path} is not BGZF; pass --bgzip OUTPUT.vcf.gz to convert it")
+    index = TabixIndex.build(path)
+    index.save(index_path(path))
+    print(f"Indexed {len(index.contigs)} contigs -> {index_path(path)}")
@@ -1,43 +1,225 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
 import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 import joblib
 
-# 1. Load the data
-df = pd.read_csv('training_ready.csv')
+from src.geneContext import CONTEXT_COLUMNS
+from src.storage import iter_table_chunks, read_table
+from src.substitutions import FEATURE_COLUMNS
+
+# The original hand-picked configuration
+DEFAULT_PARAMS = {'n_estimators': 100, 'max_depth': 6, 'learning_rate': 0.1}
+
+# Search space for --search unless a JSON file of {param: [values]} is given
+DEFAULT_GRID = {
+    'max_depth': [4, 6, 8],
+    'learning_rate': [0.05, 0.1, 0.3],
+    'min_child_weight': [1, 5],
+    'subsample': [0.8, 1.0],
+}
+
+def cached_dmatrix(X, y, data_path, cache_dir):
+    # The training split as a binary DMatrix on disk, rebuilt only when the
+    # training set file or the selected columns (e.g. --gene-context) change.
+    # Trials load it instead of re-converting pandas.
+    stat = os.stat(data_path)
+    key = hashlib.sha256(json.dumps([os.path.abspath(data_path), stat.st_size, stat.st_mtime_ns, len(X),
+                                     list(X.columns), y.name]).encode())
+    path = os.path.join(cache_dir, f"train_{key.hexdigest()[:16]}.buffer")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        xgb.DMatrix(X, label=y).save_binary(path + '.tmp')
+        os.replace(path + '.tmp', path)
+    return path
+
+def run_trial(params, dmatrix_path, nthread, nfold, max_rounds, early_stopping_rounds):
+    # One grid point: k-fold CV with early stopping on logloss
+    dtrain = xgb.DMatrix(dmatrix_path)
+    start = time.perf_counter()
+    history = xgb.cv(
+        {**params, 'objective': 'binary:logistic', 'eval_metric': ['auc', 'logloss'],
+         'nthread': nthread, 'seed': 42},
+        dtrain, num_boost_round=max_rounds, nfold=nfold, stratified=True,
+        early_stopping_rounds=early_stopping_rounds, seed=42,
+    )
+    best = history.iloc[-1]
+    return {
+        **params,
+        'n_estimators': len(history),
+        'cv_logloss': float(best['test-logloss-mean']),
+        'cv_auc': float(best['test-auc-mean']),
+        'seconds': round(time.perf_counter() - start, 2),
+    }
+
+def search(dmatrix_path, grid, workers, threads_per_trial, nfold=5, max_rounds=1000,
+           early_stopping_rounds=20, leaderboard='leaderboard.csv'):
+    # Spread the grid over a process pool; each trial gets its own thread budget
+    trials = [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+    print(f"Searching {len(trials)} configurations on {workers} workers x {threads_per_trial} threads...")
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_trial, params, dmatrix_path, threads_per_trial, nfold,
+                               max_rounds, early_stopping_rounds) for params in trials]
+        for done, future in enumerate(futures, 1):
+            results.append(future.result())
+            print(f"  [{done}/{len(trials)}] {results[-1]}")
+    board = pd.DataFrame(results).sort_values('cv_logloss').reset_index(drop=True)
+    board.to_csv(leaderboard, index=False)
+    print(f"Leaderboard saved as '{leaderboard}'")
+    return board
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def is_test_row(row_numbers, test_fraction=0.2):
+    # Deterministic 80/20 split by row number, so every pass over the file agrees
+    return (row_numbers * 2654435761 % 1000) < test_fraction * 1000
+
+class TrainingChunks(xgb.DataIter):
+    # Feeds XGBoost the training rows of an on-disk training set one chunk at
+    # a time; XGBoost pages its own quantized copy through cache_prefix
+
+    def __init__(self, path, chunk_size, cache_prefix, columns=FEATURE_COLUMNS):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.columns = columns
+        self._chunks = None
+        self._first_row = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self):
+        self._chunks = iter_table_chunks(self.path, self.columns + ['Label'], self.chunk_size)
+        self._first_row = 0
+
+    def next(self, input_data):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        train = ~is_test_row(np.arange(self._first_row, self._first_row + len(chunk)))
+        self._first_row += len(chunk)
+        input_data(data=chunk.loc[train, self.columns], label=chunk.loc[train, 'Label'])
+        return True
+
+def train_external_memory(path, params, chunk_size, cache_dir, columns=FEATURE_COLUMNS):
+    # Out-of-core version of steps 3-6: the feature matrix is never fully in RAM
+    os.makedirs(cache_dir, exist_ok=True)
+    chunks = TrainingChunks(path, chunk_size, os.path.join(cache_dir, 'extmem'), columns)
+    dtrain = xgb.ExtMemQuantileDMatrix(chunks)
+    print(f"Training on {dtrain.num_row()} mutations (external memory, peak RSS {peak_rss_mb():.0f} MB)...")
+
+    train_params = {key: value for key, value in params.items() if key != 'n_estimators'}
+    booster = xgb.train({**train_params, 'objective': 'binary:logistic', 'tree_method': 'hist', 'seed': 42},
+                        dtrain, num_boost_round=params['n_estimators'])
+
+    # Wrap the booster in the same XGBClassifier main.py unpickles
+    model = xgb.XGBClassifier()
+    with tempfile.TemporaryDirectory() as tmp:
+        booster.save_model(os.path.join(tmp, 'model.json'))
+        model.load_model(os.path.join(tmp, 'model.json'))
+
+    # Evaluate on the held-out rows chunk by chunk; only labels and predictions are kept
+    y_test, y_pred = [], []
+    first_row = 0
+    for chunk in iter_table_chunks(path, columns + ['Label'], chunk_size):
+        test = is_test_row(np.arange(first_row, first_row + len(chunk)))
+        first_row += len(chunk)
+        y_test.append(chunk.loc[test, 'Label'].to_numpy(dtype=np.int8))
+        y_pred.append(model.predict(chunk.loc[test, columns]).astype(np.int8))
+    return model, np.concatenate(y_test), np.concatenate(y_pred)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the SNP pathogenicity model")
+    parser.add_argument('data', nargs='?', default='training_ready.csv', help=".csv or .parquet training set")
+    parser.add_argument('--search', action='store_true', help="cross-validated grid search before the final fit")
+    parser.add_argument('--grid', help="JSON file of {param: [values]} (default: DEFAULT_GRID)")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    parser.add_argument('--threads-per-trial', type=int, default=None)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--cache-dir', default='.dmatrix_cache')
+    parser.add_argument('--leaderboard', default='leaderboard.csv')
+    parser.add_argument('--external-memory', action='store_true',
+                        help="stream the training set from disk instead of loading it (no --search)")
+    parser.add_argument('--chunk-size', type=int, default=500000)
+    parser.add_argument('--gene-context', action='store_true',
+                        help="also train on " + ', '.join(CONTEXT_COLUMNS) + " (src/features.py --gene-context)")
+    args = parser.parse_args()
+    columns = FEATURE_COLUMNS + CONTEXT_COLUMNS if args.gene_context else FEATURE_COLUMNS
+
+    if args.external_memory:
+        if args.search:
+            parser.error("--search needs the in-memory path")
+        model, y_test, y_pred = train_external_memory(args.data, DEFAULT_PARAMS, args.chunk_size, args.cache_dir,
+                                                      columns)
+
+        print("\n--- Model Performance ---")
+        print(f"Accuracy: {accuracy_score(y_test, y_pred):.2%}")
+        print("\nClassification Report:")
+        print(classification_report(y_test, y_pred))
+        print(f"Peak RSS: {peak_rss_mb():.0f} MB")
+
+        joblib.dump(model, 'snp_predictor_model.pkl')
+        print("\nModel saved as 'snp_predictor_model.pkl'")
+        raise SystemExit
+
+    # 1. Load the data (only the feature columns and the label)
+    df = read_table(args.data, columns=columns + ['Label'])
+
+    # 2. Select our Features (X) and Target (y)
+    X = df[columns]
+    y = df['Label']
 
-# 2. Select our Features (X) and Target (y)
-features = ['Hydro_Delta', 'Weight_Delta', 'Charge_Delta', 'Position']
-X = df[features]
-y = df['Label']
+    # 3. Split: 80% for training, 20% for testing the model's "intelligence"
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-# 3. Split: 80% for training, 20% for testing the model's "intelligence"
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    params = DEFAULT_PARAMS
+    if args.search:
+        # The search only ever sees the training split; the test split stays untouched
+        grid = DEFAULT_GRID
+        if args.grid:
+            with open(args.grid) as f:
+                grid = json.load(f)
+        threads = args.threads_per_trial or max(1, (os.cpu_count() or 1) // args.workers)
+        dmatrix_path = cached_dmatrix(X_train, y_train, args.data, args.cache_dir)
+        board = search(dmatrix_path, grid, args.workers, threads, args.folds, leaderboard=args.leaderboard)
+        # NumPy scalars back to Python numbers; string params (e.g. grow_policy) are already plain
+        params = {key: board.loc[0, key] for key in [*grid, 'n_estimators']}
+        params = {key: value.item() if hasattr(value, 'item') else value for key, value in params.items()}
+        print(f"Best configuration: {params}")
 
-print(f"Training on {len(X_train)} mutations...")
+    print(f"Training on {len(X_train)} mutations...")
 
-# 4. Initialize XGBoost Classifier
-# We use scale_pos_weight if the data is imbalanced (more benign than pathogenic)
-model = xgb.XGBClassifier(
-    n_estimators=100,
-    max_depth=6,
-    learning_rate=0.1,
-    objective='binary:logistic',
-    random_state=42
-)
+    # 4. Initialize XGBoost Classifier
+    # We use scale_pos_weight if the data is imbalanced (more benign than pathogenic)
+    model = xgb.XGBClassifier(
+        **params,
+        objective='binary:logistic',
+        random_state=42
+    )
 
-# 5. Train!
-model.fit(X_train, y_train)
+    # 5. Train!
+    model.fit(X_train, y_train)
 
-# 6. Evaluate
-y_pred = model.predict(X_test)
+    # 6. Evaluate
+    y_pred = model.predict(X_test)
 
-print("\n--- Model Performance ---")
-print(f"Accuracy: {accuracy_score(y_test, y_pred):.2%}")
-print("\nClassification Report:")
-print(classification_report(y_test, y_pred))
+    print("\n--- Model Performance ---")
+    print(f"Accuracy: {accuracy_score(y_test, y_pred):.2%}")
+    print("\nClassification Report:")
+    print(classification_report(y_test, y_pred))
 
-# 7. Save the model for your Web App later
-joblib.dump(model, 'snp_predictor_model.pkl')
-print("\nModel saved as 'snp_predictor_model.pkl'")
+    # 7. Save the model for your Web App later
+    joblib.dump(model, 'snp_predictor_model.pkl')
+    print("\nModel saved as 'snp_predictor_model.pkl'")
@@ -0,0 +1,164 @@
+import math
+
+import numpy as np
+
+from src.substitutions import AA_CODES, DELTA_TABLE
+
+
+class StringTable:
+    # Interns strings (gene symbols, transcripts, alleles): each distinct value
+    # is stored once and columns refer to it by int32 id
+
+    def __init__(self, values=()):
+        self._ids = {}
+        self.intern(values)
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def values(self):
+        # Insertion order is id order
+        return list(self._ids)
+
+    def intern(self, values):
+        ids = self._ids
+        return np.fromiter((ids.setdefault(value, len(ids)) for value in values), dtype=np.int32)
+
+
+class VariantBatch:
+    # Scored variants as typed columns instead of one dict per hit: residue
+    # codes (uint8), positions (int64), probabilities (float64) and interned
+    # gene ids (int32) into strings. Deltas are not stored; they follow from
+    # the residue pair through DELTA_TABLE. Optional columns: transcripts and
+    # alleles for CSQ/ANN consequences, protein_lengths/domains/hotspots once
+    # a GeneContext has annotated the batch. Scanning, merging and pickling to
+    # worker processes work on the arrays; dicts are built by to_dicts() at the API edge.
+
+    # Columns of ids into strings ('' when unset) and plain value columns
+    STRING_COLUMNS = ('genes', 'transcripts', 'alleles', 'domains', 'hotspots')
+    VALUE_COLUMNS = ('orig', 'positions', 'new', 'probs', 'protein_lengths')
+
+    def __init__(self, strings, genes, orig, positions, new, probs, transcripts=None, alleles=None,
+                 protein_lengths=None, domains=None, hotspots=None):
+        self.strings = strings
+        self.genes = genes
+        self.orig = orig
+        self.positions = positions
+        self.new = new
+        self.probs = probs
+        self.transcripts = transcripts
+        self.alleles = alleles
+        self.protein_lengths = protein_lengths
+        self.domains = domains
+        self.hotspots = hotspots
+
+    @classmethod
+    def from_columns(cls, genes, orig, positions, new, probs, transcripts=None, alleles=None):
+        # genes (and transcripts/alleles) are sequences of str, one per variant
+        table = StringTable()
+        genes = table.intern(genes)
+        if transcripts is not None:
+            transcripts, alleles = table.intern(transcripts), table.intern(alleles)
+        return cls(
+            table.values, genes, np.asarray(orig, dtype=np.uint8), np.asarray(positions, dtype=np.int64),
+            np.asarray(new, dtype=np.uint8), np.asarray(probs, dtype=np.float64), transcripts, alleles,
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls.from_columns([], [], [], [], [])
+
+    def columns(self):
+        # {name: array} of the columns that are set
+        names = self.STRING_COLUMNS + self.VALUE_COLUMNS
+        return {name: getattr(self, name) for name in names if getattr(self, name) is not None}
+
+    def with_context(self, protein_lengths, domains, hotspots):
+        # A copy carrying gene context (see GeneContext.annotate); domains and
+        # hotspots are window names, '' outside any window
+        table = StringTable(self.strings)
+        domains, hotspots = table.intern(domains), table.intern(hotspots)
+        return VariantBatch(table.values, **{
+            **self.columns(), 'protein_lengths': np.asarray(protein_lengths, dtype=np.float64),
+            'domains': domains, 'hotspots': hotspots,
+        })
+
+    @classmethod
+    def concat(cls, batches):
+        # One batch from many (e.g. the chunks of one upload); ids are remapped into a shared table
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        present = set().union(*(batch.columns() for batch in batches))
+        table = StringTable([''])
+        columns = {name: [] for name in present}
+        for batch in batches:
+            remap = table.intern(batch.strings)
+            for name in present:
+                column = getattr(batch, name)
+                if name in cls.STRING_COLUMNS:
+                    # Unset in this chunk: '' (id 0)
+                    column = remap[column] if column is not None else np.zeros(len(batch), dtype=np.int32)
+                elif column is None:
+                    column = np.full(len(batch), np.nan)
+                columns[name].append(column)
+        return cls(table.values, **{name: np.concatenate(parts) for name, parts in columns.items()})
+
+    def __len__(self):
+        return len(self.genes)
+
+    def take(self, index):
+        # The variants at index (positions or a boolean mask); the string table is shared
+        return VariantBatch(self.strings, **{name: column[index] for name, column in self.columns().items()})
+
+    @property
+    def deltas(self):
+        # (n, 3) hydro, weight and charge deltas
+        return DELTA_TABLE[self.orig, self.new]
+
+    @property
+    def nbytes(self):
+        # Memory held by the columns (the string table excluded)
+        return sum(column.nbytes for column in self.columns().values())
+
+    def iter_dicts(self):
+        # The per-variant dicts the API returns, one at a time
+        strings = self.strings
+        columns = [self.orig.tolist(), self.positions.tolist(), self.new.tolist(), self.probs.tolist(),
+                   self.deltas.tolist(), self.genes.tolist()]
+        consequence = self.transcripts is not None
+        context = self.protein_lengths is not None
+        if consequence:
+            columns += [self.transcripts.tolist(), self.alleles.tolist()]
+        if context:
+            columns += [self.protein_lengths.tolist(), self.domains.tolist(), self.hotspots.tolist()]
+        for orig, position, new, prob, (hydro, weight, charge), gene, *extra in zip(*columns):
+            hit = {
+                "mutation": f"p.{AA_CODES[orig]}{position}{AA_CODES[new]}",
+                "probability": prob,
+                "deltas": {
+                    "hydro": hydro,
+                    "weight": weight,
+                    "charge": int(charge)
+                },
+                "position": position,
+                "gene": strings[gene]
+            }
+            if consequence:
+                transcript, allele, *extra = extra
+                hit["transcript"] = strings[transcript]
+                hit["allele"] = strings[allele]
+            # Genes the context table does not cover get no context
+            if context and not math.isnan(extra[0]):
+                length, domain, hotspot = extra
+                hit["context"] = {
+                    "protein_length": int(length),
+                    "relative_position": position / length,
+                    "domain": strings[domain] or None,
+                    "hotspot": strings[hotspot] or None
+                }
+            yield hit
+
+    def to_dicts(self):
+        return list(self.iter_dicts())
@@ -0,0 +1,205 @@
+import asyncio
+import zlib
+
+from src.annotations import ANNOTATION_KEYS, AnnotationFormat
+from src.metrics import in_context, stage
+
+# Bytes pulled from the upload per read
+READ_CHUNK_SIZE = 1 << 20
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+_ANNOTATION_HEADERS = tuple(f'##INFO=<ID={key},' for key in ANNOTATION_KEYS)
+
+# Column layout used when a file has no '#CHROM' header line
+DEFAULT_COLUMNS = ['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO']
+
+
+class CompressedStreamError(ValueError):
+    # A gzip/BGZF input that is corrupt or ends inside a compressed member
+    pass
+
+
+class VcfStreamParser:
+    # Incremental VCF reader: feed it raw bytes (plain, gzip or BGZF) as they
+    # arrive and it hands back (gene, info) pairs for every complete data line.
+    # Only the current chunk and one partial line are ever held in memory.
+    # with_samples=True adds two items: the names of the samples whose
+    # genotype carries a non-reference allele (None for sites-only files), and
+    # for multi-allelic records {allele: names of the samples carrying it}
+    # (None otherwise). Alleles are keyed as written in ALT and, when REF and
+    # every ALT share their first base, also as VEP writes them: without that
+    # base ('-' if nothing is left).
+    # annotation is the AnnotationFormat of a VEP CSQ / SnpEff ANN header, if any.
+    # feed() and close() raise CompressedStreamError for corrupt or truncated
+    # compressed input, so a cut-off upload is never taken for a complete one.
+
+    def __init__(self, with_samples=False):
+        self.with_samples = with_samples
+        self.columns = None
+        self.samples = []
+        self.annotation = None
+        self._id_idx = None
+        self._info_idx = None
+        self._ref_idx = None
+        self._alt_idx = None
+        self._pending = b''
+        self._inflater = None
+        self._member_open = False
+        self._sniffed = False
+
+    def feed(self, data):
+        with stage('decode'):
+            return self._feed(data)
+
+    def _feed(self, data):
+        if not self._sniffed and data:
+            # Decide on the first bytes whether the stream is compressed
+            if data[:2] == GZIP_MAGIC:
+                self._inflater = zlib.decompressobj(wbits=31)
+            self._sniffed = True
+        if self._inflater is not None:
+            data = self._inflate(data)
+        return self._split(data)
+
+    def close(self):
+        # Flush the last line when the file does not end with a newline
+        if self._member_open:
+            raise CompressedStreamError("Truncated gzip/BGZF input: it ends inside a compressed block")
+        tail, self._pending = self._pending, b''
+        return self._parse_lines([tail]) if tail else []
+
+    def _inflate(self, data):
+        # BGZF (and concatenated .gz) files are a series of gzip members, so
+        # start a fresh decompressor whenever the current member ends
+        out = []
+        while data:
+            try:
+                out.append(self._inflater.decompress(data))
+            except zlib.error as exc:
+                raise CompressedStreamError(f"Corrupt gzip/BGZF input: {exc}") from None
+            self._member_open = not self._inflater.eof
+            if self._member_open:
+                break
+            # Zero padding after the last member is not another member
+            data = self._inflater.unused_data.lstrip(b'\x00')
+            self._inflater = zlib.decompressobj(wbits=31)
+        return b''.join(out)
+
+    def _split(self, data):
+        if not data:
+            return []
+        lines = (self._pending + data).split(b'\n')
+        self._pending = lines.pop()
+        return self._parse_lines(lines)
+
+    def _parse_lines(self, lines):
+        records = []
+        for raw in lines:
+            line = raw.decode('utf-8').rstrip('\r')
+            if not line:
+                continue
+            if line.startswith('##'):
+                if self.annotation is None and line.startswith(_ANNOTATION_HEADERS):
+                    self.annotation = AnnotationFormat.from_header(line)
+                continue
+            if line.startswith('#'):
+                self._set_columns(line.split('\t'))
+                continue
+            if self.columns is None:
+                self._set_columns(DEFAULT_COLUMNS)
+            fields = line.split('\t')
+            gene = fields[self._id_idx] if self._id_idx is not None and self._id_idx < len(fields) else 'Unknown'
+            info = fields[self._info_idx] if self._info_idx is not None and self._info_idx < len(fields) else ''
+            if self.with_samples:
+                records.append((gene, info, *self._carriers(fields)))
+            else:
+                records.append((gene, info))
+        return records
+
+    def _set_columns(self, columns):
+        self.columns = columns
+        self._id_idx = columns.index('ID') if 'ID' in columns else None
+        self._info_idx = columns.index('INFO') if 'INFO' in columns else None
+        self._ref_idx = columns.index('REF') if 'REF' in columns else None
+        self._alt_idx = columns.index('ALT') if 'ALT' in columns else None
+        # Genotype columns follow FORMAT
+        self._first_sample = columns.index('FORMAT') + 1 if 'FORMAT' in columns else len(columns)
+        self.samples = columns[self._first_sample:]
+
+    def _carriers(self, fields):
+        if not self.samples:
+            return None, None
+        # GT is the first FORMAT key; anything left after stripping 0, ., / and | is an ALT allele
+        genotypes = [field.split(':', 1)[0] for field in fields[self._first_sample:]]
+        carriers = tuple(name for name, gt in zip(self.samples, genotypes) if gt.strip('0./|'))
+        alts = fields[self._alt_idx].split(',') if self._alt_idx is not None and self._alt_idx < len(fields) else []
+        if len(alts) < 2 or not carriers:
+            return carriers, None
+
+        # Multi-allelic: which samples carry which ALT (by the GT allele index)
+        by_index = {}
+        for name, gt in zip(self.samples, genotypes):
+            for index in set(gt.replace('|', '/').split('/')):
+                if index.isdigit() and 0 < int(index) <= len(alts):
+                    by_index.setdefault(int(index), []).append(name)
+        ref = fields[self._ref_idx] if self._ref_idx is not None else ''
+        trimmed = ref[:1] and all(alt[:1] == ref[:1] for alt in alts)
+        by_allele = {}
+        for index, names in by_index.items():
+            alt = alts[index - 1]
+            by_allele[alt] = tuple(names)
+            if trimmed:
+                by_allele.setdefault(alt[1:] or '-', tuple(names))
+        return carriers, by_allele
+
+
+async def iter_upload_records(upload, batch_size, chunk_size=READ_CHUNK_SIZE, executor=None, with_samples=False,
+                              parser=None):
+    # Read a FastAPI UploadFile chunk by chunk and yield lists of roughly
+    # batch_size (gene, info) records. With an executor, decompression and
+    # line splitting run there instead of on the event loop. Pass a parser to
+    # read what the header declared (e.g. parser.annotation) along the way.
+    parser = parser or VcfStreamParser(with_samples)
+    loop = asyncio.get_running_loop()
+    batch = []
+    while True:
+        with stage('read'):
+            data = await upload.read(chunk_size)
+        if not data:
+            break
+        if executor is None:
+            batch.extend(parser.feed(data))
+        else:
+            batch.extend(await loop.run_in_executor(executor, in_context(parser.feed), data))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    batch.extend(parser.close())
+    if batch:
+        yield batch
+
+
+def iter_file_records(path, batch_size, chunk_size=READ_CHUNK_SIZE, on_chunk=None, with_samples=False, parser=None):
+    # Same as iter_upload_records for a file on disk (plain, .vcf.gz or BGZF).
+    # on_chunk(records_in_chunk) lets callers track progress as bytes are parsed.
+    parser = parser or VcfStreamParser(with_samples)
+    batch = []
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            records = parser.feed(data)
+            if on_chunk is not None:
+                on_chunk(len(records))
+            batch.extend(records)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    tail = parser.close()
+    if on_chunk is not None and tail:
+        on_chunk(len(tail))
+    batch.extend(tail)
+    if batch:
+        yield batch
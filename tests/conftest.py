@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# main.py creates its job and indexed-VCF stores at import; keep them out of the checkout
+_store = tempfile.mkdtemp(prefix='snp-tests-')
+os.environ.setdefault('JOB_DIR', os.path.join(_store, 'jobs'))
+os.environ.setdefault('INDEX_DIR', os.path.join(_store, 'indexed_vcfs'))
+os.environ.setdefault('SHAP_LOOKUP', 'off')
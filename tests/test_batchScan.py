@@ -0,0 +1,30 @@
+from src.batchScan import BatchScan
+from src.vcf import VcfStreamParser
+
+HEADER = (
+    '##fileformat=VCFv4.2\n'
+    '##INFO=<ID=CSQ,Number=.,Type=String,Description="Consequence annotations from Ensembl VEP. '
+    'Format: Allele|Consequence|SYMBOL|Feature|HGVSp">\n'
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\tS2\tS3\n'
+)
+
+# One multi-allelic site: S1 carries A (p.Gly75Arg), S2 carries T (p.Gly75Trp), S3 both
+LINE = ('17\t1000\trs1\tG\tA,T\t.\tPASS\t'
+        'CSQ=A|missense_variant|GENEA|ENST1|ENSP1:p.Gly75Arg,T|missense_variant|GENEA|ENST1|ENSP1:p.Gly75Trp'
+        '\tGT\t0/1\t0|2\t1/2\n')
+
+
+def changes(batch, sample):
+    return sorted(batch._new[variant] for variant in batch.occurrences.get(sample, []))
+
+
+def test_consequences_go_to_the_samples_carrying_their_allele():
+    parser = VcfStreamParser(with_samples=True)
+    records = parser.feed((HEADER + LINE).encode())
+    batch = BatchScan()
+    batch.add_records('multi.vcf', records, parser.annotation)
+
+    arg, trp = batch._new[0], batch._new[1]
+    assert changes(batch, 'S1') == [arg]
+    assert changes(batch, 'S2') == [trp]
+    assert changes(batch, 'S3') == sorted([arg, trp])
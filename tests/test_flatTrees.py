@@ -0,0 +1,45 @@
+import joblib
+import numpy as np
+import pytest
+
+from src.flatTrees import FlatTreeModel, native_booster
+from src.scanner import FLAT_MODEL_PATH, MODEL_PATH
+from src.substitutions import AA_CODES, features_from_codes
+
+
+@pytest.fixture
+def model():
+    return joblib.load(MODEL_PATH)
+
+
+@pytest.fixture(scope='module')
+def features():
+    # Every substitution at a spread of positions, with missing values in each column
+    rng = np.random.default_rng(0)
+    orig = rng.integers(0, len(AA_CODES), 5000).astype(np.int16)
+    new = rng.integers(0, len(AA_CODES), 5000).astype(np.int16)
+    X = features_from_codes(orig, rng.integers(1, 3000, 5000).astype(np.float64), new).astype(np.float32)
+    for column in range(X.shape[1]):
+        X[column::7, column] = np.nan
+    return X
+
+
+def test_flat_matches_predict_proba(model, features):
+    expected = model.predict_proba(features)[:, 1]
+    assert np.abs(FlatTreeModel.from_xgb(model).predict_proba(features)[:, 1] - expected).max() <= 1e-5
+    # The shipped export, and the booster saved with it
+    exported = FlatTreeModel.load(FLAT_MODEL_PATH)
+    assert np.abs(exported.predict_proba(features)[:, 1] - expected).max() <= 1e-5
+    assert np.abs(native_booster(model).inplace_predict(features) - expected).max() <= 1e-6
+
+
+def test_flat_honours_early_stopping(model, features):
+    full = FlatTreeModel.from_xgb(model).predict_proba(features)[:, 1]
+    model.get_booster().set_attr(best_iteration='19')
+    expected = model.predict_proba(features)[:, 1]
+    assert np.abs(full - expected).max() > 1e-3
+
+    flat = FlatTreeModel.from_xgb(model)
+    assert len(flat.roots) == 20
+    assert np.abs(flat.predict_proba(features)[:, 1] - expected).max() <= 1e-5
+    assert np.abs(native_booster(model).inplace_predict(features) - expected).max() <= 1e-6
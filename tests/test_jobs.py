@@ -0,0 +1,70 @@
+import gzip
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from src import jobs as jobs_module
+from src.jobs import RESULTS_FILE, UPLOAD_FILE, JobManager
+from src.scanner import SCAN_BATCH_SIZE, score_records
+from src.vcf import CompressedStreamError
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app)
+
+
+def test_job_results_pages(tmp_path):
+    jobs = JobManager(tmp_path, score_records, SCAN_BATCH_SIZE, workers=0)
+    job_id = jobs.create('t.vcf')
+    with open('test_mutation.vcf', 'rb') as src, open(jobs.path(job_id, UPLOAD_FILE), 'wb') as out:
+        out.write(src.read())
+    jobs.submit(job_id)
+    jobs.run_job(job_id)
+
+    status, page = jobs.results(job_id)
+    assert status["status"] == "done"
+    assert len(page) == status["pathogenic"]
+    assert jobs.results(job_id, offset=len(page))[1] == []
+    with pytest.raises(ValueError):
+        jobs.results(job_id, offset=-1)
+
+
+@pytest.mark.parametrize('query', ['offset=-1', 'limit=-1', 'limit=0', 'limit=10001'])
+def test_job_results_rejects_bad_paging(client, query):
+    job_id = main.job_manager.create('t.vcf')
+    assert client.get(f'/jobs/{job_id}/results?{query}').status_code == 422
+
+
+def test_truncated_upload_fails_the_job(tmp_path):
+    jobs = JobManager(tmp_path, score_records, SCAN_BATCH_SIZE, workers=0)
+    job_id = jobs.create('t.vcf.gz')
+    with open('test_mutation.vcf', 'rb') as src, open(jobs.path(job_id, UPLOAD_FILE), 'wb') as out:
+        out.write(gzip.compress(src.read())[:-10])
+    with pytest.raises(CompressedStreamError):
+        jobs.run_job(job_id)
+    status = jobs.status(job_id)
+    assert status["status"] == "failed" and "Truncated" in status["error"]
+
+
+def test_job_results_pages_from_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs_module, 'RESULTS_INDEX_STEP', 7)
+    jobs = JobManager(tmp_path / 'jobs', score_records, 50, workers=0)
+    assert not (tmp_path / 'jobs').exists()
+    job_id = jobs.create('many.vcf')
+    with open(jobs.path(job_id, UPLOAD_FILE), 'w') as out:
+        out.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        for pos in range(1, 400):
+            for change in ('Gly{}Arg', 'Arg{}His', 'Cys{}Tyr'):
+                out.write(f'17\t{pos}\tGENE\tG\tA\t.\tPASS\tp.{change.format(pos)}\n')
+    jobs.submit(job_id)
+    jobs.run_job(job_id)
+
+    with open(jobs.path(job_id, RESULTS_FILE)) as f:
+        everything = [json.loads(line) for line in f]
+    assert len(everything) > 50
+    assert len(jobs._results_marks(job_id)) == (len(everything) - 1) // 7
+    for offset, limit in [(0, 5), (6, 3), (7, 1), (20, 30), (len(everything) - 2, 10), (len(everything), 5)]:
+        assert jobs.results(job_id, offset, limit)[1] == everything[offset:offset + limit]
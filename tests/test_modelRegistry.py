@@ -0,0 +1,80 @@
+import os
+import shutil
+
+import pytest
+
+from src.modelRegistry import ModelRegistry
+
+MODEL = 'model/snp_predictor_model.pkl'
+
+
+class FakeModel:
+    def __init__(self, path, flat_path, version):
+        self.path = path
+        self.flat_path = flat_path
+        self.version = version
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(str(tmp_path), FakeModel)
+
+
+def test_publish_numbers_after_the_highest_version(registry):
+    assert [registry.publish(MODEL, shap=False) for _ in range(3)] == ['v1', 'v2', 'v3']
+    shutil.rmtree(registry.path('v2'))
+    assert registry.publish(MODEL, flat=False, shap=False) == 'v4'
+    assert registry.versions() == ['v1', 'v3', 'v4']
+    assert registry.meta('v1')['fingerprint'] == registry.meta('v4')['fingerprint']
+
+
+def test_refresh_swaps_and_routes_the_candidate(registry):
+    for _ in range(2):
+        registry.publish(MODEL, flat=False, shap=False)
+    with pytest.raises(ValueError):
+        registry.set_active('v9')
+
+    # The first version published is the active one until another is activated
+    assert registry.refresh()
+    assert registry.routing.active.version == 'v1'
+    assert not registry.refresh()
+
+    swapped = []
+    registry.on_swap(swapped.append)
+    registry.set_candidate('v2', 'shadow', 1.0)
+    assert registry.refresh()
+    old = registry.routing
+    assert (old.active.version, old.candidate.version) == ('v1', 'v2')
+    assert registry.pick() == (old.active, old.candidate)
+    assert swapped == [old] and registry.swaps == 1
+
+    registry.set_candidate('v2', 'ab', 1.0)
+    registry.refresh()
+    # Loaded models are reused, not reloaded
+    assert registry.pick() == (old.candidate, old.active)
+
+    registry.set_active('v2')
+    registry.clear_candidate()
+    registry.refresh()
+    assert registry.routing.active is old.candidate and registry.routing.candidate is None
+    assert registry.pick() == (old.candidate, None)
+    # A scan pinned to the retired version still gets the same model
+    assert registry.resolve('v1') is old.active
+
+
+def test_a_candidate_never_becomes_active(registry):
+    assert registry.publish(MODEL, flat=False, shap=False) == 'v1'
+    registry.refresh()
+    registry.set_candidate(registry.publish(MODEL, flat=False, shap=False), 'shadow', 0.5)
+    assert registry.pointers()[0] == 'v1'
+    registry.refresh()
+    assert (registry.routing.active.version, registry.routing.candidate.version) == ('v1', 'v2')
+
+    # Even without the active pointer (an older registry), neither the
+    # loaded model nor a fresh load switches to the candidate
+    os.remove(os.path.join(registry.root, 'active'))
+    registry.refresh()
+    assert registry.routing.active.version == 'v1'
+    fresh = ModelRegistry(registry.root, FakeModel)
+    fresh.refresh()
+    assert fresh.routing.active.version == 'v1'
@@ -0,0 +1,21 @@
+import numpy as np
+
+from src.predictionCache import PredictionCache, SqliteCacheBackend
+
+
+def test_sqlite_backend_keeps_newest_rows(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / 'cache.db'), max_rows=3)
+    backend.put_many('old', [(1, 0.1), (2, 0.2)])
+    backend.put_many('new', [(1, 0.7), (2, 0.8), (3, 0.9)])
+    assert backend.get_many('old', [1, 2]) == {}
+    assert backend.get_many('new', [1, 2, 3]) == {1: 0.7, 2: 0.8, 3: 0.9}
+
+
+def test_cache_falls_back_to_backend(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / 'cache.db'))
+    PredictionCache(10, 'model', backend).put_many(np.array([5, 6]), np.array([0.25, 0.75]))
+    # A fresh worker with an empty LRU still finds the shared scores
+    cache = PredictionCache(10, 'model', backend)
+    probs = cache.get_many(np.array([5, 6, 7]))
+    np.testing.assert_array_equal(probs[:2], [0.25, 0.75])
+    assert np.isnan(probs[2]) and cache.hits == 2 and cache.misses == 1
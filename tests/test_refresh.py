@@ -0,0 +1,57 @@
+import gzip
+
+import pandas as pd
+
+from src.refresh import refresh_clinvar
+from src.smartLoader import filter_chunk, useful_cols
+
+HEADER = ['#AlleleID', 'Type', 'Name', 'GeneSymbol', 'ClinicalSignificance', 'RS# (dbSNP)', 'Assembly']
+SNV = 'single nucleotide variant'
+
+
+def write_release(path, rows):
+    with gzip.open(path, 'wt') as f:
+        f.write('\t'.join(HEADER) + '\n')
+        for row in rows:
+            f.write('\t'.join(str(value) for value in row) + '\n')
+
+
+def release(significance='Pathogenic'):
+    # Allele 3 has rows far apart (a PAR variant listed once per chromosome),
+    # so with chunk_size=2 they land in different chunks
+    return [
+        (1, SNV, 'NM_000546.6(TP53):c.524G>A (p.Arg175His)', 'TP53', 'Pathogenic', 1, 'GRCh38'),
+        (3, SNV, 'NM_000451.4(SHOX):c.1A>G (p.Met1Val)', 'SHOX', significance, 3, 'GRCh38'),
+        (2, SNV, 'NM_000546.6(TP53):c.743G>A (p.Arg248Gln)', 'TP53', 'Benign', 2, 'GRCh37'),
+        (2, SNV, 'NM_000546.6(TP53):c.743G>A (p.Arg248Gln)', 'TP53', 'Benign', 2, 'GRCh38'),
+        (4, SNV, 'NM_000059.4(BRCA2):c.4585G>A (p.Gly1529Arg)', 'BRCA2', 'Likely benign', 4, 'GRCh38'),
+        (3, SNV, 'NM_000451.4(SHOX):c.1A>G (p.Met1Val)', 'SHOX', significance, 3, 'GRCh38'),
+    ]
+
+
+def full_rebuild(path):
+    return filter_chunk(pd.read_csv(path, sep='\t', compression='gzip', usecols=useful_cols), featurize=True)
+
+
+def normalize(df):
+    # Rows of one allele are grouped at its first occurrence by the refresh
+    return df.sort_values('#AlleleID', kind='stable').reset_index(drop=True)
+
+
+def test_refresh_with_alleles_across_chunks_matches_full_rebuild(tmp_path):
+    old, new = tmp_path / 'old.txt.gz', tmp_path / 'new.txt.gz'
+    write_release(old, release())
+    write_release(new, release(significance='Benign'))
+    store, output = tmp_path / 'store', tmp_path / 'training.csv'
+
+    first = refresh_clinvar(old, store, output, chunk_size=2, suffix='.csv')
+    assert first == {'added': 4, 'changed': 0, 'unchanged': 0}
+    pd.testing.assert_frame_equal(normalize(pd.read_csv(output)), normalize(full_rebuild(old)), check_dtype=False)
+
+    # Unchanged release: allele 3 is counted once and not as changed
+    assert refresh_clinvar(old, store, output, chunk_size=2, suffix='.csv') == {
+        'added': 0, 'changed': 0, 'unchanged': 4}
+
+    second = refresh_clinvar(new, store, output, chunk_size=2, suffix='.csv')
+    assert second == {'added': 0, 'changed': 1, 'unchanged': 3}
+    pd.testing.assert_frame_equal(normalize(pd.read_csv(output)), normalize(full_rebuild(new)), check_dtype=False)
@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from src.regionScan import IndexedVcf, IndexedVcfStore, build_index, load_gene_regions, resolve_regions
+from src.tabix import BgzfReader, bgzip
+
+HEADER = (
+    '##fileformat=VCFv4.2\n'
+    '##INFO=<ID=CSQ,Number=.,Type=String,Description="Consequence annotations from Ensembl VEP. '
+    'Format: Allele|Consequence|SYMBOL|Feature|HGVSp">\n'
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+)
+
+
+def csq(*entries):
+    return 'CSQ=' + ','.join(f'A|missense_variant|{gene}|ENST{i}|ENSP{i}:p.{change}'
+                             for i, (gene, change) in enumerate(entries))
+
+
+# rs IDs in the ID column; genes only in the CSQ SYMBOL. The record at 1005
+# lies in GENEA and in the overlapping GENEB.
+RECORDS = [
+    ('17', 1000, 'rs1', csq(('GENEA', 'Gly75Arg'))),
+    ('17', 1005, 'rs2', csq(('GENEA', 'Gly112Arg'), ('GENEB', 'Gly149Arg'))),
+    ('17', 1010, 'rs3', csq(('GENEA', 'Gly186Arg'))),
+    ('17', 5000, 'rs4', csq(('GENEC', 'Gly223Arg'))),
+    ('17', 900000, 'rs5', csq(('GENEC', 'Gly260Arg'))),
+]
+
+
+@pytest.fixture
+def vcf(tmp_path):
+    plain, path = tmp_path / 'panel.vcf', str(tmp_path / 'panel.vcf.gz')
+    plain.write_text(HEADER + ''.join(f'{chrom}\t{pos}\t{rs}\tG\tA\t.\tPASS\t{info}\n'
+                                      for chrom, pos, rs, info in RECORDS))
+    bgzip(str(plain), path)
+    index, genes = build_index(path)
+    return IndexedVcf(path, index, genes)
+
+
+def test_gene_spans_come_from_the_annotation(vcf):
+    assert vcf.genes == {'GENEA': [['17', 999, 1010]], 'GENEB': [['17', 1004, 1005]],
+                         'GENEC': [['17', 4999, 900000]]}
+
+
+def test_fetch_returns_exactly_the_overlapping_records(vcf):
+    with BgzfReader(vcf.path) as reader:
+        for beg, end in [(0, 1 << 29), (999, 1000), (1000, 1005), (1004, 4999), (5000, 899999), (10 ** 6, 2 * 10 ** 6)]:
+            found = [int(line.split(b'\t')[1]) for line in vcf.index.fetch(reader, '17', beg, end)]
+            assert found == [pos for _, pos, _, _ in RECORDS if beg < pos <= end]
+        assert list(vcf.index.fetch(reader, 'chr17', 999, 1000)) == list(vcf.index.fetch(reader, '17', 999, 1000))
+        assert list(vcf.index.fetch(reader, '13', 0, 1 << 29)) == []
+
+
+def test_gene_scan_returns_only_the_requested_genes(vcf):
+    regions, genes = resolve_regions([], ['GENEA'], vcf.genes)
+    report = vcf.scan(regions, genes=genes)
+    assert sorted(hit['mutation'] for hit in report['results']) == ['p.Gly112Arg', 'p.Gly186Arg', 'p.Gly75Arg']
+    assert {hit['gene'] for hit in report['results']} == {'GENEA'}
+
+
+def test_region_hits_are_not_filtered(vcf):
+    regions, genes = resolve_regions(['17:1005'], ['GENEC'], vcf.genes)
+    report = vcf.scan(regions, genes=genes)
+    assert sorted((hit['gene'], hit['mutation']) for hit in report['results']) == [
+        ('GENEA', 'p.Gly112Arg'), ('GENEB', 'p.Gly149Arg'), ('GENEC', 'p.Gly223Arg'), ('GENEC', 'p.Gly260Arg')]
+    with pytest.raises(ValueError):
+        resolve_regions([], ['NOPE'], vcf.genes)
+
+
+def test_bed_gene_scans_a_file_without_gene_names(tmp_path):
+    # No annotation and only rs IDs / '.' in the ID column: the gene comes from a BED
+    plain, path, bed = tmp_path / 'rs.vcf', str(tmp_path / 'rs.vcf.gz'), tmp_path / 'genes.bed'
+    plain.write_text('##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+                     '17\t1000\trs1\tG\tA\t.\tPASS\tp.Gly75Arg\n'
+                     '17\t1005\t.\tG\tA\t.\tPASS\tp.Gly112Arg\n'
+                     '17\t5000\trs4\tG\tA\t.\tPASS\tp.Gly223Arg\n')
+    bed.write_text('17\t990\t1010\tGENEA\n')
+    bgzip(str(plain), path)
+    index, genes = build_index(path)
+    assert genes == {}
+    vcf = IndexedVcf(path, index, genes)
+
+    regions, gene_spans = resolve_regions([], ['GENEA'], vcf.genes, load_gene_regions(str(bed)))
+    report = vcf.scan(regions, genes=gene_spans)
+    assert sorted(hit['mutation'] for hit in report['results']) == ['p.Gly112Arg', 'p.Gly75Arg']
+    assert report['results'] == vcf.scan(resolve_regions(['17:991-1010'], [], {})[0])['results']
+
+
+def test_store_drops_an_index_of_a_recompressed_upload(tmp_path):
+    store = IndexedVcfStore(str(tmp_path / 'store'))
+    assert not (tmp_path / 'store').exists()
+    vcf_id = store.create()
+    upload, stale = store.path(vcf_id, 'upload'), store.path(vcf_id, 'upload.tbi')
+    with open(upload, 'w') as f:
+        f.write(HEADER + ''.join(f'{chrom}\t{pos}\t{rs}\tG\tA\t.\tPASS\t{info}\n' for chrom, pos, rs, info in RECORDS))
+    with open(stale, 'wb') as f:
+        f.write(b'not an index of the recompressed file')
+
+    assert store.finish(vcf_id, upload, stale)['index'] == 'built'
+    assert sorted(os.listdir(tmp_path / 'store' / vcf_id)) == ['data.vcf.gz', 'data.vcf.gz.tbi', 'genes.json']
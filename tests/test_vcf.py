@@ -0,0 +1,36 @@
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from src.vcf import CompressedStreamError, VcfStreamParser
+
+with open('test_mutation.vcf', 'rb') as f:
+    COMPRESSED = gzip.compress(f.read())
+
+
+def parse(data):
+    parser = VcfStreamParser()
+    return parser.feed(data) + parser.close()
+
+
+def test_concatenated_members_and_padding_parse():
+    assert parse(COMPRESSED + COMPRESSED + b'\x00' * 8) == parse(COMPRESSED) * 2
+
+
+@pytest.mark.parametrize('data', [COMPRESSED[:-10], COMPRESSED[:len(COMPRESSED) // 2],
+                                  COMPRESSED + COMPRESSED[:20], COMPRESSED + b'\x1f\x8bnot gzip'])
+def test_truncated_or_corrupt_input_raises(data):
+    with pytest.raises(CompressedStreamError):
+        parse(data)
+
+
+def test_truncated_upload_is_rejected():
+    client = TestClient(main.app)
+    files = {'file': ('t.vcf.gz', COMPRESSED[:-10])}
+    assert client.post('/scan-vcf', files=files).status_code == 400
+    assert client.post('/scan-batch', files={'files': files['file']}).status_code == 400
+    summary = client.post('/scan-vcf?stream=ndjson', files=files).text.splitlines()[-1]
+    assert '"status": "failed"' in summary
+    assert client.post('/scan-vcf', files={'file': ('t.vcf.gz', COMPRESSED)}).status_code == 200